@@ -0,0 +1,111 @@
+from contextlib import aclosing
+from typing import Callable, Coroutine, Dict, Optional
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from python_multipart.multipart import parse_options_header
+from starlette.datastructures import FormData
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from termcolor import colored
+from ..core.pipeline.uploads import SPOOL_MAX_SIZE
+
+class UploadSizeLimitMiddleware:
+    """
+    Reject request bodies larger than the limit of their path while they are
+    still being received, instead of after the whole upload is parsed. Limits
+    apply to a path and everything below it, the longest matching path wins.
+    Requests announcing a larger Content-Length are rejected before reading the body.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    def limit_for(self, path: str) -> Optional[int]:
+        """Get the body size limit of the longest configured path that contains path"""
+        matches = [prefix for prefix in self.limits if path == prefix or path.startswith(prefix.rstrip("/") + "/")]
+        return self.limits[max(matches, key=len)] if matches else None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        max_body_size = self.limit_for(scope["path"]) if scope["type"] == "http" else None
+        if max_body_size is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_body_size:
+            await self._reject(scope, receive, send, max_body_size)
+            return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_size:
+                    exceeded = True
+                    raise ValueError("Request body too large")
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            # Replace the error response of the aborted body parser with a 413
+            if exceeded:
+                return
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not exceeded:
+                raise
+        if exceeded and not response_started:
+            await self._reject(scope, receive, send, max_body_size)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send, max_body_size: int):
+        print(colored(f"Rejected upload larger than {max_body_size} bytes on {scope['path']}", "red"))
+        response = PlainTextResponse("Request body too large", status_code=413)
+        await response(scope, receive, send)
+
+class UploadParser(MultiPartParser):
+    """Multipart parser whose uploaded files stay in memory up to SPOOL_MAX_SIZE"""
+
+    spool_max_size = SPOOL_MAX_SIZE
+
+class UploadRequest(Request):
+    """
+    Request that parses multipart bodies with UploadParser. spool_upload takes
+    over the file the parser spooled instead of copying it, so the spool
+    threshold is set here, for the upload routes only
+    """
+
+    async def _get_form(self, *, max_files: float = 1000, max_fields: float = 1000,
+                        max_part_size: int = 1024 * 1024) -> FormData:
+        content_type, _ = parse_options_header(self.headers.get("Content-Type"))
+        if self._form is None and content_type == b"multipart/form-data":
+            try:
+                async with aclosing(self.stream()) as stream:
+                    parser = UploadParser(self.headers, stream, max_files=max_files,
+                                          max_fields=max_fields, max_part_size=max_part_size)
+                    self._form = await parser.parse()
+            except MultiPartException as e:
+                raise HTTPException(status_code=400, detail=e.message)
+        return await super()._get_form(max_files=max_files, max_fields=max_fields, max_part_size=max_part_size)
+
+class UploadRoute(APIRoute):
+    """Route class of the routers that receive uploads, handing their endpoints an UploadRequest"""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[None, None, Response]]:
+        handler = super().get_route_handler()
+
+        async def upload_handler(request: Request) -> Response:
+            return await handler(UploadRequest(request.scope, request.receive))
+
+        return upload_handler
@@ -1,71 +1,195 @@
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+import os
+import re
+import json
+import asyncio
+from typing import List, Dict, Any, Optional
+from pydantic import BaseModel
+from fastapi import APIRouter, File, Form, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from termcolor import colored
-from ...core.extractors.invoice_extractor import extract_invoice_details
-from ...core.extractors.pdf_extractor import process_pdf
-from ...core.db.database import InvoiceDB
+from ...core.pipeline.processor import process_invoice
+from ..middleware import UploadRoute
+from ...core.pipeline.uploads import SpooledUpload, spool_upload, FileTooLargeError
+from ...core.extractors.preflight import PreflightRejected
+from ...core.db.async_database import AsyncInvoiceDB
+from ...core.extractors.pdf_extractor import OCR_POLICIES
 
-router = APIRouter()
-db = InvoiceDB()
+# Constants
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+MAX_LOOKUP_HASHES = 1000
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+router = APIRouter(route_class=UploadRoute)
+db = AsyncInvoiceDB()
+
+def check_ocr_backend(ocr_backend: Optional[str]):
+    """Reject unknown OCR backends before any work is done"""
+    if ocr_backend and ocr_backend not in OCR_POLICIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown OCR backend '{ocr_backend}', choose from {', '.join(OCR_POLICIES)}."
+        )
+
+class HashLookup(BaseModel):
+    """Request body for looking up results of many files by hash"""
+    hashes: List[str]
 
 @router.post("/extract")
-async def extract_receipt(file: UploadFile = File(...)):
+async def extract_receipt(file: UploadFile = File(...), ocr_backend: Optional[str] = Form(default=None)):
     """
     Process an uploaded invoice file (PDF or text) and extract structured information.
     Checks database for existing results before processing.
     
     Args:
         file: The uploaded file containing invoice data
+        ocr_backend: OCR policy or backend for PDFs, the configured policy if not set
         
     Returns:
         JSONResponse containing structured invoice information
     """
+    check_ocr_backend(ocr_backend)
     try:
         print(colored(f"Processing uploaded file: {file.filename}", "yellow"))
         
-        # Read file content
-        contents = await file.read()
-        
-        # Check if file was processed before
-        existing_result = db.check_file_exists(contents)
-        if existing_result and existing_result.get('json_result'):
-            print(colored("✓ Found existing results in database", "green"))
-            return JSONResponse(content=existing_result['json_result'])
-        
-        # Process based on file type
-        if file.filename.lower().endswith('.pdf'):
-            # Save PDF content first
-            file_hash, is_new = db.save_file(file.filename, contents)
-            
-            # Check if we have text content
-            text_content = db.get_text_content(file_hash)
-            if not text_content:
-                # Process PDF file
-                text_content = await process_pdf(contents, file.filename)
-                # Update with text content
-                db.save_file(file.filename, contents, text_content=text_content)
-        elif file.filename.lower().endswith('.txt'):
-            # Process text file
-            text_content = contents.decode('utf-8')
-            file_hash, is_new = db.save_file(
-                file.filename, 
-                contents, 
-                text_content=text_content
-            )
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail="Unsupported file type. Please upload a PDF or text file."
-            )
-        
-        # Extract invoice details using GPT-4
-        result = await extract_invoice_details(text_content, file.filename)
-        
-        # Save the final results
-        db.save_file(file.filename, contents, text_content=text_content, json_result=result)
+        # Spool file content while hashing it
+        upload = await spool_upload(file)
+        try:
+            result = await process_invoice(db, upload, ocr_backend)
+        finally:
+            upload.close()
         
         return JSONResponse(content=result)
         
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except PreflightRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         print(colored(f"Error processing file: {str(e)}", "red"))
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/extract/batch")
+async def extract_batch(
+    files: List[UploadFile] = File(default=[]),
+    hashes: List[str] = Form(default=[]),
+    concurrency: int = Form(default=BATCH_CONCURRENCY),
+    ocr_backend: Optional[str] = Form(default=None)
+):
+    """
+    Process many invoice files in one request and stream the results as NDJSON.
+    Files run through the same pipeline as /extract, bounded per stage by the
+    OCR and LLM semaphores, and each line is sent as soon as its invoice finishes.
+    
+    Args:
+        files: The uploaded files containing invoice data
+        hashes: SHA-256 hashes of files already stored in the database
+        concurrency: Maximum number of files processed at the same time
+        ocr_backend: OCR policy or backend for PDFs, the configured policy if not set
+        
+    Returns:
+        StreamingResponse with one JSON object per invoice
+    """
+    if not files and not hashes:
+        raise HTTPException(status_code=400, detail="Provide at least one file or file hash.")
+    if concurrency < 1:
+        raise HTTPException(status_code=400, detail="Concurrency must be at least 1.")
+    check_ocr_backend(ocr_backend)
+
+    print(colored(f"Processing batch: {len(files)} files, {len(hashes)} hashes", "yellow"))
+    batch_sem = asyncio.Semaphore(concurrency)
+
+    async def load_stored(file_hash: str) -> SpooledUpload:
+        stored = await db.get_file_by_hash(file_hash)
+        if not stored:
+            raise ValueError(f"No stored file found for hash {file_hash}")
+        return SpooledUpload.from_bytes(stored['filename'], stored['file_content'], file_hash)
+
+    async def run(index: int, source: str, loader) -> Dict[str, Any]:
+        line = {'index': index, 'source': source}
+        async with batch_sem:
+            try:
+                upload = await loader()
+                try:
+                    line['filename'] = upload.filename
+                    line['result'] = await process_invoice(db, upload, ocr_backend)
+                    line['status'] = 'ok'
+                finally:
+                    upload.close()
+            except Exception as e:
+                print(colored(f"Error processing {source}: {str(e)}", "red"))
+                line['status'] = 'error'
+                line['error'] = str(e)
+        return line
+
+    jobs = [
+        (file.filename, lambda file=file: spool_upload(file)) for file in files
+    ] + [
+        (file_hash, lambda file_hash=file_hash: load_stored(file_hash)) for file_hash in hashes
+    ]
+
+    async def stream_results():
+        tasks = [
+            asyncio.create_task(run(index, source, loader))
+            for index, (source, loader) in enumerate(jobs)
+        ]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                line = await finished
+                yield json.dumps(line) + "\n"
+        finally:
+            # Client went away, stop the remaining work
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@router.get("/invoices/by-hash/{file_hash}")
+async def get_invoice_by_hash(file_hash: str):
+    """
+    Get the stored result of a previously processed file by its SHA-256 hash,
+    so clients can skip uploading files that were already processed.
+    
+    Args:
+        file_hash: SHA-256 hash of the file content, hex encoded
+        
+    Returns:
+        JSONResponse containing structured invoice information
+    """
+    file_hash = file_hash.lower()
+    if not SHA256_PATTERN.match(file_hash):
+        raise HTTPException(status_code=400, detail="Invalid SHA-256 hash.")
+    
+    result = await db.get_json_result(file_hash)
+    if not result:
+        raise HTTPException(status_code=404, detail="No result found for this hash.")
+    
+    print(colored(f"✓ Found existing results in database for hash {file_hash[:12]}", "green"))
+    return JSONResponse(content=result)
+
+@router.post("/invoices/lookup")
+async def lookup_invoices(lookup: HashLookup):
+    """
+    Get the stored results of many previously processed files by hash.
+    
+    Args:
+        lookup: The SHA-256 hashes to look up
+        
+    Returns:
+        JSONResponse with the results of the known hashes and a list of the missing ones
+    """
+    if len(lookup.hashes) > MAX_LOOKUP_HASHES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many hashes, look up at most {MAX_LOOKUP_HASHES} at a time."
+        )
+    
+    hashes = [file_hash.lower() for file_hash in lookup.hashes]
+    invalid = [file_hash for file_hash in hashes if not SHA256_PATTERN.match(file_hash)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid SHA-256 hashes: {', '.join(invalid)}")
+    
+    results = await db.get_json_results(hashes)
+    missing = [file_hash for file_hash in hashes if file_hash not in results]
+    
+    return JSONResponse(content={'results': results, 'missing': missing})
@@ -0,0 +1,72 @@
+from fastapi import APIRouter, File, Request, UploadFile, HTTPException
+from fastapi.responses import JSONResponse
+from termcolor import colored
+from ...core.db.database import InvoiceDB
+from ...core.db.job_queue import JobQueue
+from ...core.executors import ExecutorProxy, db_executor
+from ...core.pipeline.uploads import spool_upload, FileTooLargeError
+from ..middleware import UploadRoute
+from .invoice import db
+
+router = APIRouter(route_class=UploadRoute)
+
+async def open_job_queue() -> ExecutorProxy:
+    """
+    Open the job queue on its own blocking connection, running on the database
+    executor. Called from the application lifespan, so importing the app does
+    not open or migrate the database.
+    """
+    return ExecutorProxy(await db_executor.run(lambda: JobQueue(InvoiceDB())), db_executor)
+
+@router.post("/jobs")
+async def submit_job(request: Request, file: UploadFile = File(...)):
+    """
+    Store an uploaded invoice file and queue it for background extraction.
+    
+    Args:
+        file: The uploaded file containing invoice data
+        
+    Returns:
+        JSONResponse containing the job id to poll
+    """
+    try:
+        print(colored(f"Queueing uploaded file: {file.filename}", "yellow"))
+        
+        if not file.filename.lower().endswith(('.pdf', '.txt')):
+            raise HTTPException(
+                status_code=400,
+                detail="Unsupported file type. Please upload a PDF or text file."
+            )
+        
+        upload = await spool_upload(file)
+        try:
+            await db.persist_extraction(upload.filename, upload.file_hash, upload.file)
+        finally:
+            upload.close()
+        job_id = await request.app.state.job_queue.enqueue(upload.file_hash, upload.filename)
+        
+        return JSONResponse(status_code=202, content={'job_id': job_id, 'status': 'queued'})
+        
+    except HTTPException:
+        raise
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        print(colored(f"Error queueing file: {str(e)}", "red"))
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/jobs/{job_id}")
+async def get_job(request: Request, job_id: str):
+    """
+    Get the status of a job, including the result once it is done.
+    
+    Args:
+        job_id: The id returned when the job was submitted
+        
+    Returns:
+        JSONResponse containing job status and result
+    """
+    job = await request.app.state.job_queue.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JSONResponse(content=job)
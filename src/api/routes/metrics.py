@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from ...core.metrics import metrics
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def get_metrics():
+    """
+    Report in-process metrics such as executor queue depths.
+    
+    Returns:
+        JSONResponse containing the current value of all metrics
+    """
+    return JSONResponse(content=metrics.snapshot())
@@ -0,0 +1,162 @@
+"""
+Adaptive concurrency limits for the calls to rate limited services
+"""
+
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional
+import httpx
+from termcolor import colored
+from .metrics import metrics
+
+# Constants
+# Ceilings the limits never grow past, and the limits they start at
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "500"))
+LLM_CONCURRENCY_START = int(os.getenv("LLM_CONCURRENCY_START", "20"))
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "200"))
+OCR_CONCURRENCY_START = int(os.getenv("OCR_CONCURRENCY_START", "20"))
+# Factor the limit is cut by on a 429 or 503, and on rising latency or a nearly spent rate limit
+OVERLOAD_BACKOFF = 0.5
+SLOWDOWN_BACKOFF = 0.9
+# Latency above this multiple of the long-run average counts as congestion
+LATENCY_TOLERANCE = float(os.getenv("LLM_LATENCY_TOLERANCE", "2.0"))
+LATENCY_WARMUP = 20
+SHORT_EWMA = 0.2
+LONG_EWMA = 0.02
+# Share of the x-ratelimit-limit-* budget left below which calls slow down
+RATE_LIMIT_HEADROOM = float(os.getenv("RATE_LIMIT_HEADROOM", "0.05"))
+OVERLOAD_STATUSES = {429, 503}
+RATE_LIMIT_HEADERS = ["requests", "tokens"]
+
+class AdaptiveLimiter:
+    """
+    Limits the calls in flight to a service and adapts the limit AIMD style,
+    like TCP congestion control: the limit grows by one for every limit's
+    worth of calls that complete while the limit is in use, and is cut by a
+    factor on a congestion signal. Signals are 429 and 503 responses, latency
+    rising above its long-run average, and x-ratelimit-remaining-* headers
+    close to zero. The limit is cut at most once per average call latency,
+    so a burst of 429s from calls started together counts once.
+    """
+
+    def __init__(self, name: str, start: int, max_limit: int, min_limit: int = 1,
+                 latency_tolerance: Optional[float] = None):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = float(min(max(start, min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.short_latency: Optional[float] = None
+        self.long_latency: Optional[float] = None
+        self.samples = 0
+        self.last_decrease = 0.0
+        metrics.register_gauge(f"concurrency_{name}", self.stats)
+
+    async def acquire(self):
+        """Wait for a free slot under the current limit"""
+        while self.in_flight >= int(self.limit):
+            future = asyncio.get_running_loop().create_future()
+            self.waiters.append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future in self.waiters:
+                    self.waiters.remove(future)
+                # Pass a wake-up this waiter will not use on to the next one
+                self._wake()
+                raise
+        self.in_flight += 1
+
+    def release(self, latency: Optional[float] = None):
+        """Free a slot, with the latency of the call if it succeeded"""
+        saturated = self.in_flight >= int(self.limit)
+        self.in_flight -= 1
+        if latency is not None:
+            self._on_success(latency, saturated)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a slot for the duration of a call, measuring its latency"""
+        await self.acquire()
+        start = time.perf_counter()
+        latency = None
+        try:
+            yield
+            latency = time.perf_counter() - start
+        finally:
+            self.release(latency)
+
+    def _wake(self):
+        """Wake as many waiters as there are free slots"""
+        free = int(self.limit) - self.in_flight
+        while free > 0 and self.waiters:
+            future = self.waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                free -= 1
+
+    def _on_success(self, latency: float, saturated: bool):
+        """Grow the limit additively, or cut it when latency is rising"""
+        self.samples += 1
+        if self.short_latency is None:
+            self.short_latency = self.long_latency = latency
+        else:
+            self.short_latency += SHORT_EWMA * (latency - self.short_latency)
+            self.long_latency += LONG_EWMA * (latency - self.long_latency)
+
+        if (self.latency_tolerance and self.samples > LATENCY_WARMUP
+                and self.short_latency > self.latency_tolerance * self.long_latency):
+            self.decrease(SLOWDOWN_BACKOFF, "latency")
+        elif saturated and self.limit < self.max_limit:
+            # One more slot for every limit's worth of completed calls
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def decrease(self, factor: float, reason: str):
+        """Cut the limit on a congestion signal, at most once per average call latency"""
+        now = time.monotonic()
+        if now - self.last_decrease < (self.short_latency or 1.0):
+            return
+        self.last_decrease = now
+        previous = int(self.limit)
+        self.limit = max(float(self.min_limit), self.limit * factor)
+        metrics.increment(f"concurrency_{self.name}_{reason}")
+        if int(self.limit) != previous:
+            print(colored(f"  {self.name} concurrency {previous} → {int(self.limit)} ({reason})", "yellow"))
+
+    async def observe_response(self, response: httpx.Response):
+        """
+        httpx response event hook: cut the limit on overload responses and
+        when the rate limit headers show the budget is nearly spent
+        """
+        if response.status_code in OVERLOAD_STATUSES:
+            self.decrease(OVERLOAD_BACKOFF, "overload")
+            return
+        for kind in RATE_LIMIT_HEADERS:
+            try:
+                remaining = int(response.headers[f"x-ratelimit-remaining-{kind}"])
+                budget = int(response.headers[f"x-ratelimit-limit-{kind}"])
+            except (KeyError, ValueError):
+                continue
+            if budget > 0 and remaining < budget * RATE_LIMIT_HEADROOM:
+                self.decrease(SLOWDOWN_BACKOFF, "headroom")
+                return
+
+    def stats(self) -> dict:
+        """Get the current state of the limiter"""
+        return {
+            'limit': int(self.limit),
+            'max_limit': self.max_limit,
+            'in_flight': self.in_flight,
+            'waiting': len(self.waiters),
+            'latency': round(self.short_latency, 3) if self.short_latency is not None else None
+        }
+
+# OCR job latency swings with page count and mode, so only overload and headers steer it
+llm_limiter = AdaptiveLimiter("llm", LLM_CONCURRENCY_START, LLM_CONCURRENCY, latency_tolerance=LATENCY_TOLERANCE)
+ocr_limiter = AdaptiveLimiter("ocr", OCR_CONCURRENCY_START, OCR_CONCURRENCY)
@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+"""
+Async database module on aiosqlite with one writer and a pool of readers
+"""
+
+import json
+import time
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Optional, Dict, Tuple, List, BinaryIO, AsyncIterator
+import aiosqlite
+from termcolor import colored
+from .blob_store import BlobStore
+from .group_commit import GroupCommit
+from .database import (
+    DATABASE_FILE,
+    LOOKUP_BATCH_SIZE,
+    SCHEMA,
+    INSERT_INVOICE_DATA,
+    apply_migrations,
+    persist_batch,
+    save_ocr_cache_rows,
+    get_file_hash,
+    invoice_data_rows
+)
+from ..executors import cpu_executor, db_executor
+from ..metrics import metrics
+from ..tier_memory import TierStats, decay
+
+# Constants
+READER_CONNECTIONS = 4
+BUSY_TIMEOUT_MS = 5000
+MMAP_SIZE = 256 * 1024 * 1024
+CACHE_SIZE_KB = 64 * 1024
+
+UPSERT_TIER_SUPPLIER = """
+    INSERT INTO tier_suppliers (tier_key, supplier) VALUES (?, ?)
+    ON CONFLICT(tier_key, supplier) DO UPDATE SET
+        documents = documents + 1,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+PRAGMAS = [
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    # Every commit is fsynced, a group commit reports rows as stored only once they survive a power loss
+    "PRAGMA synchronous = FULL",
+    f"PRAGMA mmap_size = {MMAP_SIZE}",
+    f"PRAGMA cache_size = -{CACHE_SIZE_KB}",
+    "PRAGMA temp_store = MEMORY",
+]
+
+class AsyncInvoiceDB:
+    """
+    Async variant of InvoiceDB. The database runs in WAL mode so the reader
+    connections never wait for the single writer connection, and writes are
+    serialized on the writer with a lock instead of sharing one cursor.
+    Connections are opened on first use, or explicitly with open().
+    File content lives in the blob store and is read and written on the
+    CPU executor, outside the writer lock. Extractions are persisted through
+    a group commit, so concurrent writers share transactions and fsyncs.
+    Writes of many statements, such as migrations, run on a plain sqlite3
+    writer connection on the DB executor, in one call instead of one round
+    trip per statement. It is held with the same lock as the writer.
+    """
+
+    def __init__(self, db_path: str = DATABASE_FILE, readers: int = READER_CONNECTIONS,
+                 blob_store: Optional[BlobStore] = None):
+        self.db_path = db_path
+        self.readers = readers
+        self.blob_store = blob_store or BlobStore()
+        self.group_commit = GroupCommit(self._persist_batch)
+        self.writer: Optional[aiosqlite.Connection] = None
+        self.batch_writer: Optional[sqlite3.Connection] = None
+        self.reader_pool: Optional[asyncio.Queue] = None
+        self.reader_connections: List[aiosqlite.Connection] = []
+        self.write_lock = asyncio.Lock()
+        self.open_lock = asyncio.Lock()
+
+    async def open(self):
+        """Open the writer and reader connections and create tables if they don't exist"""
+        async with self.open_lock:
+            if self.writer:
+                return
+            try:
+                writer = await self._connect()
+                await writer.execute("PRAGMA journal_mode = WAL")
+                await writer.executescript(SCHEMA)
+                await writer.commit()
+                batch_writer = await db_executor.run(self._open_batch_writer)
+
+                reader_pool = asyncio.Queue()
+                for _ in range(self.readers):
+                    reader = await self._connect()
+                    await reader.execute("PRAGMA query_only = ON")
+                    self.reader_connections.append(reader)
+                    reader_pool.put_nowait(reader)
+
+                self.reader_pool = reader_pool
+                self.batch_writer = batch_writer
+                self.writer = writer
+                self.group_commit.start()
+                print(colored(f"✓ Connected to database: {self.db_path} (1 writer, {self.readers} readers)", "green"))
+            except Exception as e:
+                print(colored(f"Error initializing database: {str(e)}", "red"))
+                raise
+
+    async def close(self):
+        """Close all connections"""
+        async with self.open_lock:
+            # Commit the pending writes before the writer goes away
+            await self.group_commit.stop()
+            for conn in self.reader_connections:
+                await conn.close()
+            if self.writer:
+                await self.writer.close()
+            if self.batch_writer:
+                await db_executor.run(self.batch_writer.close)
+            self.reader_connections = []
+            self.reader_pool = None
+            self.writer = None
+            self.batch_writer = None
+
+    async def _connect(self) -> aiosqlite.Connection:
+        """Open a connection with the tuned pragmas"""
+        conn = await aiosqlite.connect(self.db_path)
+        conn.row_factory = aiosqlite.Row
+        for pragma in PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    def _open_batch_writer(self) -> sqlite3.Connection:
+        """Open the plain sqlite3 writer connection with the tuned pragmas and migrate the schema on it"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        apply_migrations(conn)
+        return conn
+
+    @asynccontextmanager
+    async def _reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Borrow a reader connection from the pool"""
+        if not self.writer:
+            await self.open()
+        conn = await self.reader_pool.get()
+        try:
+            yield conn
+        finally:
+            self.reader_pool.put_nowait(conn)
+
+    @asynccontextmanager
+    async def _writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Hold the writer connection for one transaction, committing on success"""
+        if not self.writer:
+            await self.open()
+        async with self.write_lock:
+            try:
+                yield self.writer
+                await self.writer.commit()
+            except BaseException:
+                await self.writer.rollback()
+                raise
+
+    async def _batch_write(self, fn: Callable[..., Any], *args) -> Any:
+        """Run fn(conn, *args) as one transaction on the batch writer, committing on success"""
+        if not self.writer:
+            await self.open()
+
+        def transaction():
+            try:
+                result = fn(self.batch_writer, *args)
+                self.batch_writer.commit()
+                return result
+            except BaseException:
+                self.batch_writer.rollback()
+                raise
+
+        async with self.write_lock:
+            return await db_executor.run(transaction)
+
+    async def _fetchone(self, query: str, params: Tuple) -> Optional[aiosqlite.Row]:
+        """Run a query on a reader connection and return the first row"""
+        async with self._reader() as conn:
+            async with conn.execute(query, params) as cursor:
+                return await cursor.fetchone()
+
+    async def check_file_exists(self, file_content: Optional[bytes] = None,
+                                file_hash: Optional[str] = None) -> Optional[Dict]:
+        """
+        Check if file has been processed before
+        Pass file_hash when the digest is already known to skip hashing the content
+        Returns the processed result if exists, None otherwise
+        """
+        try:
+            file_hash = file_hash or get_file_hash(file_content)
+            row = await self._fetchone(
+                "SELECT id, filename, text_content, json_result, created_at FROM processed_files WHERE file_hash = ?",
+                (file_hash,)
+            )
+
+            if row:
+                return {
+                    'id': row['id'],
+                    'filename': row['filename'],
+                    'text_content': row['text_content'],
+                    'json_result': json.loads(row['json_result']) if row['json_result'] else None,
+                    'created_at': row['created_at']
+                }
+            return None
+        except Exception as e:
+            print(colored(f"Error checking file existence: {str(e)}", "red"))
+            raise
+
+    async def persist_extraction(self, filename: str, file_hash: str, file: BinaryIO,
+                                 text_content: Optional[str] = None, json_result: Optional[Dict] = None) -> Tuple[str, bool]:
+        """
+        Persist the file, its text, its JSON result and the detailed invoice data
+        atomically. The file row is upserted, so concurrent writers of the same
+        file never collide on file_hash, and text and JSON are only filled in
+        when not stored yet. File content is streamed into the blob store first,
+        which skips content it already holds. The row writes go through the group
+        commit, sharing a transaction with other writers, and this returns once
+        that transaction is committed
+        Returns tuple of (file_hash, is_new)
+        """
+        try:
+            blob_path = await cpu_executor.run(self.blob_store.put, file_hash, file)
+            if not self.writer:
+                await self.open()
+            return await self.group_commit.submit(filename, file_hash, blob_path, text_content, json_result)
+        except Exception as e:
+            print(colored(f"Error persisting extraction: {str(e)}", "red"))
+            raise
+
+    async def _persist_batch(self, ops: List[Tuple]) -> List[Any]:
+        """Write a batch of persist_extraction calls in one transaction on the batch writer"""
+        return await self._batch_write(persist_batch, ops)
+
+    async def get_file_by_hash(self, file_hash: str) -> Optional[Dict]:
+        """
+        Get a stored file by hash
+        Returns the filename, file content and result if exists, None otherwise
+        """
+        try:
+            row = await self._fetchone(
+                "SELECT id, filename, blob_path, json_result FROM processed_files WHERE file_hash = ?",
+                (file_hash,)
+            )
+            if not row:
+                return None
+
+            if row['blob_path']:
+                file_content = await cpu_executor.run(self.blob_store.read, row['blob_path'])
+            else:
+                # Row from before the blob store that has not been migrated yet
+                inline = await self._fetchone("SELECT pdf_content FROM processed_files WHERE id = ?", (row['id'],))
+                file_content = inline['pdf_content']
+
+            if file_content is None:
+                print(colored(f"Warning: stored content missing for hash {file_hash}", "yellow"))
+                return None
+
+            return {
+                'filename': row['filename'],
+                'file_content': file_content,
+                'json_result': json.loads(row['json_result']) if row['json_result'] else None
+            }
+        except Exception as e:
+            print(colored(f"Error retrieving file: {str(e)}", "red"))
+            raise
+
+    async def get_text_content(self, file_hash: str) -> Optional[str]:
+        """Get text content for a file by hash"""
+        try:
+            row = await self._fetchone(
+                "SELECT text_content FROM processed_files WHERE file_hash = ?",
+                (file_hash,)
+            )
+            return row['text_content'] if row else None
+        except Exception as e:
+            print(colored(f"Error retrieving text content: {str(e)}", "red"))
+            raise
+
+    async def get_json_result(self, file_hash: str) -> Optional[Dict]:
+        """Get JSON result for a file by hash"""
+        try:
+            row = await self._fetchone(
+                "SELECT json_result FROM processed_files WHERE file_hash = ?",
+                (file_hash,)
+            )
+            return json.loads(row['json_result']) if row and row['json_result'] else None
+        except Exception as e:
+            print(colored(f"Error retrieving JSON result: {str(e)}", "red"))
+            raise
+
+    async def get_json_results(self, file_hashes: List[str]) -> Dict[str, Dict]:
+        """
+        Get JSON results for many files by hash
+        Returns a dict mapping each processed hash to its result, unknown hashes are left out
+        """
+        try:
+            results = {}
+            async with self._reader() as conn:
+                for start in range(0, len(file_hashes), LOOKUP_BATCH_SIZE):
+                    batch = file_hashes[start:start + LOOKUP_BATCH_SIZE]
+                    placeholders = ', '.join('?' for _ in batch)
+                    async with conn.execute(
+                        f"SELECT file_hash, json_result FROM processed_files "
+                        f"WHERE file_hash IN ({placeholders}) AND json_result IS NOT NULL",
+                        batch
+                    ) as cursor:
+                        for row in await cursor.fetchall():
+                            results[row['file_hash']] = json.loads(row['json_result'])
+            return results
+        except Exception as e:
+            print(colored(f"Error retrieving JSON results: {str(e)}", "red"))
+            raise
+
+    async def acquire_extraction_lease(self, file_hash: str, owner: str, lease_seconds: float) -> bool:
+        """
+        Take the lease for extracting a file, so other processes sharing the
+        database wait for the result instead of extracting it again.
+        Succeeds if the lease is free, expired or already held by owner
+        Returns True if the lease was acquired
+        """
+        try:
+            now = time.time()
+            async with self._writer() as conn:
+                cursor = await conn.execute("""
+                    INSERT INTO extraction_leases (file_hash, owner, expires_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(file_hash) DO UPDATE
+                    SET owner = excluded.owner, expires_at = excluded.expires_at
+                    WHERE extraction_leases.expires_at < ? OR extraction_leases.owner = excluded.owner
+                """, (file_hash, owner, now + lease_seconds, now))
+                return cursor.rowcount == 1
+        except Exception as e:
+            print(colored(f"Error acquiring extraction lease: {str(e)}", "red"))
+            raise
+
+    async def release_extraction_lease(self, file_hash: str, owner: str):
+        """Release a lease taken with acquire_extraction_lease"""
+        try:
+            async with self._writer() as conn:
+                await conn.execute(
+                    "DELETE FROM extraction_leases WHERE file_hash = ? AND owner = ?",
+                    (file_hash, owner)
+                )
+        except Exception as e:
+            print(colored(f"Error releasing extraction lease: {str(e)}", "red"))
+            raise
+
+    async def get_ocr_cache(self, content_hashes: List[str], backend: str, mode: str,
+                            params_hash: str) -> Dict[str, str]:
+        """
+        Get cached OCR text of documents or pages produced with the given backend, mode and settings
+        Returns a dict mapping each cached content hash to its text, uncached content is left out
+        """
+        try:
+            results = {}
+            async with self._reader() as conn:
+                for start in range(0, len(content_hashes), LOOKUP_BATCH_SIZE):
+                    batch = content_hashes[start:start + LOOKUP_BATCH_SIZE]
+                    placeholders = ', '.join('?' for _ in batch)
+                    async with conn.execute(
+                        f"SELECT content_hash, result_text FROM ocr_cache "
+                        f"WHERE backend = ? AND mode = ? AND params_hash = ? AND content_hash IN ({placeholders})",
+                        [backend, mode, params_hash, *batch]
+                    ) as cursor:
+                        for row in await cursor.fetchall():
+                            results[row['content_hash']] = row['result_text']
+            metrics.increment("ocr_cache_hits", len(results))
+            metrics.increment("ocr_cache_misses", len(content_hashes) - len(results))
+            
+            # Mark the hits as recently used, so eviction keeps them
+            if results:
+                async with self._writer() as conn:
+                    await conn.executemany(
+                        "UPDATE ocr_cache SET last_used_at = ? "
+                        "WHERE content_hash = ? AND backend = ? AND mode = ? AND params_hash = ?",
+                        [(time.time(), content_hash, backend, mode, params_hash) for content_hash in results]
+                    )
+            return results
+        except Exception as e:
+            print(colored(f"Error retrieving cached OCR text: {str(e)}", "red"))
+            raise
+
+    async def save_ocr_cache(self, texts: Dict[str, str], backend: str, mode: str, params_hash: str):
+        """Cache OCR text keyed by content hash, evicting the least recently used entries when the cache is full"""
+        try:
+            now = time.time()
+            evicted = await self._batch_write(save_ocr_cache_rows, [
+                (content_hash, backend, mode, params_hash, text, len(text.encode('utf-8')), now)
+                for content_hash, text in texts.items()
+            ])
+            if evicted:
+                metrics.increment("ocr_cache_evictions", evicted)
+        except Exception as e:
+            print(colored(f"Error caching OCR text: {str(e)}", "red"))
+            raise
+
+    async def get_tier_stats(self, stage: str, keys: List[str]) -> Dict[str, Dict[str, TierStats]]:
+        """
+        Get the recency weighted outcomes of the tiers of a cascade stage
+
+        Args:
+            stage: The cascade, such as "llm" or "ocr"
+            keys: Supplier or document source keys to look up
+
+        Returns:
+            Dict of key to dict of tier to TierStats, only for keys with recorded outcomes
+        """
+        if not keys:
+            return {}
+        try:
+            now = time.time()
+            stats: Dict[str, Dict[str, TierStats]] = {}
+            placeholders = ", ".join("?" * len(keys))
+            async with self._reader() as conn:
+                async with conn.execute(f"""
+                    SELECT tier_key, tier, successes, failures, updated_at FROM tier_stats
+                    WHERE stage = ? AND tier_key IN ({placeholders})
+                """, (stage, *keys)) as cursor:
+                    async for row in cursor:
+                        stats.setdefault(row['tier_key'], {})[row['tier']] = TierStats(
+                            decay(row['successes'], row['updated_at'], now),
+                            decay(row['failures'], row['updated_at'], now)
+                        )
+            return stats
+        except Exception as e:
+            print(colored(f"Error retrieving tier stats: {str(e)}", "red"))
+            raise
+
+    async def record_tier_outcomes(self, stage: str, key: str, outcomes: List[Tuple[str, bool]],
+                                   supplier: Optional[str] = None):
+        """
+        Add the outcomes of the tiers tried for a document to their recency weighted counts
+
+        Args:
+            stage: The cascade, such as "llm" or "ocr"
+            key: Supplier or document source key
+            outcomes: Tuples (tier, True if it was good enough)
+            supplier: Name of the supplier, kept as one row per supplier seen under the key
+        """
+        try:
+            now = time.time()
+            async with self._writer() as conn:
+                for tier, success in outcomes:
+                    async with conn.execute("""
+                        SELECT successes, failures, updated_at FROM tier_stats
+                        WHERE stage = ? AND tier_key = ? AND tier = ?
+                    """, (stage, key, tier)) as cursor:
+                        row = await cursor.fetchone()
+                    successes = decay(row['successes'], row['updated_at'], now) if row else 0.0
+                    failures = decay(row['failures'], row['updated_at'], now) if row else 0.0
+                    await conn.execute("""
+                        INSERT OR REPLACE INTO tier_stats (stage, tier_key, tier, successes, failures, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, (stage, key, tier, successes + success, failures + (not success), now))
+                if supplier:
+                    await conn.execute(UPSERT_TIER_SUPPLIER, (key, supplier))
+        except Exception as e:
+            print(colored(f"Error saving tier outcomes: {str(e)}", "red"))
+            raise
+
+    async def label_tier_key(self, key: str, supplier: str):
+        """Add a supplier seen under a supplier or document source key, one row per supplier"""
+        try:
+            async with self._writer() as conn:
+                await conn.execute(UPSERT_TIER_SUPPLIER, (key, supplier))
+        except Exception as e:
+            print(colored(f"Error saving tier supplier: {str(e)}", "red"))
+            raise
+
+    async def save_invoice_data(self, file_id: int, data: Dict):
+        """Save parsed invoice data to the detailed table"""
+        try:
+            async with self._writer() as conn:
+                await conn.executemany(INSERT_INVOICE_DATA, invoice_data_rows(file_id, data))
+            print(colored("✓ Saved detailed invoice data to database", "green"))
+        except Exception as e:
+            print(colored(f"Error saving invoice data: {str(e)}", "red"))
+            raise
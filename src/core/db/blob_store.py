@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Content-addressed on-disk store for uploaded files
+"""
+
+import os
+import io
+import zlib
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Optional
+from termcolor import colored
+
+# Constants
+BLOB_STORE_DIR = os.getenv("BLOB_STORE_DIR", "blob_store")
+BLOB_COMPRESSION = os.getenv("BLOB_COMPRESSION", "0") == "1"
+COMPRESSION_LEVEL = 6
+CHUNK_SIZE = 1024 * 1024
+COMPRESSED_SUFFIX = ".z"
+
+class BlobStore:
+    """
+    Stores files under a sharded directory keyed by their SHA-256 hash,
+    e.g. ab/cd/abcd…. Writes go to a temporary file in the target directory
+    that is renamed into place, so a blob is either complete or absent.
+    Blobs are optionally zlib compressed, which is recorded in the file suffix.
+    """
+
+    def __init__(self, root: str = BLOB_STORE_DIR, compress: bool = BLOB_COMPRESSION):
+        self.root = Path(root)
+        self.compress = compress
+
+    def blob_path(self, file_hash: str) -> str:
+        """Get the path of a blob relative to the store root, as stored in the database"""
+        suffix = COMPRESSED_SUFFIX if self.compress else ""
+        return f"{file_hash[:2]}/{file_hash[2:4]}/{file_hash}{suffix}"
+
+    def exists(self, blob_path: str) -> bool:
+        """Check if a blob is stored"""
+        return (self.root / blob_path).exists()
+
+    def put(self, file_hash: str, file: BinaryIO) -> str:
+        """
+        Store the content of a file object under its hash, streaming it in chunks.
+        The content is verified against the hash before the blob is moved into place
+        Returns the blob path to store in the database
+        """
+        blob_path = self.blob_path(file_hash)
+        target = self.root / blob_path
+        if target.exists():
+            return blob_path
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=target.parent, prefix=".tmp-")
+        try:
+            sha256 = hashlib.sha256()
+            compressor = zlib.compressobj(COMPRESSION_LEVEL) if self.compress else None
+            with os.fdopen(fd, "wb") as out:
+                file.seek(0)
+                while chunk := file.read(CHUNK_SIZE):
+                    sha256.update(chunk)
+                    out.write(compressor.compress(chunk) if compressor else chunk)
+                if compressor:
+                    out.write(compressor.flush())
+                out.flush()
+                os.fsync(out.fileno())
+
+            if sha256.hexdigest() != file_hash:
+                raise ValueError(f"Content does not match hash {file_hash}")
+
+            os.replace(temp_name, target)
+            return blob_path
+        except Exception as e:
+            print(colored(f"Error storing blob: {str(e)}", "red"))
+            if os.path.exists(temp_name):
+                os.unlink(temp_name)
+            raise
+
+    def put_bytes(self, file_hash: str, data: bytes) -> str:
+        """Store content that is already in memory"""
+        return self.put(file_hash, io.BytesIO(data))
+
+    def read(self, blob_path: str) -> Optional[bytes]:
+        """Read a blob, None if it is not stored"""
+        path = self.root / blob_path
+        if not path.exists():
+            return None
+        data = path.read_bytes()
+        if blob_path.endswith(COMPRESSED_SUFFIX):
+            data = zlib.decompress(data)
+        return data
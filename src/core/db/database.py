@@ -3,27 +3,325 @@
 Database module for storing processed invoice data
 """
 
+import os
 import sqlite3
 import json
+import time
 import hashlib
 from pathlib import Path
-from typing import Optional, Dict, Tuple
+from typing import Any, Optional, Dict, Tuple, List, BinaryIO
 from termcolor import colored
+from .blob_store import BlobStore
 
 # Constants
 DATABASE_FILE = "invoice_data.db"
-SCHEMA_VERSION = 1
+SCHEMA_VERSION = 3
+LOOKUP_BATCH_SIZE = 500
+MIGRATION_BATCH_SIZE = 50
+# Size of the OCR cache above which the least recently used entries are evicted
+OCR_CACHE_MAX_BYTES = int(float(os.getenv("OCR_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS processed_files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_hash TEXT UNIQUE NOT NULL,
+        filename TEXT NOT NULL,
+        pdf_content BLOB,
+        text_content TEXT,
+        json_result TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_file_hash ON processed_files(file_hash);
+
+    CREATE TABLE IF NOT EXISTS invoice_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        invoice_number TEXT,
+        invoice_date DATE,
+        due_date DATE,
+        amount_payable DECIMAL(10,2),
+        currency TEXT,
+        recipient TEXT,
+        method_of_payment TEXT,
+        primary_supplier TEXT,
+        supplier_email TEXT,
+        supplier_address TEXT,
+        supplier_iban TEXT,
+        supplier_vat_id TEXT,
+        supplier_kvk TEXT,
+        high_tax_base DECIMAL(10,2),
+        high_tax DECIMAL(10,2),
+        low_tax_base DECIMAL(10,2),
+        low_tax DECIMAL(10,2),
+        null_tax_base DECIMAL(10,2),
+        amount_excl_tax DECIMAL(10,2),
+        total_emballage DECIMAL(10,2),
+        has_errors BOOLEAN DEFAULT FALSE,
+        error_messages TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (file_id) REFERENCES processed_files(id)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_invoice_number ON invoice_data(invoice_number);
+    CREATE INDEX IF NOT EXISTS idx_invoice_date ON invoice_data(invoice_date);
+    CREATE INDEX IF NOT EXISTS idx_amount_payable ON invoice_data(amount_payable);
+    CREATE INDEX IF NOT EXISTS idx_supplier_vat_id ON invoice_data(supplier_vat_id);
+
+    CREATE TABLE IF NOT EXISTS extraction_leases (
+        file_hash TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS ocr_cache (
+        content_hash TEXT NOT NULL,
+        backend TEXT NOT NULL,
+        mode TEXT NOT NULL,
+        params_hash TEXT NOT NULL,
+        result_text TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_used_at REAL NOT NULL,
+        PRIMARY KEY (content_hash, backend, mode, params_hash)
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache(last_used_at);
+
+    CREATE TABLE IF NOT EXISTS tier_stats (
+        stage TEXT NOT NULL,
+        tier_key TEXT NOT NULL,
+        tier TEXT NOT NULL,
+        successes REAL NOT NULL DEFAULT 0,
+        failures REAL NOT NULL DEFAULT 0,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (stage, tier_key, tier)
+    );
+
+    CREATE TABLE IF NOT EXISTS tier_suppliers (
+        tier_key TEXT NOT NULL,
+        supplier TEXT NOT NULL,
+        documents INTEGER NOT NULL DEFAULT 1,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (tier_key, supplier)
+    );
+"""
+
+INSERT_INVOICE_DATA = """
+    INSERT INTO invoice_data (
+        file_id, invoice_number, invoice_date, due_date,
+        amount_payable, currency, recipient, method_of_payment,
+        primary_supplier, supplier_email, supplier_address,
+        supplier_iban, supplier_vat_id, supplier_kvk,
+        high_tax_base, high_tax, low_tax_base, low_tax,
+        null_tax_base, amount_excl_tax, total_emballage,
+        has_errors, error_messages, segment, first_page, last_page
+    ) VALUES (
+        ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+    )
+"""
+
+# Schema changes applied on top of SCHEMA, keyed by the version they bring the database to.
+# The applied version is kept in PRAGMA user_version
+MIGRATIONS = {
+    # File content moves to the blob store, pdf_content is only kept for rows not migrated yet
+    2: ["ALTER TABLE processed_files ADD COLUMN blob_path TEXT"],
+    # A file can hold several invoices, each gets its own invoice_data row
+    3: [
+        "ALTER TABLE invoice_data ADD COLUMN segment INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE invoice_data ADD COLUMN first_page INTEGER",
+        "ALTER TABLE invoice_data ADD COLUMN last_page INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_invoice_file_id ON invoice_data(file_id)",
+    ],
+}
+
+# Insert a file row referencing its stored blob, leaving existing rows alone
+UPSERT_FILE = """
+    INSERT INTO processed_files (file_hash, filename, blob_path, text_content, json_result)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(file_hash) DO NOTHING
+"""
+
+UPDATE_MISSING_TEXT = """
+    UPDATE processed_files SET text_content = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE file_hash = ? AND COALESCE(text_content, '') = ''
+"""
+
+UPDATE_MISSING_JSON = """
+    UPDATE processed_files SET json_result = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE file_hash = ? AND COALESCE(json_result, '') = ''
+    RETURNING id
+"""
 
 def get_file_hash(file_content: bytes) -> str:
     """Calculate SHA-256 hash of file content"""
     return hashlib.sha256(file_content).hexdigest()
 
+def invoice_data_row(file_id: int, data: Dict, segment: int = 0) -> Tuple:
+    """Map the extraction result of one invoice to the parameters of INSERT_INVOICE_DATA"""
+    # Extract supplier data
+    supplier_data = data.get('details_supplier', {})
+    tax_data = data.get('suppliers', [{}])[0] if data.get('suppliers') else {}
+    error_data = data.get('error_handling', {})
+    
+    # Prepare error messages if any
+    error_messages = None
+    if error_data.get('has_errors'):
+        error_messages = json.dumps([
+            {
+                'id': error.get('id'),
+                'message': error.get('message'),
+                'analysis': error.get('analysis')
+            }
+            for error in error_data.get('errors', [])
+        ])
+
+    return (
+        file_id,
+        data.get('invoice_number'),
+        data.get('invoice_date'),
+        data.get('due_date'),
+        data.get('amount_payable'),
+        data.get('currency'),
+        data.get('recipient'),
+        data.get('method_of_payment'),
+        data.get('primary_supplier'),
+        supplier_data.get('email'),
+        supplier_data.get('address'),
+        supplier_data.get('iban'),
+        supplier_data.get('vat_id'),
+        supplier_data.get('kvk'),
+        tax_data.get('high_tax_base'),
+        tax_data.get('high_tax'),
+        tax_data.get('low_tax_base'),
+        tax_data.get('low_tax'),
+        tax_data.get('null_tax_base'),
+        tax_data.get('amount_excl_tax'),
+        data.get('total_emballage'),
+        error_data.get('has_errors', False),
+        error_messages,
+        segment,
+        *(data.get('pages') or [None, None])
+    )
+
+def invoice_data_rows(file_id: int, data: Dict) -> List[Tuple]:
+    """Map an extraction result to INSERT_INVOICE_DATA parameters, one row per invoice in the file"""
+    invoices = data.get('invoices') or [data]
+    return [invoice_data_row(file_id, invoice, segment) for segment, invoice in enumerate(invoices)]
+
+def persist_row(conn: sqlite3.Connection, filename: str, file_hash: str, blob_path: str,
+                text_content: Optional[str], json_result: Optional[Dict]) -> bool:
+    """
+    Upsert a file row and save the detailed invoice data, inside the caller's transaction
+    Returns True if the file row is new
+    """
+    json_text = json.dumps(json_result) if json_result else None
+    cursor = conn.execute(UPSERT_FILE, (file_hash, filename, blob_path, text_content, json_text))
+    is_new = cursor.rowcount == 1
+
+    if is_new:
+        file_id = cursor.lastrowid
+    else:
+        file_id = None
+        if text_content:
+            conn.execute(UPDATE_MISSING_TEXT, (text_content, file_hash))
+        if json_text:
+            row = conn.execute(UPDATE_MISSING_JSON, (json_text, file_hash)).fetchone()
+            file_id = row[0] if row else None
+
+    # Only save detailed invoice data when this call stored the JSON result
+    if json_result and file_id is not None:
+        conn.executemany(INSERT_INVOICE_DATA, invoice_data_rows(file_id, json_result))
+        print(colored("✓ Saved detailed invoice data to database", "green"))
+
+    return is_new
+
+def persist_batch(conn: sqlite3.Connection, ops: List[Tuple]) -> List[Any]:
+    """
+    Run many persist_row calls in one transaction. Each call runs in its own
+    savepoint, so a failing call is rolled back and reported on its own while
+    the rest of the batch is kept. The caller commits
+    Returns one (file_hash, is_new) tuple or exception per call
+    """
+    results = []
+    conn.execute("BEGIN IMMEDIATE")
+    for filename, file_hash, blob_path, text_content, json_result in ops:
+        conn.execute("SAVEPOINT persist")
+        try:
+            is_new = persist_row(conn, filename, file_hash, blob_path, text_content, json_result)
+            results.append((file_hash, is_new))
+        except Exception as e:
+            conn.execute("ROLLBACK TO persist")
+            results.append(e)
+        conn.execute("RELEASE persist")
+    return results
+
+def evict_ocr_cache(conn: sqlite3.Connection, max_bytes: int = OCR_CACHE_MAX_BYTES) -> int:
+    """
+    Delete the least recently used OCR cache entries until the cache fits in max_bytes.
+    Runs inside the caller's transaction
+
+    Returns:
+        The number of evicted entries
+    """
+    excess = conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0] - max_bytes
+    if excess <= 0:
+        return 0
+    evicted = []
+    for rowid, size in conn.execute("SELECT rowid, size FROM ocr_cache ORDER BY last_used_at"):
+        evicted.append((rowid,))
+        excess -= size
+        if excess <= 0:
+            break
+    conn.executemany("DELETE FROM ocr_cache WHERE rowid = ?", evicted)
+    return len(evicted)
+
+def save_ocr_cache_rows(conn: sqlite3.Connection, rows: List[Tuple]) -> int:
+    """
+    Insert or replace OCR cache entries and evict the least recently used ones
+    when the cache is full. Runs inside the caller's transaction
+
+    Returns:
+        The number of evicted entries
+    """
+    conn.executemany("""
+        INSERT OR REPLACE INTO ocr_cache
+            (content_hash, backend, mode, params_hash, result_text, size, last_used_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+    return evict_ocr_cache(conn)
+
+def apply_migrations(conn: sqlite3.Connection):
+    """
+    Bring the schema up to SCHEMA_VERSION. The version is re-read inside
+    an immediate transaction, so processes starting together migrate once
+    """
+    conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            if target not in MIGRATIONS:
+                continue
+            for statement in MIGRATIONS[target]:
+                conn.execute(statement)
+            print(colored(f"✓ Migrated database to schema version {target}", "green"))
+        if version < SCHEMA_VERSION:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
 class InvoiceDB:
-    def __init__(self, db_path: str = DATABASE_FILE):
+    def __init__(self, db_path: str = DATABASE_FILE, blob_store: Optional[BlobStore] = None):
         """Initialize database connection and create tables if they don't exist"""
         try:
             self.db_path = db_path
-            self.conn = sqlite3.connect(db_path)
+            self.blob_store = blob_store or BlobStore()
+            # The connection is created here but used from the database executor thread
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
             self.conn.row_factory = sqlite3.Row
             self.cursor = self.conn.cursor()
             self._create_tables()
@@ -35,68 +333,24 @@ class InvoiceDB:
     def _create_tables(self):
         """Create necessary tables if they don't exist"""
         try:
-            self.cursor.executescript("""
-                CREATE TABLE IF NOT EXISTS processed_files (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    file_hash TEXT UNIQUE NOT NULL,
-                    filename TEXT NOT NULL,
-                    pdf_content BLOB,
-                    text_content TEXT,
-                    json_result TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-
-                CREATE INDEX IF NOT EXISTS idx_file_hash ON processed_files(file_hash);
-
-                CREATE TABLE IF NOT EXISTS invoice_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    file_id INTEGER NOT NULL,
-                    invoice_number TEXT,
-                    invoice_date DATE,
-                    due_date DATE,
-                    amount_payable DECIMAL(10,2),
-                    currency TEXT,
-                    recipient TEXT,
-                    method_of_payment TEXT,
-                    primary_supplier TEXT,
-                    supplier_email TEXT,
-                    supplier_address TEXT,
-                    supplier_iban TEXT,
-                    supplier_vat_id TEXT,
-                    supplier_kvk TEXT,
-                    high_tax_base DECIMAL(10,2),
-                    high_tax DECIMAL(10,2),
-                    low_tax_base DECIMAL(10,2),
-                    low_tax DECIMAL(10,2),
-                    null_tax_base DECIMAL(10,2),
-                    amount_excl_tax DECIMAL(10,2),
-                    total_emballage DECIMAL(10,2),
-                    has_errors BOOLEAN DEFAULT FALSE,
-                    error_messages TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (file_id) REFERENCES processed_files(id)
-                );
-
-                CREATE INDEX IF NOT EXISTS idx_invoice_number ON invoice_data(invoice_number);
-                CREATE INDEX IF NOT EXISTS idx_invoice_date ON invoice_data(invoice_date);
-                CREATE INDEX IF NOT EXISTS idx_amount_payable ON invoice_data(amount_payable);
-                CREATE INDEX IF NOT EXISTS idx_supplier_vat_id ON invoice_data(supplier_vat_id);
-            """)
+            self.cursor.executescript(SCHEMA)
             self.conn.commit()
+            apply_migrations(self.conn)
         except Exception as e:
             print(colored(f"Error creating tables: {str(e)}", "red"))
             raise
 
-    def check_file_exists(self, file_content: bytes) -> Optional[Dict]:
+    def check_file_exists(self, file_content: Optional[bytes] = None, 
+                          file_hash: Optional[str] = None) -> Optional[Dict]:
         """
         Check if file has been processed before
+        Pass file_hash when the digest is already known to skip hashing the content
         Returns the processed result if exists, None otherwise
         """
         try:
-            file_hash = get_file_hash(file_content)
+            file_hash = file_hash or get_file_hash(file_content)
             self.cursor.execute(
-                "SELECT * FROM processed_files WHERE file_hash = ?",
+                "SELECT id, filename, text_content, json_result, created_at FROM processed_files WHERE file_hash = ?",
                 (file_hash,)
             )
             row = self.cursor.fetchone()
@@ -114,68 +368,81 @@ class InvoiceDB:
             print(colored(f"Error checking file existence: {str(e)}", "red"))
             raise
 
-    def save_file(self, filename: str, file_content: bytes, text_content: Optional[str] = None, 
-                 json_result: Optional[Dict] = None) -> Tuple[str, bool]:
+    def save_file(self, filename: str, file_content: Optional[bytes], text_content: Optional[str] = None, 
+                 json_result: Optional[Dict] = None, file_hash: Optional[str] = None) -> Tuple[str, bool]:
         """
-        Save or update file information in database
+        Save or update file information in database, upserting the file row like persist_extraction
+        Pass file_hash when the digest is already known to skip hashing the content,
+        file_content may then be None when only updating an existing record
         Returns tuple of (file_hash, is_new)
         """
         try:
-            file_hash = get_file_hash(file_content)
+            file_hash = file_hash or get_file_hash(file_content)
+            blob_path = self.blob_store.put_bytes(file_hash, file_content) if file_content is not None else None
+            is_new = persist_row(self.conn, filename, file_hash, blob_path, text_content, json_result)
+            if is_new and blob_path is None:
+                raise ValueError(f"No stored file found for hash {file_hash}")
+            self.conn.commit()
+            return file_hash, is_new
+                
+        except Exception as e:
+            print(colored(f"Error saving file: {str(e)}", "red"))
+            self.conn.rollback()
+            raise
+
+    def persist_extraction(self, filename: str, file_hash: str, file: BinaryIO,
+                           text_content: Optional[str] = None, json_result: Optional[Dict] = None) -> Tuple[str, bool]:
+        """
+        Persist the file, its text, its JSON result and the detailed invoice data
+        in a single transaction. The file row is upserted, so concurrent writers
+        of the same file never collide on file_hash, and text and JSON are only
+        filled in when not stored yet. File content is streamed into the blob
+        store before the transaction, which skips content it already holds
+        Returns tuple of (file_hash, is_new)
+        """
+        try:
+            blob_path = self.blob_store.put(file_hash, file)
+            is_new = persist_row(self.conn, filename, file_hash, blob_path, text_content, json_result)
+            self.conn.commit()
+            return file_hash, is_new
             
-            # Check if file exists
+        except Exception as e:
+            print(colored(f"Error persisting extraction: {str(e)}", "red"))
+            self.conn.rollback()
+            raise
+
+    def get_file_by_hash(self, file_hash: str) -> Optional[Dict]:
+        """
+        Get a stored file by hash
+        Returns the filename, file content and result if exists, None otherwise
+        """
+        try:
             self.cursor.execute(
-                "SELECT id, text_content, json_result FROM processed_files WHERE file_hash = ?",
+                "SELECT id, filename, blob_path, json_result FROM processed_files WHERE file_hash = ?",
                 (file_hash,)
             )
-            existing = self.cursor.fetchone()
-            
-            if existing:
-                # Update existing record if new data is provided
-                updates = []
-                params = []
-                
-                if text_content and not existing['text_content']:
-                    updates.append("text_content = ?")
-                    params.append(text_content)
-                
-                if json_result and not existing['json_result']:
-                    updates.append("json_result = ?")
-                    params.append(json.dumps(json_result))
-                    # Save detailed invoice data
-                    self.save_invoice_data(existing['id'], json_result)
-                
-                if updates:
-                    updates.append("updated_at = CURRENT_TIMESTAMP")
-                    query = f"UPDATE processed_files SET {', '.join(updates)} WHERE file_hash = ?"
-                    params.append(file_hash)
-                    self.cursor.execute(query, params)
-                    self.conn.commit()
-                
-                return file_hash, False
+            row = self.cursor.fetchone()
+            if not row:
+                return None
+
+            if row['blob_path']:
+                file_content = self.blob_store.read(row['blob_path'])
             else:
-                # Insert new record
-                self.cursor.execute("""
-                    INSERT INTO processed_files (file_hash, filename, pdf_content, text_content, json_result)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (
-                    file_hash,
-                    filename,
-                    file_content,
-                    text_content,
-                    json.dumps(json_result) if json_result else None
-                ))
-                
-                # If we have JSON result, save detailed invoice data
-                if json_result:
-                    self.save_invoice_data(self.cursor.lastrowid, json_result)
-                
-                self.conn.commit()
-                return file_hash, True
-                
+                # Row from before the blob store that has not been migrated yet
+                self.cursor.execute("SELECT pdf_content FROM processed_files WHERE id = ?", (row['id'],))
+                file_content = self.cursor.fetchone()['pdf_content']
+
+            if file_content is None:
+                print(colored(f"Warning: stored content missing for hash {file_hash}", "yellow"))
+                return None
+
+            return {
+                'filename': row['filename'],
+                'file_content': file_content,
+                'json_result': json.loads(row['json_result']) if row['json_result'] else None
+            }
         except Exception as e:
-            print(colored(f"Error saving file: {str(e)}", "red"))
-            self.conn.rollback()
+            print(colored(f"Error retrieving file: {str(e)}", "red"))
             raise
 
     def get_text_content(self, file_hash: str) -> Optional[str]:
@@ -204,64 +471,114 @@ class InvoiceDB:
             print(colored(f"Error retrieving JSON result: {str(e)}", "red"))
             raise
 
-    def save_invoice_data(self, file_id: int, data: Dict):
-        """Save parsed invoice data to the detailed table"""
+    def get_texts_to_extract(self, limit: Optional[int] = None, reprocess: bool = False) -> List[Dict]:
+        """
+        Get files with stored text content for a backfill, oldest first
+        Only files without a JSON result are returned unless reprocess is set
+        """
         try:
-            # Extract supplier data
-            supplier_data = data.get('details_supplier', {})
-            tax_data = data.get('suppliers', [{}])[0] if data.get('suppliers') else {}
-            error_data = data.get('error_handling', {})
-            
-            # Prepare error messages if any
-            error_messages = None
-            if error_data.get('has_errors'):
-                error_messages = json.dumps([
-                    {
-                        'id': error.get('id'),
-                        'message': error.get('message'),
-                        'analysis': error.get('analysis')
-                    }
-                    for error in error_data.get('errors', [])
-                ])
-
-            # Insert into invoice_data table
+            query = "SELECT file_hash, filename, text_content FROM processed_files WHERE COALESCE(text_content, '') != ''"
+            if not reprocess:
+                query += " AND COALESCE(json_result, '') = ''"
+            query += " ORDER BY id"
+            if limit:
+                query += f" LIMIT {int(limit)}"
+            self.cursor.execute(query)
+            return [dict(row) for row in self.cursor.fetchall()]
+        except Exception as e:
+            print(colored(f"Error retrieving texts to extract: {str(e)}", "red"))
+            raise
+
+    def save_json_result(self, file_hash: str, json_result: Dict, replace: bool = False) -> bool:
+        """
+        Store the JSON result and detailed invoice data of a file that is already stored.
+        An existing result is only overwritten, together with its invoice data, if replace is set
+        Returns True if the result was stored
+        """
+        try:
+            json_text = json.dumps(json_result)
+            if replace:
+                row = self.cursor.execute(
+                    "UPDATE processed_files SET json_result = ?, updated_at = CURRENT_TIMESTAMP "
+                    "WHERE file_hash = ? RETURNING id",
+                    (json_text, file_hash)
+                ).fetchone()
+                if row:
+                    self.cursor.execute("DELETE FROM invoice_data WHERE file_id = ?", (row[0],))
+            else:
+                row = self.cursor.execute(UPDATE_MISSING_JSON, (json_text, file_hash)).fetchone()
+            if row:
+                self.cursor.executemany(INSERT_INVOICE_DATA, invoice_data_rows(row[0], json_result))
+            self.conn.commit()
+            return row is not None
+        except Exception as e:
+            print(colored(f"Error saving JSON result: {str(e)}", "red"))
+            self.conn.rollback()
+            raise
+
+    def acquire_extraction_lease(self, file_hash: str, owner: str, lease_seconds: float) -> bool:
+        """
+        Take the lease for extracting a file, so other processes sharing the
+        database wait for the result instead of extracting it again.
+        Succeeds if the lease is free, expired or already held by owner
+        Returns True if the lease was acquired
+        """
+        try:
+            now = time.time()
             self.cursor.execute("""
-                INSERT INTO invoice_data (
-                    file_id, invoice_number, invoice_date, due_date,
-                    amount_payable, currency, recipient, method_of_payment,
-                    primary_supplier, supplier_email, supplier_address,
-                    supplier_iban, supplier_vat_id, supplier_kvk,
-                    high_tax_base, high_tax, low_tax_base, low_tax,
-                    null_tax_base, amount_excl_tax, total_emballage,
-                    has_errors, error_messages
-                ) VALUES (
-                    ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?
+                INSERT INTO extraction_leases (file_hash, owner, expires_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(file_hash) DO UPDATE
+                SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE extraction_leases.expires_at < ? OR extraction_leases.owner = excluded.owner
+            """, (file_hash, owner, now + lease_seconds, now))
+            acquired = self.cursor.rowcount == 1
+            self.conn.commit()
+            return acquired
+        except Exception as e:
+            print(colored(f"Error acquiring extraction lease: {str(e)}", "red"))
+            self.conn.rollback()
+            raise
+
+    def release_extraction_lease(self, file_hash: str, owner: str):
+        """Release a lease taken with acquire_extraction_lease"""
+        try:
+            self.cursor.execute(
+                "DELETE FROM extraction_leases WHERE file_hash = ? AND owner = ?",
+                (file_hash, owner)
+            )
+            self.conn.commit()
+        except Exception as e:
+            print(colored(f"Error releasing extraction lease: {str(e)}", "red"))
+            self.conn.rollback()
+            raise
+
+    def get_json_results(self, file_hashes: List[str]) -> Dict[str, Dict]:
+        """
+        Get JSON results for many files by hash
+        Returns a dict mapping each processed hash to its result, unknown hashes are left out
+        """
+        try:
+            results = {}
+            for start in range(0, len(file_hashes), LOOKUP_BATCH_SIZE):
+                batch = file_hashes[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ', '.join('?' for _ in batch)
+                self.cursor.execute(
+                    f"SELECT file_hash, json_result FROM processed_files "
+                    f"WHERE file_hash IN ({placeholders}) AND json_result IS NOT NULL",
+                    batch
                 )
-            """, (
-                file_id,
-                data.get('invoice_number'),
-                data.get('invoice_date'),
-                data.get('due_date'),
-                data.get('amount_payable'),
-                data.get('currency'),
-                data.get('recipient'),
-                data.get('method_of_payment'),
-                data.get('primary_supplier'),
-                supplier_data.get('email'),
-                supplier_data.get('address'),
-                supplier_data.get('iban'),
-                supplier_data.get('vat_id'),
-                supplier_data.get('kvk'),
-                tax_data.get('high_tax_base'),
-                tax_data.get('high_tax'),
-                tax_data.get('low_tax_base'),
-                tax_data.get('low_tax'),
-                tax_data.get('null_tax_base'),
-                tax_data.get('amount_excl_tax'),
-                data.get('total_emballage'),
-                error_data.get('has_errors', False),
-                error_messages
-            ))
+                for row in self.cursor.fetchall():
+                    results[row['file_hash']] = json.loads(row['json_result'])
+            return results
+        except Exception as e:
+            print(colored(f"Error retrieving JSON results: {str(e)}", "red"))
+            raise
+
+    def save_invoice_data(self, file_id: int, data: Dict):
+        """Save parsed invoice data to the detailed table"""
+        try:
+            self.cursor.executemany(INSERT_INVOICE_DATA, invoice_data_rows(file_id, data))
             self.conn.commit()
             print(colored("✓ Saved detailed invoice data to database", "green"))
         except Exception as e:
@@ -269,6 +586,41 @@ class InvoiceDB:
             self.conn.rollback()
             raise
 
+    def move_blobs_to_store(self, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+        """
+        Move file content stored inline in pdf_content to the blob store.
+        Each blob is streamed out of the database and verified against its hash,
+        and every batch of rows is committed on its own so the migration can be
+        interrupted and resumed
+        Returns the number of rows moved
+        """
+        moved = 0
+        try:
+            while True:
+                self.cursor.execute(
+                    "SELECT id, file_hash FROM processed_files "
+                    "WHERE blob_path IS NULL AND pdf_content IS NOT NULL LIMIT ?",
+                    (batch_size,)
+                )
+                rows = self.cursor.fetchall()
+                if not rows:
+                    return moved
+
+                for row in rows:
+                    with self.conn.blobopen("processed_files", "pdf_content", row['id'], readonly=True) as blob:
+                        blob_path = self.blob_store.put(row['file_hash'], blob)
+                    self.cursor.execute(
+                        "UPDATE processed_files SET blob_path = ?, pdf_content = NULL WHERE id = ?",
+                        (blob_path, row['id'])
+                    )
+                self.conn.commit()
+                moved += len(rows)
+                print(colored(f"✓ Moved {moved} files to the blob store", "green"))
+        except Exception as e:
+            print(colored(f"Error moving blobs to store: {str(e)}", "red"))
+            self.conn.rollback()
+            raise
+
     def __del__(self):
         """Close database connection"""
         try:
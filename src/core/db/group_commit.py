@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Group commit for concurrent writers: many small write operations share one transaction
+"""
+
+import os
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from termcolor import colored
+from ..metrics import metrics
+
+# Constants
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_OPS = int(os.getenv("GROUP_COMMIT_MAX_OPS", "64"))
+
+# An operation is its arguments plus the future its caller waits on
+Operation = Tuple[Tuple, asyncio.Future]
+
+class GroupCommit:
+    """
+    Write-behind batcher. Callers submit operations and wait; a single flusher
+    collects operations for up to window_ms after the first one arrives, or
+    until max_ops are queued, and hands them to apply_batch in one go.
+    apply_batch must run them in one transaction and return one result or
+    exception per operation, so callers are only acknowledged once the
+    whole batch is committed and one failing operation does not fail the others.
+    """
+
+    def __init__(self, apply_batch: Callable[[List[Tuple]], Awaitable[List[Any]]],
+                 window_ms: float = GROUP_COMMIT_WINDOW_MS, max_ops: int = GROUP_COMMIT_MAX_OPS):
+        self.apply_batch = apply_batch
+        self.window = window_ms / 1000
+        self.max_ops = max_ops
+        self.queue: Optional[asyncio.Queue] = None
+        self.flusher: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the flusher task on the running event loop"""
+        if self.flusher:
+            return
+        self.queue = asyncio.Queue()
+        self.flusher = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush the queued operations and stop the flusher"""
+        if not self.flusher:
+            return
+        self.queue.put_nowait(None)
+        await self.flusher
+        self.flusher = None
+        self.queue = None
+
+    async def submit(self, *args) -> Any:
+        """Queue an operation and wait until the batch holding it is committed"""
+        if not self.flusher:
+            raise RuntimeError("Group commit is not running")
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((args, future))
+        return await future
+
+    async def _collect(self, first: Operation) -> Tuple[List[Operation], bool]:
+        """Gather operations following the first one until the window closes or the batch is full"""
+        loop = asyncio.get_running_loop()
+        batch = [first]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_ops:
+            try:
+                op = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    op = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if op is None:
+                return batch, True
+            batch.append(op)
+        return batch, False
+
+    async def _run(self):
+        """Flush batches until stopped"""
+        stopping = False
+        while not stopping:
+            first = await self.queue.get()
+            if first is None:
+                break
+            batch, stopping = await self._collect(first)
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Operation]):
+        """Apply one batch and acknowledge its callers"""
+        try:
+            results = await self.apply_batch([args for args, _ in batch])
+        except Exception as e:
+            print(colored(f"Error committing batch of {len(batch)} writes: {str(e)}", "red"))
+            results = [e] * len(batch)
+
+        metrics.increment("group_commit_batches")
+        metrics.increment("group_commit_ops", len(batch))
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Persistent work queue for asynchronous extraction jobs
+"""
+
+import json
+import time
+import uuid
+from typing import Optional, Dict
+from termcolor import colored
+from .database import InvoiceDB
+
+# Constants
+LEASE_SECONDS = 900
+MAX_ATTEMPTS = 3
+
+class JobQueue:
+    def __init__(self, db: InvoiceDB):
+        """Use the connection of the given database and create the jobs table if it doesn't exist"""
+        try:
+            self.db = db
+            self.conn = db.conn
+            self.cursor = self.conn.cursor()
+            self._create_tables()
+        except Exception as e:
+            print(colored(f"Error initializing job queue: {str(e)}", "red"))
+            raise
+
+    def _create_tables(self):
+        """Create necessary tables if they don't exist"""
+        try:
+            self.cursor.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    file_hash TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires_at REAL,
+                    result TEXT,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (file_hash) REFERENCES processed_files(file_hash)
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at);
+            """)
+            self.conn.commit()
+        except Exception as e:
+            print(colored(f"Error creating job tables: {str(e)}", "red"))
+            raise
+
+    def enqueue(self, file_hash: str, filename: str) -> str:
+        """
+        Add a job for a stored file to the queue
+        Returns the job id
+        """
+        try:
+            job_id = uuid.uuid4().hex
+            self.cursor.execute(
+                "INSERT INTO jobs (id, file_hash, filename) VALUES (?, ?, ?)",
+                (job_id, file_hash, filename)
+            )
+            self.conn.commit()
+            return job_id
+        except Exception as e:
+            print(colored(f"Error enqueueing job: {str(e)}", "red"))
+            self.conn.rollback()
+            raise
+
+    def lease(self, worker_id: str, lease_seconds: int = LEASE_SECONDS) -> Optional[Dict]:
+        """
+        Lease the oldest queued job, or a running job whose lease expired
+        because its worker died. Returns the job if one was leased, None otherwise
+        """
+        try:
+            now = time.time()
+            self.cursor.execute("""
+                UPDATE jobs
+                SET status = 'running',
+                    attempts = attempts + 1,
+                    lease_owner = ?,
+                    lease_expires_at = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE status = 'queued'
+                       OR (status = 'running' AND lease_expires_at < ?)
+                    ORDER BY created_at
+                    LIMIT 1
+                )
+                RETURNING id, file_hash, filename, attempts
+            """, (worker_id, now + lease_seconds, now))
+            row = self.cursor.fetchone()
+            self.conn.commit()
+
+            if row:
+                return {
+                    'id': row['id'],
+                    'file_hash': row['file_hash'],
+                    'filename': row['filename'],
+                    'attempts': row['attempts']
+                }
+            return None
+        except Exception as e:
+            print(colored(f"Error leasing job: {str(e)}", "red"))
+            self.conn.rollback()
+            raise
+
+    def complete(self, job_id: str, worker_id: str, result: Dict):
+        """Store the result of a job leased by the given worker"""
+        try:
+            self.cursor.execute("""
+                UPDATE jobs
+                SET status = 'done', result = ?, error = NULL,
+                    lease_owner = NULL, lease_expires_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND lease_owner = ?
+            """, (json.dumps(result), job_id, worker_id))
+            self.conn.commit()
+        except Exception as e:
+            print(colored(f"Error completing job: {str(e)}", "red"))
+            self.conn.rollback()
+            raise
+
+    def fail(self, job_id: str, worker_id: str, error: str, max_attempts: int = MAX_ATTEMPTS):
+        """Record a failed attempt, the job is queued again until it runs out of attempts"""
+        try:
+            self.cursor.execute("""
+                UPDATE jobs
+                SET status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END,
+                    error = ?,
+                    lease_owner = NULL, lease_expires_at = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND lease_owner = ?
+            """, (max_attempts, error, job_id, worker_id))
+            self.conn.commit()
+        except Exception as e:
+            print(colored(f"Error failing job: {str(e)}", "red"))
+            self.conn.rollback()
+            raise
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        """Get status and result of a job by id"""
+        try:
+            self.cursor.execute(
+                "SELECT id, filename, status, attempts, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            )
+            row = self.cursor.fetchone()
+
+            if row:
+                return {
+                    'id': row['id'],
+                    'filename': row['filename'],
+                    'status': row['status'],
+                    'attempts': row['attempts'],
+                    'result': json.loads(row['result']) if row['result'] else None,
+                    'error': row['error'],
+                    'created_at': row['created_at'],
+                    'updated_at': row['updated_at']
+                }
+            return None
+        except Exception as e:
+            print(colored(f"Error retrieving job: {str(e)}", "red"))
+            raise
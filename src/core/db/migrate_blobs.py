@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Move file content stored inline in the database to the blob store
+
+Usage:
+    python -m src.core.db.migrate_blobs [--db invoice_data.db] [--batch-size 50] [--vacuum]
+"""
+
+import argparse
+from termcolor import colored
+from .database import DATABASE_FILE, MIGRATION_BATCH_SIZE, InvoiceDB
+
+def main():
+    parser = argparse.ArgumentParser(description="Move stored files from the database to the blob store")
+    parser.add_argument("--db", default=DATABASE_FILE, help="Path to the SQLite database")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE,
+                        help="Number of files moved per transaction")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="Rebuild the database afterwards to release the freed space")
+    args = parser.parse_args()
+
+    db = InvoiceDB(args.db)
+    moved = db.move_blobs_to_store(batch_size=args.batch_size)
+    print(colored(f"✓ Migration finished, {moved} files moved to {db.blob_store.root}", "green"))
+
+    if args.vacuum:
+        db.conn.execute("VACUUM")
+        print(colored("✓ Database vacuumed", "green"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Dedicated thread pools for blocking work, so it never runs on the event loop
+"""
+
+import os
+import asyncio
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable
+from .metrics import metrics
+
+# Constants
+# Local OCR is CPU bound and not thread safe, so it runs in worker processes
+OCR_PROCESSES = int(os.getenv("OCR_PROCESSES", str(os.cpu_count() or 1)))
+CPU_THREADS = int(os.getenv("CPU_THREADS", str(min(4, os.cpu_count() or 1))))
+# The database uses a single sqlite3 connection, so its work is serialized on one thread
+DB_THREADS = 1
+
+class InstrumentedExecutor:
+    """A named thread pool that keeps track of its queue depth and active tasks"""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        metrics.register_gauge(f"executor_{name}", self.stats)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a blocking function on the pool and await its result"""
+        with self.lock:
+            self.queued += 1
+        future = self.executor.submit(self._call, fn, *args, **kwargs)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        """Keep the queue depth right for work cancelled before it started"""
+        if future.cancelled():
+            with self.lock:
+                self.queued -= 1
+
+    def _call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn on a worker thread while updating the counters"""
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.completed += 1
+
+    def stats(self) -> dict:
+        """Get the current state of the pool"""
+        return {
+            'max_workers': self.max_workers,
+            'queued': self.queued,
+            'active': self.active,
+            'completed': self.completed
+        }
+
+class InstrumentedProcessExecutor(InstrumentedExecutor):
+    """
+    A named process pool with the same counters. Work is not visible once it is
+    handed to a worker process, so tasks beyond max_workers count as queued and
+    the rest as active. Workers are spawned rather than forked, as the parent
+    runs threads, and fn and its arguments must be picklable.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        metrics.register_gauge(f"executor_{name}", self.stats)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run a function in a worker process and await its result"""
+        with self.lock:
+            self.pending += 1
+        future = self.executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _on_done(self, future):
+        with self.lock:
+            self.pending -= 1
+            if not future.cancelled():
+                self.completed += 1
+
+    def stats(self) -> dict:
+        """Get the current state of the pool"""
+        active = min(self.pending, self.max_workers)
+        return {
+            'max_workers': self.max_workers,
+            'queued': self.pending - active,
+            'active': active,
+            'completed': self.completed
+        }
+
+class ExecutorProxy:
+    """Expose the methods of a blocking object as coroutines that run on an executor"""
+
+    def __init__(self, target: Any, executor: InstrumentedExecutor):
+        self._target = target
+        self._executor = executor
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self._executor.run(attr, *args, **kwargs)
+        return call
+
+ocr_executor = InstrumentedProcessExecutor("ocr", OCR_PROCESSES)
+db_executor = InstrumentedExecutor("db", DB_THREADS)
+cpu_executor = InstrumentedExecutor("cpu", CPU_THREADS)
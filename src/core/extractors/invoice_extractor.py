@@ -1,14 +1,18 @@
-import os
 import re
-from typing import Dict, Any
-import asyncio
+from typing import Dict, Any, List, Optional, Tuple
 from termcolor import colored
-from openai import AsyncOpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from langsmith import traceable
 from langsmith.wrappers import wrap_openai
 import instructor
+from instructor.retry import InstructorRetryException
 from pathlib import Path
 from ...models.pydantic.invoice_detail import InvoiceDetail
+from ..metrics import metrics
+from ..concurrency import llm_limiter
+from .text_compaction import TEXT_COMPACTION, compact_text, count_tokens
+from .invoice_repair import INVOICE_REPAIR, repair_completion
+from .model_tiers import LLM_MODEL_TIERS, LLM_TIER_MAX_RETRIES, LLM_FINAL_TIER_MAX_RETRIES, weak_signals
 
 # Load template files
 with open('./prompt_templates/user_info.txt', 'r', encoding='utf-8') as file:
@@ -16,46 +20,38 @@ with open('./prompt_templates/user_info.txt', 'r', encoding='utf-8') as file:
 with open('./prompt_templates/emballage_info.txt', 'r', encoding='utf-8') as file:
     emballage_info = file.read()
 
-# Semaphore to limit concurrent tasks
-sem = asyncio.Semaphore(500)
+# Constants
+# The strongest model of the cascade, used where there is no escalation such as batch backfills
+LLM_MODEL = LLM_MODEL_TIERS[-1]
+LLM_TEMPERATURE = 0.0
+LLM_TOP_P = 0.9
 
-# Initialize OpenAI client with LangSmith and Instructor
-client = wrap_openai(AsyncOpenAI())
+# Initialize OpenAI client with LangSmith and Instructor. Every response
+# goes past the LLM concurrency limiter, which backs off on 429s and
+# x-ratelimit-remaining-* headers
+client = wrap_openai(AsyncOpenAI(
+    http_client=DefaultAsyncHttpxClient(event_hooks={"response": [llm_limiter.observe_response]})
+))
 client = instructor.from_openai(client)
 
-@traceable(name="demo", project_name="ai-builders-demo")
-async def extract_invoice_details(data: str, file: str) -> Dict[str, Any]:
-    """
-    Extract structured information from invoice text using GPT-4o.
-    
-    Args:
-        data: The text content of the invoice
-        file: The filename of the invoice
-        
-    Returns:
-        Dict containing structured invoice information
-    """
-    try:
-        print(colored(f"Processing invoice: {file}", "yellow"))
-        
-        async with sem:
-            # Check if invoice contains emballage/statiegeld
-            if re.search(r'statiegeld|emballage', data, re.IGNORECASE):
-                additional_info = emballage_info
-            else:
-                additional_info = ""
+def prepare_invoice_text(data: str) -> str:
+    """Compact the invoice text for the prompt and record the token savings"""
+    compacted = compact_text(data)
+    tokens_before = count_tokens(data)
+    tokens_after = count_tokens(compacted)
+    metrics.increment("prompt_text_tokens_raw", tokens_before)
+    metrics.increment("prompt_text_tokens_compact", tokens_after)
+    print(colored(f"  Compacted invoice text: {tokens_before} → {tokens_after} tokens", "cyan"))
+    return compacted
 
-            messages = [
-                {
-                    "role": "system",
-                    "content": f"""Your name is Luca, you are a sophisticated extraction and classification algorithm. You are tasked with processing invoices for user.
+# Static part of the system prompt, built once so every request starts with the
+# same bytes and OpenAI's automatic prompt caching can reuse it. Anything that
+# varies per invoice goes after it, in the user message
+SYSTEM_PROMPT = f"""Your name is Luca, you are a sophisticated extraction and classification algorithm. You are tasked with processing invoices for user.
                     
                         **User Profile**: Take the context of the user into consideration when making decisions.
                         {user_info}
 
-                        ###
-                        {additional_info}
-
                         ###Critical Instructions for Data Extraction:
                         You are tasked with extracting data from invoices and must adhere to the following guidelines strictly:
 
@@ -70,25 +66,178 @@ async def extract_invoice_details(data: str, file: str) -> Dict[str, Any]:
 
                         By following these instructions, you ensure the integrity and accuracy of the extracted data, minimizing errors and maintaining compliance with validation requirements. 
                     """
-                },
-                {
-                    "role": "user",
-                    "content": f"Here is the invoice:\n{data}"
-                }
-            ]
-
-            response = await client.chat.completions.create(
-                model="gpt-4o",
-                temperature=0.0,
-                top_p=0.9,
-                response_model=InvoiceDetail,
-                max_retries=2,
-                messages=messages
-            )
-            
-            # Convert the Pydantic model to a dictionary
-            return response.model_dump(mode='json')
+
+def build_messages(invoice_text: str, additional_info: str = "") -> List[Dict[str, str]]:
+    """
+    Build the chat messages for an invoice: the static system prompt first,
+    then the per-invoice guidance and the invoice text
+    
+    Args:
+        invoice_text: The text of the invoice as it goes into the prompt
+        additional_info: Guidance that only applies to some invoices, such as emballage
+        
+    Returns:
+        The messages for the chat completion
+    """
+    guidance = f"###\n{additional_info}\n\n" if additional_info else ""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"{guidance}Here is the invoice:\n{invoice_text}"}
+    ]
+
+def prepare_messages(data: str, compact: bool = TEXT_COMPACTION) -> List[Dict[str, str]]:
+    """
+    Build the chat messages for invoice text, adding the emballage guidance
+    when the invoice mentions packaging deposits
+    
+    Args:
+        data: The text content of the invoice
+        compact: Compact layout whitespace and repeated headers before prompting
+        
+    Returns:
+        The messages for the chat completion
+    """
+    # Check if invoice contains emballage/statiegeld
+    if re.search(r'statiegeld|emballage', data, re.IGNORECASE):
+        additional_info = emballage_info
+    else:
+        additional_info = ""
+
+    invoice_text = prepare_invoice_text(data) if compact else data
+    return build_messages(invoice_text, additional_info)
+
+def record_usage(completion: Any, file: str):
+    """Record prompt tokens and the share OpenAI served from its prompt cache"""
+    usage = getattr(completion, "usage", None)
+    if not usage:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = getattr(details, "cached_tokens", 0) or 0
+    metrics.increment("llm_prompt_tokens", usage.prompt_tokens)
+    metrics.increment("llm_cached_prompt_tokens", cached_tokens)
+    metrics.increment("llm_completion_tokens", usage.completion_tokens)
+    print(colored(f"  Prompt tokens for {file}: {usage.prompt_tokens} ({cached_tokens} cached)", "cyan"))
+
+async def ask_model(model: str, messages: List[Dict[str, str]], attempts: int,
+                    file: str) -> Tuple[InvoiceDetail, List[Dict[str, str]]]:
+    """
+    Ask one model for the invoice details. An answer that fails validation is
+    repaired locally first (dates, Dutch decimals, VAT ids, tax rounding), and
+    only re-asked with the validation error when the repairs do not make it
+    valid. Counts llm_repairs and llm_retries.
+    
+    Args:
+        model: The model to ask
+        messages: The chat messages for the invoice
+        attempts: Calls to make before giving up
+        file: The filename of the invoice, for logging
+        
+    Returns:
+        Tuple (the validated invoice details, the local repairs applied to them)
+        
+    Raises:
+        InstructorRetryException: If the last answer fails validation and cannot be repaired
+    """
+    # instructor appends its retry messages to the list it gets
+    messages = list(messages)
+    for attempt in range(attempts):
+        try:
+            async with llm_limiter.slot():
+                response, completion = await client.chat.completions.create_with_completion(
+                    model=model,
+                    temperature=LLM_TEMPERATURE,
+                    top_p=LLM_TOP_P,
+                    response_model=InvoiceDetail,
+                    max_retries=1,
+                    messages=messages
+                )
+            record_usage(completion, file)
+            return response, []
+        except InstructorRetryException as e:
+            record_usage(e.last_completion, file)
+            if INVOICE_REPAIR:
+                repaired, repairs = repair_completion(e.last_completion)
+                if repaired:
+                    kinds = sorted({repair["repair"] for repair in repairs})
+                    metrics.increment("llm_repairs")
+                    for kind in kinds:
+                        metrics.increment(f"llm_repair_{kind}")
+                    for repair in repairs:
+                        print(colored(f"  Repaired {repair['field']} for {file} locally: "
+                                      f"{repair['original']} → {repair['value']}", "cyan"))
+                    return repaired, repairs
+            if attempt == attempts - 1:
+                raise
+            metrics.increment("llm_retries")
+            messages = e.messages
+
+async def extract_invoice_details(data: str, file: str, compact: bool = TEXT_COMPACTION,
+                                  tiers: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Extract structured information from invoice text, see extract_with_cascade.
+    
+    Args:
+        data: The text content of the invoice
+        file: The filename of the invoice
+        compact: Compact layout whitespace and repeated headers before prompting
+        tiers: Models to try in order, LLM_MODEL_TIERS if None
+        
+    Returns:
+        Dict containing structured invoice information
+    """
+    result, _ = await extract_with_cascade(data, file, compact, tiers)
+    return result
+
+@traceable(name="demo", project_name="ai-builders-demo")
+async def extract_with_cascade(data: str, file: str, compact: bool = TEXT_COMPACTION,
+                               tiers: Optional[List[str]] = None) -> Tuple[Dict[str, Any], str]:
+    """
+    Extract structured information from invoice text with a cascade of models.
+    The cheapest model answers first; its answer goes through the InvoiceDetail
+    validators and the weak signal checks, and a failure on either escalates to
+    the next model. The strongest model gets a retry and its answer is final.
+    Answers that fail validation are repaired locally before anything is
+    asked again, see ask_model. The repairs are listed under 'repairs'.
+    
+    Args:
+        data: The text content of the invoice
+        file: The filename of the invoice
+        compact: Compact layout whitespace and repeated headers before prompting
+        tiers: Models to try in order, LLM_MODEL_TIERS if None
+        
+    Returns:
+        Tuple (dict containing structured invoice information, model that answered)
+    """
+    tiers = tiers or LLM_MODEL_TIERS
+    try:
+        print(colored(f"Processing invoice: {file}", "yellow"))
+        
+        messages = prepare_messages(data, compact)
+
+        for index, model in enumerate(tiers):
+            final = index == len(tiers) - 1
+            try:
+                response, repairs = await ask_model(
+                    model, messages, LLM_FINAL_TIER_MAX_RETRIES if final else LLM_TIER_MAX_RETRIES, file
+                )
+            except InstructorRetryException as e:
+                if final:
+                    raise
+                reason = f"validation failed: {str(e)[:200]}"
+            else:
+                signals = [] if final else weak_signals(response, messages[-1]["content"])
+                if not signals:
+                    metrics.increment(f"llm_tier_{model}")
+                    # Convert the Pydantic model to a dictionary, noting the values repaired locally
+                    result = response.model_dump(mode='json')
+                    if repairs:
+                        result['repairs'] = repairs
+                    return result, model
+                reason = ", ".join(signals)
             
+            metrics.increment("llm_tier_escalations")
+            print(colored(f"  {model} fell short for {file} ({reason}), trying {tiers[index + 1]}", "yellow"))
+        
     except Exception as e:
         print(colored(f"Error extracting invoice details: {str(e)}", "red"))
-        raise 
\ No newline at end of file
+        raise
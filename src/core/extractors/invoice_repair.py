@@ -0,0 +1,203 @@
+import os
+import re
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import ValidationError
+from ...models.pydantic.invoice_detail import InvoiceDetail
+
+# Constants
+INVOICE_REPAIR = os.getenv("INVOICE_REPAIR", "1") == "1"
+# Largest difference between a tax amount and its base times the rate that is put
+# down to rounding and recomputed, anything larger is a misread for the model to fix.
+# The validators accept 0.02, suppliers that round VAT per line drift a few cents further
+VALIDATOR_TAX_TOLERANCE = Decimal("0.02")
+TAX_REPAIR_TOLERANCE = Decimal(os.getenv("TAX_REPAIR_TOLERANCE", "0.05"))
+TAX_RATES = {"high": Decimal("0.21"), "low": Decimal("0.09")}
+DECIMAL_FIELDS = [
+    "high_tax_base", "high_tax", "amount_excl_tax", "amount_payable",
+    "low_tax_base", "low_tax", "null_tax_base", "total_emballage"
+]
+MONTHS = {
+    "jan": 1, "feb": 2, "mrt": 3, "mar": 3, "apr": 4, "mei": 5, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "okt": 10, "oct": 10, "nov": 11, "dec": 12,
+}
+
+NUMERIC_DATE_PATTERN = re.compile(r"^(\d{1,2})[-/. ](\d{1,2})[-/. ](\d{2}|\d{4})$")
+ISO_DATE_PATTERN = re.compile(r"^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?:[t ].*)?$")
+WRITTEN_DATE_PATTERN = re.compile(r"^(\d{1,2})\.?\s*([a-z]{3})[a-z]*\.?\s*(\d{4})$")
+VAT_PREFIX_PATTERN = re.compile(r"^(?:BTW|VAT)(?:NR|NUMMER|ID|NO)?[:.]?", re.IGNORECASE)
+DUTCH_VAT_DIGITS_PATTERN = re.compile(r"^\d{9}B\d{2}$")
+
+def parse_dutch_date(value: str) -> Optional[str]:
+    """
+    Parse the ways invoices write dates into YYYY-MM-DD: 31-12-2024, 31/12/24,
+    31.12.2024, 31 december 2024, 31 dec. 2024 and ISO dates with a time
+
+    Returns:
+        The ISO date, or None if the value is not a recognizable date
+    """
+    text = value.strip().lower()
+    try:
+        match = ISO_DATE_PATTERN.match(text)
+        if match:
+            year, month, day = map(int, match.groups())
+            return date(year, month, day).isoformat()
+        match = NUMERIC_DATE_PATTERN.match(text)
+        if match:
+            day, month, year = map(int, match.groups())
+            return date(year + 2000 if year < 100 else year, month, day).isoformat()
+        match = WRITTEN_DATE_PATTERN.match(text)
+        if match and match.group(2) in MONTHS:
+            return date(int(match.group(3)), MONTHS[match.group(2)], int(match.group(1))).isoformat()
+    except ValueError:
+        return None
+    return None
+
+def parse_dutch_decimal(value: Any) -> Optional[str]:
+    """
+    Parse an amount as invoices write it: 1.234,56, 1,234.56, € 27,- or 12.50 EUR
+
+    Returns:
+        The amount as a plain decimal string, or None if it is not an amount
+    """
+    raw = str(value).strip()
+    # A minus before the first digit, the dash of 27,- only means no cents
+    negative = bool(re.match(r"^[^\d]*-", raw))
+    text = re.sub(r"[^\d,.]", "", raw).rstrip(",.")
+    if not text:
+        return None
+    # The last separator groups thousands when three digits follow it and it either
+    # repeats the separators before it (1.234.567) or follows a non-zero integer
+    # part on its own (12,345). Otherwise it is the decimal separator (0,005, 1.234,567)
+    last = max(text.rfind(","), text.rfind("."))
+    integer, fraction = text[:last], text[last + 1:]
+    others = set(integer) & {",", "."}
+    thousands = len(fraction) == 3 and (others == {text[last]} or (not others and integer.strip("0") != ""))
+    if last != -1 and not thousands:
+        text = integer.replace(",", "").replace(".", "") + "." + fraction
+    else:
+        text = text.replace(",", "").replace(".", "")
+    try:
+        amount = Decimal(text)
+    except InvalidOperation:
+        return None
+    return str(-amount if negative else amount)
+
+def normalize_vat_id(value: str) -> str:
+    """Drop labels, spaces, dots and dashes from a VAT id, and add NL to a bare Dutch number"""
+    text = re.sub(r"[\s.\-]", "", value).upper()
+    text = VAT_PREFIX_PATTERN.sub("", text)
+    if DUTCH_VAT_DIGITS_PATTERN.match(text):
+        text = "NL" + text
+    return text
+
+def is_decimal(value: Any) -> bool:
+    try:
+        Decimal(str(value))
+        return True
+    except InvalidOperation:
+        return False
+
+def record_repair(repairs: List[Dict[str, str]], kind: str, field: str, original: Any, value: Any):
+    """Note a repaired value with what the model sent, so every repair can be audited"""
+    repairs.append({"repair": kind, "field": field, "original": str(original), "value": str(value)})
+
+def repair_decimals(values: Dict, repairs: List[Dict[str, str]], prefix: str = ""):
+    """Parse the decimal fields of a dict that are not plain decimals"""
+    for field in DECIMAL_FIELDS:
+        value = values.get(field)
+        if value is None or is_decimal(value):
+            continue
+        parsed = parse_dutch_decimal(value)
+        if parsed is not None:
+            values[field] = parsed
+            record_repair(repairs, "decimal", prefix + field, value, parsed)
+
+def repair_taxes(supplier: Dict, repairs: List[Dict[str, str]], prefix: str = ""):
+    """Recompute a tax amount from its base when they differ by a rounding difference"""
+    for name, rate in TAX_RATES.items():
+        tax, base = supplier.get(f"{name}_tax"), supplier.get(f"{name}_tax_base")
+        if tax is None or base is None or not is_decimal(tax) or not is_decimal(base):
+            continue
+        expected = (Decimal(str(base)) * rate).quantize(Decimal("0.01"))
+        difference = abs(Decimal(str(tax)) - expected)
+        if VALIDATOR_TAX_TOLERANCE < difference <= TAX_REPAIR_TOLERANCE:
+            supplier[f"{name}_tax"] = str(expected)
+            record_repair(repairs, "tax", f"{prefix}{name}_tax", tax, expected)
+
+def repair_arguments(arguments: Dict) -> Tuple[Dict, List[Dict[str, str]]]:
+    """
+    Apply the deterministic repairs to the tool call arguments of an answer
+    that failed validation: dates into ISO format, Dutch decimals into plain
+    decimals, VAT ids into their compact form and taxes that are off by
+    rounding recomputed from their base. Values that are already valid are
+    left alone.
+
+    Args:
+        arguments: The InvoiceDetail arguments as the model sent them
+
+    Returns:
+        Tuple (repaired arguments, the repairs applied, see record_repair)
+    """
+    repairs: List[Dict[str, str]] = []
+    for field in ("invoice_date", "due_date"):
+        value = arguments.get(field)
+        if isinstance(value, str):
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                parsed = parse_dutch_date(value)
+                if parsed:
+                    arguments[field] = parsed
+                    record_repair(repairs, "date", field, value, parsed)
+
+    repair_decimals(arguments, repairs)
+    discount = arguments.get("discount")
+    if isinstance(discount, dict):
+        amount = discount.get("discount_amount")
+        if amount is not None and not is_decimal(amount):
+            parsed = parse_dutch_decimal(amount)
+            if parsed is not None:
+                discount["discount_amount"] = parsed
+                record_repair(repairs, "decimal", "discount.discount_amount", amount, parsed)
+
+    for index, supplier in enumerate(arguments.get("suppliers") or []):
+        if isinstance(supplier, dict):
+            repair_decimals(supplier, repairs, f"suppliers[{index}].")
+            repair_taxes(supplier, repairs, f"suppliers[{index}].")
+
+    details = arguments.get("details_supplier")
+    if isinstance(details, dict) and isinstance(details.get("vat_id"), str):
+        vat_id = normalize_vat_id(details["vat_id"])
+        if vat_id != details["vat_id"]:
+            record_repair(repairs, "vat_id", "details_supplier.vat_id", details["vat_id"], vat_id)
+            details["vat_id"] = vat_id
+
+    return arguments, repairs
+
+def repair_completion(completion: Any) -> Tuple[Optional[InvoiceDetail], List[Dict[str, str]]]:
+    """
+    Repair the answer of a completion that failed validation
+
+    Args:
+        completion: The ChatCompletion with the InvoiceDetail tool call
+
+    Returns:
+        Tuple (the validated invoice or None if repairs did not make it valid, the repairs applied)
+    """
+    try:
+        arguments = json.loads(completion.choices[0].message.tool_calls[0].function.arguments)
+    except (AttributeError, IndexError, TypeError, ValueError):
+        return None, []
+    if not isinstance(arguments, dict):
+        return None, []
+
+    arguments, repairs = repair_arguments(arguments)
+    if not repairs:
+        return None, []
+    try:
+        return InvoiceDetail.model_validate(arguments), repairs
+    except ValidationError:
+        return None, repairs
@@ -0,0 +1,81 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from .text_layer import split_pages, join_pages
+
+# Constants
+SPLIT_INVOICES = os.getenv("SPLIT_INVOICES", "1") == "1"
+# More segments than this is more likely a misread than a batch, keep the document whole
+MAX_INVOICE_SEGMENTS = int(os.getenv("MAX_INVOICE_SEGMENTS", "20"))
+
+INVOICE_NUMBER_PATTERN = re.compile(
+    r"(?:factuur\s*(?:nummer|nr\.?|no\.?)|invoice\s*(?:number|no\.?|nr\.?|#))\s*[:.#]?\s*"
+    r"((?=[A-Z0-9\-/.]*\d)[A-Z0-9][A-Z0-9\-/.]{2,})",
+    re.IGNORECASE
+)
+# "Pagina 1 van 3", "Page 1 of 2", "Blad 1/4": the first page of a document
+FIRST_PAGE_PATTERN = re.compile(r"\b(?:pagina|page|blad)\s*1\s*(?:van|of|/)\s*\d+", re.IGNORECASE)
+
+@dataclass
+class InvoiceSegment:
+    """Consecutive pages of a document that make up one invoice"""
+    first_page: int
+    last_page: int
+    invoice_number: Optional[str]
+    pages: List[str]
+
+    @property
+    def text(self) -> str:
+        return join_pages(self.pages)
+
+def page_invoice_number(text: str) -> Optional[str]:
+    """Find the invoice number printed on a page"""
+    match = INVOICE_NUMBER_PATTERN.search(text)
+    return match.group(1).rstrip("./-").upper() if match else None
+
+def segment_invoices(text: str) -> List[InvoiceSegment]:
+    """
+    Split the text of a document into the invoices it contains. A page starts
+    a new invoice when it shows another invoice number than the invoice so far,
+    or when it is marked as page 1 of a new document. Pages without either
+    belong to the invoice before them.
+
+    Args:
+        text: OCR or text layer output, pages separated by PAGE_SEPARATOR
+
+    Returns:
+        One segment per invoice, a single segment if the document holds one invoice
+    """
+    pages = split_pages(text)
+    segments: List[InvoiceSegment] = []
+    for index, page in enumerate(pages):
+        number = page_invoice_number(page)
+        current = segments[-1] if segments else None
+        starts_new = current is not None and (
+            (number and current.invoice_number and number != current.invoice_number)
+            or FIRST_PAGE_PATTERN.search(page)
+        )
+        if current is None or starts_new:
+            segments.append(InvoiceSegment(index, index, number, [page]))
+        else:
+            current.last_page = index
+            current.invoice_number = current.invoice_number or number
+            current.pages.append(page)
+
+    if len(segments) > MAX_INVOICE_SEGMENTS:
+        return [InvoiceSegment(0, len(pages) - 1, None, pages)]
+    return segments
+
+def combine_invoices(segments: List[InvoiceSegment], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combine the extraction results of the segments of one document. Every
+    invoice goes under 'invoices' with its 1-based page range under 'pages',
+    and the first invoice stays at the top level for callers that expect a
+    single invoice.
+    """
+    invoices = [
+        {**result, 'pages': [segment.first_page + 1, segment.last_page + 1]}
+        for segment, result in zip(segments, results)
+    ]
+    return {**invoices[0], 'invoices': invoices}
@@ -0,0 +1,68 @@
+import os
+import re
+from typing import Any, Dict, List, Optional
+from ...models.pydantic.invoice_detail import InvoiceDetail
+from .invoice_repair import normalize_vat_id
+
+# Constants
+# Models from cheapest to strongest, each one is only tried when the previous one fell short
+LLM_MODEL_TIERS = [model for model in os.getenv("LLM_MODEL_TIERS", "gpt-4o-mini,gpt-4o").split(",") if model]
+# Calls to each cheaper model: 1 escalates on the first validation error that cannot be
+# repaired, the strongest model is re-asked once with the error message
+LLM_TIER_MAX_RETRIES = int(os.getenv("LLM_TIER_MAX_RETRIES", "1"))
+LLM_FINAL_TIER_MAX_RETRIES = 2
+LLM_STAGE = "llm"
+
+# Dutch VAT ids and KvK numbers as invoices print them, to recognize a supplier before extraction
+VAT_ID_PATTERN = re.compile(r"\bNL[\s.]?\d{4}[\s.]?\d{2}[\s.]?\d{3}[\s.]?B[\s.]?\d{2}\b", re.IGNORECASE)
+KVK_PATTERN = re.compile(r"\b(?:kvk|k\.v\.k\.)(?:[\s-]?(?:nummer|nr\.?|no\.?))?\s*[:.]?\s*(\d{8})\b", re.IGNORECASE)
+
+def squeeze(text: str) -> str:
+    """Drop whitespace, column separators and case, OCR and compaction change them"""
+    return "".join(text.replace("|", " ").split()).lower()
+
+def amount_digits(amount) -> List[str]:
+    """Digits an amount can be written with: 27.50 as 2750, 27.00 also as 27"""
+    cents = f"{amount:.2f}".replace(".", "")
+    return [cents, cents[:-2]] if cents.endswith("00") else [cents]
+
+def weak_signals(invoice: InvoiceDetail, invoice_text: str) -> List[str]:
+    """
+    Check a validated answer for signs that a stronger model should have a look.
+    Validation only proves the answer is well formed, these check that it is
+    anchored in the invoice.
+
+    Args:
+        invoice: The validated answer
+        invoice_text: The prompt text the answer was extracted from
+
+    Returns:
+        Descriptions of the weak signals, empty if the answer can be trusted
+    """
+    signals = []
+    if invoice.error_handling.has_errors:
+        signals.append("the model reported errors")
+    if squeeze(invoice.amount_payable_citation) not in squeeze(invoice_text):
+        signals.append("the amount payable citation is not in the invoice")
+    citation_digits = re.sub(r"\D", "", invoice.amount_payable_citation)
+    if not any(digits in citation_digits for digits in amount_digits(invoice.amount_payable)):
+        signals.append("the amount payable is not in its citation")
+    return signals
+
+def supplier_keys(invoice_text: str) -> List[str]:
+    """
+    Get the tier memory keys of the VAT ids and KvK numbers printed on an invoice.
+    The recipient's own ids are on it too, but tiers are only recorded under
+    the supplier ids extracted from answers, see result_supplier_key.
+    """
+    keys = [f"vat:{normalize_vat_id(match.group(0))}" for match in VAT_ID_PATTERN.finditer(invoice_text)]
+    keys += [f"kvk:{match.group(1)}" for match in KVK_PATTERN.finditer(invoice_text)]
+    return list(dict.fromkeys(keys))
+
+def result_supplier_key(result: Dict[str, Any]) -> Optional[str]:
+    """Get the tier memory key of the supplier of an extracted invoice, by VAT id or else KvK number"""
+    details = result.get('details_supplier') or {}
+    if details.get('vat_id'):
+        return f"vat:{normalize_vat_id(details['vat_id'])}"
+    kvk = re.sub(r"\D", "", details.get('kvk') or "")
+    return f"kvk:{kvk}" if len(kvk) == 8 else None
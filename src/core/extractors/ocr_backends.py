@@ -0,0 +1,157 @@
+import os
+import logging
+from typing import Any, BinaryIO, Dict, List, Optional, Protocol, Union
+from termcolor import colored
+from ..executors import ocr_executor, cpu_executor
+from ..concurrency import ocr_limiter
+from .text_layer import PAGE_SEPARATOR, extract_text_layer, join_pages
+from .tesseract_ocr import TESSERACT_LANG, TESSERACT_DPI, tesseract_available, tesseract_pdf
+from .page_split import params_fingerprint
+from .whisper_client import get_whisper_client
+
+# Constants
+API_KEY_ENV = "LLMWHISPERER_API_KEY"
+DEFAULT_TIMEOUT = 300
+FORM_MODE = "form"
+OUTPUT_MODE = "layout_preserving"
+LINE_SPLITTER_TOLERANCE = 0.4
+HORIZONTAL_STRETCH = 1.1
+
+logger = logging.getLogger(__name__)
+
+class OCRBackend(Protocol):
+    """
+    A text extraction engine. ocr() returns the text of the requested pages
+    joined with PAGE_SEPARATOR, so results of different backends can be split
+    into pages and merged the same way.
+    """
+
+    name: str
+    # Processing mode, empty for backends that have a single one
+    mode: str
+
+    def available(self) -> bool:
+        """Check if the backend can be used in this environment"""
+        ...
+
+    def fingerprint(self) -> str:
+        """Identify the backend and its settings, for caching its output"""
+        ...
+
+    async def ocr(self, file_content: Union[bytes, BinaryIO], pages: Optional[List[int]] = None) -> str:
+        """Extract the text of a PDF, only of the given zero-based pages if set"""
+        ...
+
+def get_api_key() -> str:
+    """Get API key from environment variable."""
+    api_key = os.getenv(API_KEY_ENV)
+    if not api_key:
+        error_msg = f"API Key not found! Please set the {API_KEY_ENV} environment variable"
+        logger.error(error_msg)
+        raise ValueError(colored(error_msg, "red"))
+    return api_key
+
+def whisper_params(pages: Optional[List[int]] = None, mode: str = FORM_MODE) -> Dict[str, Any]:
+    """
+    Get the LLMWhisperer options for a document
+
+    Args:
+        pages: Zero-based indexes of the pages to OCR, all pages if None
+        mode: LLMWhisperer processing mode
+
+    Returns:
+        Query parameters for the whisper endpoint
+    """
+    return {
+        "mode": mode,
+        "output_mode": OUTPUT_MODE,
+        "line_splitter_tolerance": LINE_SPLITTER_TOLERANCE,
+        "horizontal_stretch_factor": HORIZONTAL_STRETCH,
+        "page_seperator": PAGE_SEPARATOR,
+        "pages_to_extract": ",".join(str(page + 1) for page in pages) if pages else "",
+    }
+
+async def read_bytes(file_content: Union[bytes, BinaryIO]) -> bytes:
+    """Read a file object on the CPU executor, for backends that need the whole document"""
+    if isinstance(file_content, bytes):
+        return file_content
+
+    def read() -> bytes:
+        file_content.seek(0)
+        return file_content.read()
+    return await cpu_executor.run(read)
+
+class WhisperBackend:
+    """OCR with the LLMWhisperer API in one processing mode"""
+
+    name = "llmwhisperer"
+
+    def __init__(self, mode: str = FORM_MODE):
+        self.mode = mode
+
+    def with_mode(self, mode: str) -> 'WhisperBackend':
+        """Get the same backend in another processing mode"""
+        return WhisperBackend(mode)
+
+    def available(self) -> bool:
+        return bool(os.getenv(API_KEY_ENV))
+
+    def fingerprint(self) -> str:
+        return params_fingerprint({"backend": self.name, **whisper_params(mode=self.mode)})
+
+    async def ocr(self, file_content: Union[bytes, BinaryIO], pages: Optional[List[int]] = None) -> str:
+        client = get_whisper_client(get_api_key())
+        # The OCR limiter bounds the jobs in flight at LLMWhisperer. Waiting for a job
+        # holds no thread, so the limit can grow far above the number of OCR threads
+        async with ocr_limiter.slot():
+            return await client.whisper(file_content, whisper_params(pages, self.mode), DEFAULT_TIMEOUT)
+
+class TextLayerBackend:
+    """Read the embedded text layer locally, without OCR"""
+
+    name = "text_layer"
+    mode = ""
+
+    def available(self) -> bool:
+        return True
+
+    def fingerprint(self) -> str:
+        return params_fingerprint({"backend": self.name})
+
+    async def ocr(self, file_content: Union[bytes, BinaryIO], pages: Optional[List[int]] = None) -> str:
+        texts = await cpu_executor.run(extract_text_layer, file_content)
+        if pages is not None:
+            texts = [texts[page] for page in pages]
+        return join_pages(texts)
+
+class TesseractBackend:
+    """OCR locally with Tesseract, in the OCR process pool"""
+
+    name = "tesseract"
+    mode = ""
+
+    def available(self) -> bool:
+        return tesseract_available()
+
+    def fingerprint(self) -> str:
+        return params_fingerprint({"backend": self.name, "lang": TESSERACT_LANG, "dpi": TESSERACT_DPI})
+
+    async def ocr(self, file_content: Union[bytes, BinaryIO], pages: Optional[List[int]] = None) -> str:
+        pdf = await read_bytes(file_content)
+        texts = await ocr_executor.run(tesseract_pdf, pdf, pages)
+        return join_pages(texts)
+
+OCR_BACKENDS: Dict[str, OCRBackend] = {
+    backend.name: backend for backend in (WhisperBackend(), TextLayerBackend(), TesseractBackend())
+}
+
+def get_backend(name: str) -> OCRBackend:
+    """
+    Get an OCR backend by name
+
+    Raises:
+        ValueError: If there is no backend with that name
+    """
+    if name not in OCR_BACKENDS:
+        raise ValueError(f"Unknown OCR backend '{name}', choose from {', '.join(OCR_BACKENDS)}")
+    return OCR_BACKENDS[name]
@@ -0,0 +1,79 @@
+import io
+import os
+import re
+import hashlib
+from dataclasses import dataclass
+from typing import BinaryIO, List, Optional, Union
+from pypdf import PdfReader
+
+# Constants
+# LLMWhisperer modes from cheapest to most thorough, each one is only tried when the previous fell short
+OCR_MODE_TIERS = [mode for mode in os.getenv("OCR_MODE_TIERS", "native_text,form").split(",") if mode]
+OCR_STAGE = "ocr"
+# Average characters an OCR'd page needs before its text is trusted
+TIER_MIN_PAGE_CHARS = int(os.getenv("OCR_TIER_MIN_PAGE_CHARS", "100"))
+# Money amounts a document needs, an invoice has at least a total and a tax line
+TIER_MIN_AMOUNTS = 2
+# Document info fields that identify the software, and so usually the supplier, that produced a PDF
+SOURCE_FIELDS = ["/Producer", "/Creator", "/Author"]
+
+AMOUNT_PATTERN = re.compile(r"\d[\d.,]*[.,]\d{2}\b")
+VAT_PATTERN = re.compile(r"\b(?:btw|vat|b\.t\.w\.)\b|\b[A-Z]{2}\d{9}B\d{2}\b", re.IGNORECASE)
+IBAN_PATTERN = re.compile(r"\b[A-Z]{2}\d{2} ?[A-Z]{4}(?: ?\d{2,4}){2,}\b")
+
+@dataclass
+class TextAssessment:
+    """What an OCR result contains, to decide whether a more expensive mode is needed"""
+    chars_per_page: float
+    amounts: int
+    has_vat: bool
+    has_iban: bool
+
+    @property
+    def sufficient(self) -> bool:
+        """Dense enough text with the amounts and tax or payment details an invoice has"""
+        return (
+            self.chars_per_page >= TIER_MIN_PAGE_CHARS
+            and self.amounts >= TIER_MIN_AMOUNTS
+            and (self.has_vat or self.has_iban)
+        )
+
+def assess_text(ocr_texts: List[str], document_text: str) -> TextAssessment:
+    """
+    Assess an OCR result
+
+    Args:
+        ocr_texts: Text of each OCR'd page, to measure character density
+        document_text: Text of the whole document, to look for invoice details
+
+    Returns:
+        The assessment
+    """
+    chars = sum(len("".join(text.split())) for text in ocr_texts)
+    return TextAssessment(
+        chars_per_page=chars / max(len(ocr_texts), 1),
+        amounts=len(AMOUNT_PATTERN.findall(document_text)),
+        has_vat=bool(VAT_PATTERN.search(document_text)),
+        has_iban=bool(IBAN_PATTERN.search(document_text)),
+    )
+
+def document_source(file_content: Union[bytes, BinaryIO]) -> Optional[str]:
+    """
+    Identify where a PDF comes from by the software that produced it. Invoices of
+    one supplier are generated or scanned the same way, so this lets the OCR tier
+    of a supplier be looked up before its invoice has been read.
+
+    Returns:
+        The tier memory key of the producing software, or None if the PDF does not name it
+    """
+    if isinstance(file_content, bytes):
+        file_content = io.BytesIO(file_content)
+    file_content.seek(0)
+    try:
+        info = PdfReader(file_content).metadata or {}
+    finally:
+        file_content.seek(0)
+    fields = [str(info.get(field) or "").strip() for field in SOURCE_FIELDS]
+    if not any(fields):
+        return None
+    return "source:" + hashlib.sha256("\n".join(fields).encode("utf-8")).hexdigest()
@@ -0,0 +1,76 @@
+import io
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Union, BinaryIO
+from pypdf import PdfReader, PdfWriter
+
+def split_pdf(file_content: Union[bytes, BinaryIO], indexes: Optional[List[int]] = None) -> Dict[int, bytes]:
+    """
+    Write the given pages of a PDF out as single-page PDFs. The output only
+    depends on the page and the resources it uses, so an unchanged page of a
+    re-sent document gets the same bytes and hash. Run it on the CPU executor.
+
+    Args:
+        file_content: Binary content of the PDF file, or a seekable file object
+        indexes: Zero-based indexes of the pages to split off, all pages if None
+
+    Returns:
+        Dict mapping each page index to its single-page PDF
+    """
+    if isinstance(file_content, bytes):
+        file_content = io.BytesIO(file_content)
+    file_content.seek(0)
+
+    reader = PdfReader(file_content)
+    if reader.is_encrypted:
+        raise ValueError("PDF is encrypted")
+
+    if indexes is None:
+        indexes = list(range(len(reader.pages)))
+
+    page_pdfs = {}
+    for index in indexes:
+        writer = PdfWriter()
+        writer.add_page(reader.pages[index])
+        output = io.BytesIO()
+        writer.write(output)
+        page_pdfs[index] = output.getvalue()
+    return page_pdfs
+
+def merge_pdfs(pdfs: List[bytes]) -> bytes:
+    """Combine single-page PDFs into one document, keeping their order"""
+    writer = PdfWriter()
+    for pdf in pdfs:
+        writer.append(PdfReader(io.BytesIO(pdf)))
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+def page_hash(page_pdf: bytes) -> str:
+    """Calculate the SHA-256 hash identifying a single-page PDF"""
+    return hashlib.sha256(page_pdf).hexdigest()
+
+def content_hash(file_content: Union[bytes, BinaryIO], chunk_size: int = 1024 * 1024) -> str:
+    """Calculate the SHA-256 hash of a whole document, reading file objects in chunks"""
+    if isinstance(file_content, bytes):
+        return page_hash(file_content)
+    sha256 = hashlib.sha256()
+    file_content.seek(0)
+    while chunk := file_content.read(chunk_size):
+        sha256.update(chunk)
+    file_content.seek(0)
+    return sha256.hexdigest()
+
+def params_fingerprint(params: Dict[str, Any]) -> str:
+    """Hash OCR options, so cached text is only reused for the same settings"""
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+def page_groups(indexes: List[int], group_size: int) -> List[List[int]]:
+    """Group page indexes into runs of at most group_size consecutive pages"""
+    groups = []
+    for index in indexes:
+        if groups and len(groups[-1]) < group_size and groups[-1][-1] == index - 1:
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+    return groups
@@ -1,20 +1,46 @@
 import os
+import io
+import asyncio
 import logging
-from pathlib import Path
 from termcolor import colored
-from typing import Dict, Any
-from unstract.llmwhisperer import LLMWhispererClientV2
+from typing import Dict, Any, Union, BinaryIO, List, Optional
+from ..executors import cpu_executor
+from ..metrics import metrics
+from ..tier_memory import choose_tiers, tier_outcomes
+from .text_layer import (
+    TEXT_LAYER_ENABLED,
+    extract_text_layer,
+    low_quality_pages,
+    split_pages,
+    join_pages
+)
+from .page_split import split_pdf, merge_pdfs, page_hash, content_hash, params_fingerprint, page_groups
+from .ocr_backends import OCR_BACKENDS, OCRBackend, WhisperBackend, get_backend
+from .ocr_tiers import OCR_MODE_TIERS, OCR_STAGE, assess_text
+from .preflight import (
+    PREFLIGHT_ENABLED,
+    ROUTE_REJECT,
+    ROUTE_SPLIT,
+    PreflightRejected,
+    PreflightReport,
+    inspect_pdf
+)
 
 # Constants
-API_KEY_ENV = "LLMWHISPERER_API_KEY"
 LOGGING_LEVEL = "INFO"
-DEFAULT_TIMEOUT = 300
-FORM_MODE = "form"
-OUTPUT_MODE = "layout_preserving"
-LINE_SPLITTER_TOLERANCE = 0.4
-HORIZONTAL_STRETCH = 1.1
 MAX_FILE_SIZE_MB = 50
 SUPPORTED_EXTENSIONS = ['.pdf', '.PDF']
+# Split documents and OCR their pages concurrently, OCR_PAGES_PER_JOB consecutive pages per job.
+# Off by default since every job is a separate OCR request to poll; pre-flight splits long scans anyway
+OCR_PAGE_PARALLEL = os.getenv("OCR_PAGE_PARALLEL", "0") == "1"
+OCR_PAGES_PER_JOB = int(os.getenv("OCR_PAGES_PER_JOB", "1"))
+# The auto policy uses the text layer and OCRs the remaining pages with OCR_ENGINE,
+# switching to OCR_FALLBACK when that fails. Any backend name forces that backend
+AUTO_POLICY = "auto"
+OCR_BACKEND = os.getenv("OCR_BACKEND", AUTO_POLICY)
+OCR_ENGINE = os.getenv("OCR_ENGINE", "llmwhisperer")
+OCR_FALLBACK = os.getenv("OCR_FALLBACK", "tesseract")
+OCR_POLICIES = [AUTO_POLICY, *OCR_BACKENDS]
 
 # Configure logging
 logging.basicConfig(
@@ -23,12 +49,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def validate_pdf(file_content: bytes, filename: str) -> None:
+def get_file_size(file_content: Union[bytes, BinaryIO]) -> int:
+    """Get the size of binary content or a seekable file object in bytes"""
+    if isinstance(file_content, bytes):
+        return len(file_content)
+    position = file_content.tell()
+    size = file_content.seek(0, io.SEEK_END)
+    file_content.seek(position)
+    return size
+
+def validate_pdf(file_content: Union[bytes, BinaryIO], filename: str) -> None:
     """
     Validate PDF file before processing.
     
     Args:
-        file_content: Binary content of the PDF file
+        file_content: Binary content of the PDF file, or a seekable file object
         filename: Name of the uploaded file
         
     Raises:
@@ -39,77 +74,348 @@ def validate_pdf(file_content: bytes, filename: str) -> None:
         raise ValueError(colored(f"Unsupported file type. Please provide a PDF file.", "red"))
     
     # Check file size
-    file_size_mb = len(file_content) / (1024 * 1024)
+    file_size_mb = get_file_size(file_content) / (1024 * 1024)
     if file_size_mb > MAX_FILE_SIZE_MB:
         raise ValueError(
             colored(f"File size ({file_size_mb:.1f}MB) exceeds maximum allowed size ({MAX_FILE_SIZE_MB}MB)", "red")
         )
 
-def get_api_key() -> str:
-    """Get API key from environment variable."""
-    api_key = os.getenv(API_KEY_ENV)
-    if not api_key:
-        error_msg = f"API Key not found! Please set the {API_KEY_ENV} environment variable"
-        logger.error(error_msg)
-        raise ValueError(colored(error_msg, "red"))
-    return api_key
+async def preflight(file_content: Union[bytes, BinaryIO], filename: str) -> PreflightReport:
+    """
+    Inspect a PDF on the CPU executor before any text extraction or OCR
+    
+    Returns:
+        The pre-flight report with the route to take
+    
+    Raises:
+        PreflightRejected: If the document is rejected
+    """
+    report = await cpu_executor.run(inspect_pdf, file_content)
+    metrics.increment(f"preflight_{report.route}")
+    if report.route == ROUTE_REJECT:
+        print(colored(f"✗ Pre-flight rejected {filename}: {report.reason}", "red"))
+        raise PreflightRejected(report.reason)
+    print(colored(
+        f"  Pre-flight ({report.elapsed_ms:.1f} ms): {report.page_count} pages, "
+        f"{len(report.image_pages)} image-only, route {report.route} ({report.reason}), "
+        f"estimated OCR cost {report.ocr_cost:.2f}", "cyan"
+    ))
+    return report
+
+async def read_text_layer(file_content: Union[bytes, BinaryIO], filename: str) -> Optional[List[str]]:
+    """
+    Read the embedded text layer of a PDF on the CPU executor
+    
+    Returns:
+        The text of each page, or None if the file cannot be parsed locally
+    """
+    try:
+        return await cpu_executor.run(extract_text_layer, file_content)
+    except Exception as e:
+        print(colored(f"  Text layer unavailable for {filename}: {str(e)}", "yellow"))
+        return None
+
+async def split_document(file_content: Union[bytes, BinaryIO], filename: str,
+                         indexes: Optional[List[int]]) -> Optional[Dict[int, bytes]]:
+    """
+    Split pages off a PDF on the CPU executor
+    
+    Returns:
+        Single-page PDFs by page index, or None if the file cannot be split locally
+    """
+    try:
+        return await cpu_executor.run(split_pdf, file_content, indexes)
+    except Exception as e:
+        print(colored(f"  Cannot split {filename} into pages: {str(e)}", "yellow"))
+        return None
+
+async def cached_ocr(backend: OCRBackend, file_content: Union[bytes, BinaryIO],
+                     pages: Optional[List[int]] = None, ocr_cache: Optional[Any] = None) -> str:
+    """
+    OCR a whole document, or some of its pages, reusing text cached for the
+    same document, backend, mode and settings
+    
+    Args:
+        backend: OCR backend
+        file_content: Binary content of the PDF file, or a seekable file object
+        pages: Zero-based indexes of the pages to OCR, all pages if None
+        ocr_cache: Optional store with get_ocr_cache and save_ocr_cache, such as AsyncInvoiceDB
+    
+    Returns:
+        The OCR text
+    """
+    if not ocr_cache:
+        return await backend.ocr(file_content, pages)
+    
+    document_hash = await cpu_executor.run(content_hash, file_content)
+    fingerprint = backend.fingerprint()
+    if pages is not None:
+        fingerprint = params_fingerprint({"params": fingerprint, "pages": pages})
+    cached = await ocr_cache.get_ocr_cache([document_hash], backend.name, backend.mode, fingerprint)
+    if document_hash in cached:
+        print(colored("  Reusing cached OCR text for the document", "cyan"))
+        return cached[document_hash]
+    
+    result_text = await backend.ocr(file_content, pages)
+    if result_text:
+        await ocr_cache.save_ocr_cache({document_hash: result_text}, backend.name, backend.mode, fingerprint)
+    return result_text
+
+async def ocr_page_pdfs(backend: OCRBackend, page_pdfs: Dict[int, bytes],
+                        ocr_cache: Optional[Any] = None) -> Dict[int, str]:
+    """
+    OCR single-page PDFs concurrently, in jobs of OCR_PAGES_PER_JOB consecutive
+    pages. Pages already in the OCR cache for this backend, mode and settings
+    are not sent again, so a re-sent document with one changed page only OCRs that page.
+    
+    Args:
+        backend: OCR backend
+        page_pdfs: Single-page PDFs by page index
+        ocr_cache: Optional store with get_ocr_cache and save_ocr_cache, such as AsyncInvoiceDB
+    
+    Returns:
+        The text of each page by page index
+    """
+    fingerprint = backend.fingerprint()
+    hashes = {index: page_hash(pdf) for index, pdf in page_pdfs.items()}
+    cached = await ocr_cache.get_ocr_cache(
+        list(hashes.values()), backend.name, backend.mode, fingerprint
+    ) if ocr_cache else {}
+    
+    texts = {index: cached[hashes[index]] for index in page_pdfs if hashes[index] in cached}
+    missing = sorted(index for index in page_pdfs if index not in texts)
+    if texts:
+        print(colored(f"  Reusing cached OCR text for {len(texts)} pages", "cyan"))
+    
+    async def ocr_group(group: List[int]) -> Dict[int, str]:
+        if len(group) == 1:
+            pdf = page_pdfs[group[0]]
+        else:
+            pdf = await cpu_executor.run(merge_pdfs, [page_pdfs[index] for index in group])
+        result_text = await backend.ocr(pdf)
+        group_texts = split_pages(result_text)
+        if len(group_texts) != len(group):
+            # Page boundaries got lost, keep the text together at the first page of the job
+            logger.warning(f"Expected {len(group)} OCR pages, got {len(group_texts)}")
+            return {group[0]: result_text, **{index: "" for index in group[1:]}}
+        return dict(zip(group, group_texts))
+    
+    results = await asyncio.gather(*(ocr_group(group) for group in page_groups(missing, OCR_PAGES_PER_JOB)))
+    new_texts = {index: text for result in results for index, text in result.items()}
+    texts.update(new_texts)
+    metrics.increment("ocr_pages", len(missing))
+    metrics.increment("ocr_cached_pages", len(page_pdfs) - len(missing))
+    
+    new_cached = {hashes[index]: text for index, text in new_texts.items() if text}
+    if ocr_cache and new_cached:
+        await ocr_cache.save_ocr_cache(new_cached, backend.name, backend.mode, fingerprint)
+    return texts
+
+async def ocr_document(backend: OCRBackend, file_content: Union[bytes, BinaryIO], filename: str,
+                       pages: Optional[List[int]], ocr_pages: Optional[List[int]],
+                       ocr_cache: Optional[Any] = None, split: Optional[bool] = None) -> str:
+    """
+    OCR the pages the text layer could not cover, or the whole document
+    
+    Args:
+        backend: OCR backend
+        file_content: Binary content of the PDF file, or a seekable file object
+        filename: Name of the uploaded file
+        pages: Text layer of every page, None if it was not read
+        ocr_pages: Indexes of the pages to OCR, all pages if None
+        ocr_cache: Optional cache of OCR text by content hash
+        split: OCR the pages as separate jobs, OCR_PAGE_PARALLEL if None
+    
+    Returns:
+        The text of the whole document
+    """
+    metrics.increment(f"ocr_backend_{backend.name}")
+    split = OCR_PAGE_PARALLEL if split is None else split
+    page_pdfs = await split_document(file_content, filename, ocr_pages) if split else None
+    if page_pdfs:
+        texts = await ocr_page_pdfs(backend, page_pdfs, ocr_cache)
+        merged = list(pages) if pages else [""] * len(texts)
+        for index, text in texts.items():
+            merged[index] = text
+        if pages:
+            metrics.increment("text_layer_pages", len(pages) - len(texts))
+        return join_pages(merged)
+    
+    if ocr_pages and len(ocr_pages) < len(pages):
+        result_text = await cached_ocr(backend, file_content, ocr_pages, ocr_cache)
+        metrics.increment("text_layer_pages", len(pages) - len(ocr_pages))
+        metrics.increment("ocr_pages", len(ocr_pages))
+        return merge_ocr_pages(pages, ocr_pages, result_text)
+    
+    result_text = await cached_ocr(backend, file_content, None, ocr_cache)
+    if pages:
+        metrics.increment("ocr_pages", len(pages))
+    return result_text
+
+async def ocr_tiered(backend: OCRBackend, file_content: Union[bytes, BinaryIO], filename: str,
+                     pages: Optional[List[int]], ocr_pages: Optional[List[int]],
+                     ocr_cache: Optional[Any] = None, tier_store: Optional[Any] = None,
+                     source: Optional[str] = None, split: Optional[bool] = None) -> str:
+    """
+    OCR with the cheapest LLMWhisperer mode of OCR_MODE_TIERS that gives usable
+    text, escalating to the next mode when the OCR'd pages are too sparse or the
+    document lacks amounts and tax or payment details. The outcome of every
+    mode tried is recorded per document source, and the cheaper modes that keep
+    falling short for a source are skipped, see choose_tiers. Backends without
+    modes OCR once.
+    
+    Args:
+        backend: OCR backend
+        file_content: Binary content of the PDF file, or a seekable file object
+        filename: Name of the uploaded file
+        pages: Text layer of every page, None if it was not read
+        ocr_pages: Indexes of the pages to OCR, all pages if None
+        ocr_cache: Optional cache of OCR text by content hash
+        tier_store: Optional store with get_tier_stats and record_tier_outcomes, such as AsyncInvoiceDB
+        source: Document source key of the PDF, see document_source. Tiers are only remembered if set
+        split: OCR the pages as separate jobs, OCR_PAGE_PARALLEL if None
+    
+    Returns:
+        The text of the whole document
+    """
+    if not isinstance(backend, WhisperBackend) or len(OCR_MODE_TIERS) < 2:
+        return await ocr_document(backend, file_content, filename, pages, ocr_pages, ocr_cache, split)
+    
+    source = source if tier_store else None
+    stats = {}
+    if source:
+        try:
+            stats = await tier_store.get_tier_stats(OCR_STAGE, [source])
+        except Exception as e:
+            print(colored(f"  Could not look up the OCR tiers: {str(e)}", "yellow"))
+    tiers = choose_tiers(OCR_MODE_TIERS, stats.get(source, {}))
+    if tiers[0] != OCR_MODE_TIERS[0]:
+        print(colored(f"  Starting OCR at the {tiers[0]} tier, cheaper modes keep falling short for this source", "cyan"))
+    
+    for tier in tiers:
+        result_text = await ocr_document(backend.with_mode(tier), file_content, filename, pages, ocr_pages,
+                                         ocr_cache, split)
+        if tier == tiers[-1]:
+            break
+        texts = split_pages(result_text)
+        if ocr_pages and pages and len(texts) == len(pages):
+            texts = [texts[index] for index in ocr_pages]
+        assessment = assess_text(texts, result_text)
+        if assessment.sufficient:
+            break
+        print(colored(f"  OCR in {tier} mode is not good enough ({assessment.chars_per_page:.0f} chars/page, "
+                      f"{assessment.amounts} amounts), escalating", "yellow"))
+        metrics.increment("ocr_tier_escalations")
+    
+    metrics.increment(f"ocr_tier_{tier}")
+    if source:
+        # The OCR text is paid for, a tier memory failure must not throw it away
+        try:
+            await tier_store.record_tier_outcomes(OCR_STAGE, source, tier_outcomes(tiers, tier))
+        except Exception as e:
+            print(colored(f"  Could not record the OCR tiers: {str(e)}", "yellow"))
+    return result_text
 
-async def process_pdf(file_content: bytes, filename: str) -> Dict[str, Any]:
+async def process_pdf(file_content: Union[bytes, BinaryIO], filename: str,
+                      ocr_cache: Optional[Any] = None, ocr_backend: Optional[str] = None,
+                      tier_store: Optional[Any] = None, source: Optional[str] = None) -> str:
     """
-    Process a PDF file using LLMWhisperer with optimal settings.
+    Process a PDF file. With the auto policy the embedded text layer is used
+    where it is good enough, and scanned or low quality pages go to OCR_ENGINE,
+    falling back to OCR_FALLBACK when it fails. Naming a backend forces it for
+    the whole document. With OCR_PAGE_PARALLEL the pages to OCR are split off
+    and OCR'd concurrently, and the text is stitched back together in page order.
+    LLMWhisperer tries the cheaper modes of OCR_MODE_TIERS first. A pre-flight
+    inspection rejects unusable documents and skips the text layer of scans
+    before anything expensive runs.
     
     Args:
-        file_content: Binary content of the PDF file
+        file_content: Binary content of the PDF file, or a seekable file object
         filename: Name of the uploaded file
+        ocr_cache: Optional cache of OCR text by content hash, such as AsyncInvoiceDB
+        ocr_backend: One of OCR_POLICIES, OCR_BACKEND if None
+        tier_store: Optional store of the OCR tier per document source, such as AsyncInvoiceDB
+        source: Document source key of the PDF for the tier store, see document_source
     
     Returns:
-        Dict containing the extraction results
+        The extracted text
+    
+    Raises:
+        PreflightRejected: If pre-flight inspection rejects the document
     """
     try:
         print(colored("→ Starting PDF processing...", "cyan"))
         print(colored(f"  File: {filename}", "cyan"))
         
+        policy = ocr_backend or OCR_BACKEND
+        if policy not in OCR_POLICIES:
+            raise ValueError(f"Unknown OCR backend '{policy}', choose from {', '.join(OCR_POLICIES)}")
+        
         # Validate PDF
         validate_pdf(file_content, filename)
         
-        # Get API key and initialize client
-        api_key = get_api_key()
-        client = LLMWhispererClientV2(api_key=api_key)
-        
-        # Save temporary file
-        temp_dir = Path("temp_uploads")
-        temp_dir.mkdir(exist_ok=True)
-        temp_file = temp_dir / filename
+        # Reject broken, locked or oversized documents before any OCR, and route the rest
+        report = await preflight(file_content, filename) if PREFLIGHT_ENABLED else None
+        split = True if report and report.route == ROUTE_SPLIT else None
         
-        try:
-            # Write temporary file
-            with open(temp_file, "wb") as f:
-                f.write(file_content)
-            
-            # Process with LLMWhisperer
-            result = client.whisper(
-                file_path=str(temp_file),
-                wait_for_completion=True,
-                wait_timeout=DEFAULT_TIMEOUT,
-                mode=FORM_MODE,
-                output_mode=OUTPUT_MODE,
-                line_splitter_tolerance=LINE_SPLITTER_TOLERANCE,
-                horizontal_stretch_factor=HORIZONTAL_STRETCH,
-            )
-            
-            # Validate response
-            if not isinstance(result, dict) or 'extraction' not in result:
-                raise RuntimeError("Invalid response from API")
+        if policy == "text_layer":
+            result_text = await ocr_document(get_backend(policy), file_content, filename, None, None,
+                                             ocr_cache, split)
+        elif policy != AUTO_POLICY:
+            result_text = await ocr_tiered(get_backend(policy), file_content, filename, None, None,
+                                           ocr_cache, tier_store, source, split)
+        else:
+            # Image-only and encrypted documents have no text layer worth reading
+            has_text_layer = not report or (report.text_pages and not report.encrypted)
+            pages = await read_text_layer(file_content, filename) if TEXT_LAYER_ENABLED and has_text_layer else None
+            ocr_pages = low_quality_pages(pages) if pages else None
+            if pages and not ocr_pages:
+                metrics.increment("text_layer_pages", len(pages))
+                print(colored(f"✓ Used the text layer of all {len(pages)} pages, skipping OCR", "green"))
+                return join_pages(pages)
             
-            print(colored("✓ PDF processing completed successfully", "green"))
-            return result['extraction']['result_text']
-            
-        finally:
-            # Cleanup temporary file
-            if temp_file.exists():
-                temp_file.unlink()
+            # OCR only the pages the text layer could not cover
+            engine = get_backend(OCR_ENGINE)
+            try:
+                result_text = await ocr_tiered(engine, file_content, filename, pages, ocr_pages,
+                                               ocr_cache, tier_store, source, split)
+            except Exception as e:
+                fallback = get_backend(OCR_FALLBACK) if OCR_FALLBACK else None
+                if not fallback or fallback is engine or not fallback.available():
+                    raise
+                print(colored(f"  OCR with {engine.name} failed ({str(e)}), falling back to {fallback.name}", "yellow"))
+                metrics.increment("ocr_fallbacks")
+                result_text = await ocr_document(fallback, file_content, filename, pages, ocr_pages,
+                                                 ocr_cache, split)
+        
+        print(colored("✓ PDF processing completed successfully", "green"))
+        return result_text
             
     except Exception as e:
         error_msg = f"Error processing PDF: {str(e)}"
         logger.error(error_msg)
-        raise 
\ No newline at end of file
+        raise
+
+def merge_ocr_pages(pages: List[str], ocr_pages: List[int], ocr_text: str) -> str:
+    """
+    Replace the low quality pages of the text layer with their OCR text, keeping page order
+    
+    Args:
+        pages: Text layer of every page
+        ocr_pages: Indexes of the pages that were sent to OCR
+        ocr_text: LLMWhisperer output for those pages
+    
+    Returns:
+        The text of the whole document
+    """
+    ocr_texts = split_pages(ocr_text)
+    if len(ocr_texts) != len(ocr_pages):
+        # Page boundaries got lost, keep the OCR text together at the first OCR page
+        logger.warning(f"Expected {len(ocr_pages)} OCR pages, got {len(ocr_texts)}")
+        ocr_texts = [ocr_text] + [""] * (len(ocr_pages) - 1)
+    
+    merged = list(pages)
+    for index, text in zip(ocr_pages, ocr_texts):
+        merged[index] = text
+    # Blank pages stay as empty entries, so page indexes still match the PDF
+    return join_pages(merged)
@@ -0,0 +1,166 @@
+import io
+import os
+import time
+from dataclasses import dataclass, field
+from typing import BinaryIO, List, Tuple, Union
+from pypdf import PdfReader
+from pypdf.generic import DictionaryObject
+
+# Constants
+PDF_MAGIC = b"%PDF-"
+# The header may follow a little junk, readers accept it within the first KB
+HEADER_WINDOW = 1024
+EOF_MARKER = b"%%EOF"
+EOF_WINDOW = 2048
+PREFLIGHT_ENABLED = os.getenv("PREFLIGHT_ENABLED", "1") == "1"
+PREFLIGHT_MAX_PAGES = int(os.getenv("PREFLIGHT_MAX_PAGES", "100"))
+# Documents with more pages to OCR than this are OCR'd page by page, whatever OCR_PAGE_PARALLEL says
+PREFLIGHT_SPLIT_PAGES = int(os.getenv("PREFLIGHT_SPLIT_PAGES", "10"))
+# Estimated OCR price and time per page, for logging and rejecting bundles
+OCR_COST_PER_PAGE = float(os.getenv("OCR_COST_PER_PAGE", "0.01"))
+OCR_SECONDS_PER_PAGE = float(os.getenv("OCR_SECONDS_PER_PAGE", "3"))
+PREFLIGHT_MAX_OCR_COST = float(os.getenv("PREFLIGHT_MAX_OCR_COST", "0.5"))
+# Nesting of form XObjects followed when looking for images
+MAX_XOBJECT_DEPTH = 3
+
+# Routing decisions
+ROUTE_REJECT = "reject"
+ROUTE_TEXT_LAYER = "text_layer"
+ROUTE_OCR = "ocr"
+ROUTE_SPLIT = "split"
+
+class PreflightRejected(ValueError):
+    """Raised when pre-flight inspection rejects a document before any OCR"""
+
+@dataclass
+class PreflightReport:
+    """What a PDF looks like before it is processed, and where it should go"""
+    route: str
+    reason: str = ""
+    page_count: int = 0
+    encrypted: bool = False
+    text_pages: List[int] = field(default_factory=list)
+    image_pages: List[int] = field(default_factory=list)
+    ocr_cost: float = 0.0
+    ocr_seconds: float = 0.0
+    elapsed_ms: float = 0.0
+
+def resolve(obj):
+    """Follow an indirect reference"""
+    return obj.get_object() if hasattr(obj, "get_object") else obj
+
+def page_content_kinds(resources, depth: int = 0) -> Tuple[bool, bool]:
+    """
+    Check the resources of a page, and of the forms it draws, for fonts and images
+
+    Returns:
+        Tuple (has_fonts, has_images)
+    """
+    resources = resolve(resources)
+    if not isinstance(resources, DictionaryObject):
+        return False, False
+    has_fonts = bool(resolve(resources.get("/Font")))
+    has_images = False
+    xobjects = resolve(resources.get("/XObject")) or {}
+    for xobject in xobjects.values():
+        xobject = resolve(xobject)
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            has_images = True
+        elif subtype == "/Form" and depth < MAX_XOBJECT_DEPTH:
+            form_fonts, form_images = page_content_kinds(xobject.get("/Resources"), depth + 1)
+            has_fonts = has_fonts or form_fonts
+            has_images = has_images or form_images
+        if has_fonts and has_images:
+            break
+    return has_fonts, has_images
+
+def read_edges(file_content: Union[bytes, BinaryIO]) -> Tuple[bytes, bytes]:
+    """Read the start and the end of a document without reading all of it"""
+    if isinstance(file_content, bytes):
+        return file_content[:HEADER_WINDOW], file_content[-EOF_WINDOW:]
+    file_content.seek(0)
+    head = file_content.read(HEADER_WINDOW)
+    size = file_content.seek(0, io.SEEK_END)
+    file_content.seek(max(0, size - EOF_WINDOW))
+    tail = file_content.read()
+    file_content.seek(0)
+    return head, tail
+
+def inspect_pdf(file_content: Union[bytes, BinaryIO]) -> PreflightReport:
+    """
+    Inspect a PDF without extracting text or rendering anything: check the
+    magic bytes and end marker, detect encryption, count pages, and tell pages
+    with a text layer (fonts) from image-only pages (scans). Estimates the OCR
+    cost and decides the route. Only the header, xref and page dictionaries
+    are read, so this takes milliseconds; run it on the CPU executor.
+
+    Args:
+        file_content: Binary content of the PDF file, or a seekable file object
+
+    Returns:
+        PreflightReport with route reject, text_layer, ocr or split
+    """
+    start = time.perf_counter()
+
+    def done(report: PreflightReport) -> PreflightReport:
+        # Reading the page dictionaries moves the file, the next stage reads it from the start
+        if not isinstance(file_content, bytes):
+            file_content.seek(0)
+        report.elapsed_ms = (time.perf_counter() - start) * 1000
+        return report
+
+    head, tail = read_edges(file_content)
+    if PDF_MAGIC not in head:
+        return done(PreflightReport(ROUTE_REJECT, "Not a PDF file (missing %PDF- header)"))
+    if EOF_MARKER not in tail:
+        return done(PreflightReport(ROUTE_REJECT, "PDF is truncated (missing %%EOF marker)"))
+
+    if isinstance(file_content, bytes):
+        file_content = io.BytesIO(file_content)
+    file_content.seek(0)
+    try:
+        reader = PdfReader(file_content)
+        encrypted = reader.is_encrypted
+        # Documents with only an owner password open with an empty user password
+        if encrypted and not reader.decrypt(""):
+            return done(PreflightReport(ROUTE_REJECT, "PDF is password protected", encrypted=True))
+        pages = reader.pages
+        page_count = len(pages)
+    except Exception as e:
+        return done(PreflightReport(ROUTE_REJECT, f"PDF cannot be parsed: {str(e)}"))
+
+    report = PreflightReport(ROUTE_TEXT_LAYER, page_count=page_count, encrypted=encrypted)
+    if page_count == 0:
+        report.route, report.reason = ROUTE_REJECT, "PDF has no pages"
+        return done(report)
+    if page_count > PREFLIGHT_MAX_PAGES:
+        report.route = ROUTE_REJECT
+        report.reason = f"PDF has {page_count} pages, more than the maximum of {PREFLIGHT_MAX_PAGES}"
+        return done(report)
+
+    for index, page in enumerate(pages):
+        has_fonts, has_images = page_content_kinds(page.get("/Resources"))
+        if has_fonts:
+            report.text_pages.append(index)
+        elif has_images:
+            report.image_pages.append(index)
+
+    # Encrypted documents cannot be read locally, so all their pages need OCR
+    ocr_page_count = page_count if encrypted else len(report.image_pages)
+    report.ocr_cost = ocr_page_count * OCR_COST_PER_PAGE
+    report.ocr_seconds = ocr_page_count * OCR_SECONDS_PER_PAGE
+
+    if report.ocr_cost > PREFLIGHT_MAX_OCR_COST:
+        report.route = ROUTE_REJECT
+        report.reason = (f"OCR of {ocr_page_count} pages would cost about {report.ocr_cost:.2f}, "
+                         f"more than the maximum of {PREFLIGHT_MAX_OCR_COST:.2f}")
+    elif ocr_page_count > PREFLIGHT_SPLIT_PAGES:
+        report.route = ROUTE_SPLIT
+        report.reason = f"{ocr_page_count} pages to OCR"
+    elif ocr_page_count:
+        report.route = ROUTE_OCR
+        report.reason = f"{ocr_page_count} of {page_count} pages have no text layer"
+    else:
+        report.reason = "Every page has a text layer"
+    return done(report)
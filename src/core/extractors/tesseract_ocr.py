@@ -0,0 +1,55 @@
+import os
+import shutil
+from typing import List, Optional
+
+# Optional dependencies for the local OCR engine
+try:
+    import pypdfium2 as pdfium
+    import pytesseract
+except ImportError:
+    pdfium = None
+    pytesseract = None
+
+# Constants
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "nld+eng")
+TESSERACT_DPI = int(os.getenv("TESSERACT_DPI", "300"))
+# Assume a single uniform block of text and keep the spacing between columns
+TESSERACT_CONFIG = "--psm 6 -c preserve_interword_spaces=1"
+PDF_POINTS_PER_INCH = 72
+
+def tesseract_available() -> bool:
+    """Check that the Python packages and the tesseract binary are installed"""
+    if pdfium is None or pytesseract is None:
+        return False
+    return shutil.which(pytesseract.pytesseract.tesseract_cmd) is not None
+
+def tesseract_pdf(pdf: bytes, pages: Optional[List[int]] = None,
+                  lang: str = TESSERACT_LANG, dpi: int = TESSERACT_DPI) -> List[str]:
+    """
+    Render PDF pages to images and OCR them with Tesseract. This is CPU bound,
+    so run it in the OCR process pool; it only takes picklable arguments.
+
+    Args:
+        pdf: Binary content of the PDF file
+        pages: Zero-based indexes of the pages to OCR, all pages if None
+        lang: Tesseract language codes
+        dpi: Render resolution
+
+    Returns:
+        The text of each requested page
+    """
+    if not tesseract_available():
+        raise RuntimeError("Tesseract OCR needs pypdfium2, pytesseract and the tesseract binary")
+
+    document = pdfium.PdfDocument(pdf)
+    try:
+        indexes = pages if pages is not None else range(len(document))
+        texts = []
+        for index in indexes:
+            page = document[index]
+            image = page.render(scale=dpi / PDF_POINTS_PER_INCH).to_pil()
+            texts.append(pytesseract.image_to_string(image, lang=lang, config=TESSERACT_CONFIG))
+            page.close()
+        return texts
+    finally:
+        document.close()
@@ -0,0 +1,99 @@
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Set
+from .text_layer import PAGE_SEPARATOR, join_pages
+
+# Optional dependency for exact token counts
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Constants
+TEXT_COMPACTION = os.getenv("TEXT_COMPACTION", "1") == "1"
+# Runs of at least this many spaces separate columns
+COLUMN_GAP = int(os.getenv("COMPACT_COLUMN_GAP", "3"))
+COLUMN_SEPARATOR = os.getenv("COMPACT_COLUMN_SEPARATOR", " | ")
+REMOVE_REPEATED = os.getenv("COMPACT_REMOVE_REPEATED", "1") == "1"
+# Lines at the top and bottom of each page that may be a running header or footer
+EDGE_LINES = 6
+TOKEN_MODEL = "gpt-4o"
+CHARS_PER_TOKEN = 4
+
+@dataclass
+class CompactionOptions:
+    """Settings for compact_text, defaulting to the environment configuration"""
+    column_gap: int = COLUMN_GAP
+    column_separator: str = COLUMN_SEPARATOR
+    remove_repeated: bool = REMOVE_REPEATED
+
+def line_key(line: str) -> str:
+    """Normalize a line for header/footer matching, so page numbers and dates still match"""
+    return re.sub(r"\d+", "#", " ".join(line.split()))
+
+def edge_keys(lines: List[str]) -> Set[str]:
+    """Get the keys of the first and last non-empty lines of a page"""
+    content = [line for line in lines if line.strip()]
+    edges = content[:EDGE_LINES] + content[-EDGE_LINES:]
+    return {line_key(line) for line in edges}
+
+def repeated_edge_keys(pages: List[List[str]]) -> Set[str]:
+    """Find lines that recur at the top or bottom of at least two pages"""
+    if len(pages) < 2:
+        return set()
+    counts = Counter(key for lines in pages for key in edge_keys(lines))
+    return {key for key, count in counts.items() if count >= 2 and key.strip("#")}
+
+def compact_line(line: str, options: CompactionOptions) -> str:
+    """Drop indentation and trailing space, and turn wide gaps into column separators"""
+    gap = re.compile(r" {%d,}" % options.column_gap)
+    return gap.sub(options.column_separator, line.strip())
+
+def compact_text(text: str, options: CompactionOptions = None) -> str:
+    """
+    Shrink layout preserving OCR output before it goes into the prompt.
+    Padding whitespace is removed while wide gaps become a column separator,
+    blank lines are collapsed, and headers and footers repeated on every page
+    are only kept on the first page they appear on.
+
+    Args:
+        text: OCR or text layer output, pages separated by PAGE_SEPARATOR
+        options: Compaction settings, the environment configuration if None
+
+    Returns:
+        The compacted text
+    """
+    options = options or CompactionOptions()
+    pages = [page.strip("\f").splitlines() for page in text.split(PAGE_SEPARATOR)]
+    repeated = repeated_edge_keys(pages) if options.remove_repeated else set()
+
+    seen = set()
+    compacted = []
+    for lines in pages:
+        edges = edge_keys(lines)
+        kept = []
+        for line in lines:
+            key = line_key(line)
+            if key in repeated and key in edges:
+                if key in seen:
+                    continue
+                seen.add(key)
+            line = compact_line(line, options)
+            # Keep at most one blank line in a row
+            if line or (kept and kept[-1]):
+                kept.append(line)
+        page = "\n".join(kept).strip("\n")
+        if page:
+            compacted.append(page)
+    return join_pages(compacted)
+
+def count_tokens(text: str) -> int:
+    """Count prompt tokens with tiktoken, or estimate them if it is not available"""
+    if tiktoken is not None:
+        try:
+            return len(tiktoken.encoding_for_model(TOKEN_MODEL).encode(text))
+        except Exception:
+            pass
+    return len(text) // CHARS_PER_TOKEN
@@ -0,0 +1,96 @@
+import os
+import io
+import re
+import unicodedata
+from termcolor import colored
+from typing import List, Union, BinaryIO
+from pypdf import PdfReader
+
+# Constants
+TEXT_LAYER_ENABLED = os.getenv("TEXT_LAYER_ENABLED", "1") == "1"
+TEXT_LAYER_MIN_SCORE = float(os.getenv("TEXT_LAYER_MIN_SCORE", "0.6"))
+MIN_PAGE_CHARS = 50
+MAX_WORD_LENGTH = 40
+PAGE_SEPARATOR = "<<<"
+WORD_PATTERN = re.compile(r"^[\w€$£%.,:;/()'&@#*+=\-–]+$")
+
+def extract_text_layer(file_content: Union[bytes, BinaryIO]) -> List[str]:
+    """
+    Extract the embedded text of every page of a PDF, keeping the layout.
+    This parses the whole file, so run it on the CPU executor.
+
+    Args:
+        file_content: Binary content of the PDF file, or a seekable file object
+
+    Returns:
+        List with the text of each page, empty for pages without a text layer
+    """
+    if isinstance(file_content, bytes):
+        file_content = io.BytesIO(file_content)
+    file_content.seek(0)
+
+    reader = PdfReader(file_content)
+    if reader.is_encrypted:
+        raise ValueError("PDF is encrypted")
+
+    pages = []
+    for page in reader.pages:
+        # Layout mode fails on pages without a content stream, such as inserted blank pages
+        text = page.extract_text(extraction_mode="layout") or "" if "/Contents" in page else ""
+        # Fold ligatures such as "ﬂ" into plain letters
+        pages.append(unicodedata.normalize("NFKC", text))
+    return pages
+
+def score_page_text(text: str) -> float:
+    """
+    Score how usable the text layer of a page is, from 0 (missing or garbage) to 1.
+    Scanned pages have little or no text; broken font encodings show up as
+    unprintable characters, (cid:..) codes or long runs without word structure.
+
+    Args:
+        text: Extracted text of one page
+
+    Returns:
+        Quality score between 0 and 1
+    """
+    compact = "".join(text.split())
+    if len(compact) < MIN_PAGE_CHARS:
+        return 0.0
+    if "(cid:" in text or "\ufffd" in text:
+        return 0.0
+
+    printable = sum(c.isprintable() for c in compact) / len(compact)
+    alnum = sum(c.isalnum() for c in compact) / len(compact)
+    words = text.split()
+    wordlike = sum(
+        1 for word in words
+        if len(word) <= MAX_WORD_LENGTH and WORD_PATTERN.match(word)
+    ) / len(words)
+
+    # Invoices are mostly letters and digits, scale so 60% alphanumeric counts as clean
+    return printable * min(1.0, alnum / 0.6) * wordlike
+
+def low_quality_pages(pages: List[str], min_score: float = TEXT_LAYER_MIN_SCORE) -> List[int]:
+    """Get the indexes of pages whose text layer scores below min_score"""
+    low = []
+    for index, text in enumerate(pages):
+        score = score_page_text(text)
+        if score < min_score:
+            print(colored(f"  Page {index + 1}: text layer score {score:.2f}, needs OCR", "yellow"))
+            low.append(index)
+    return low
+
+def split_pages(text: str) -> List[str]:
+    """Split OCR output into pages on the page separator"""
+    pages = [page.strip("\n\f") for page in text.split(PAGE_SEPARATOR)]
+    # The separator also closes the last page
+    if pages and not pages[-1].strip():
+        pages.pop()
+    return pages
+
+def join_pages(pages: List[str]) -> str:
+    """
+    Join page texts the way LLMWhisperer separates pages, closing every page
+    with the separator so split_pages keeps a blank last page
+    """
+    return "".join(f"{page}\n{PAGE_SEPARATOR}\n" for page in pages)
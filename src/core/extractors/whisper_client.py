@@ -0,0 +1,160 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterator, BinaryIO, Dict, Optional, Union
+import httpx
+from termcolor import colored
+from ..executors import cpu_executor
+from ..concurrency import ocr_limiter
+from ..metrics import metrics
+
+# Constants
+BASE_URL_ENV = "LLMWHISPERER_BASE_URL_V2"
+BASE_URL_V2 = "https://llmwhisperer-api.us-central.unstract.com/api/v2"
+MAX_CONNECTIONS = int(os.getenv("WHISPER_MAX_CONNECTIONS", "20"))
+REQUEST_TIMEOUT = 120
+POLL_INITIAL = 0.5
+POLL_FACTOR = 1.5
+POLL_MAX = 5.0
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+class WhisperError(RuntimeError):
+    """An LLMWhisperer request failed or the job ended in an error"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class AsyncWhisperClient:
+    """
+    Async LLMWhisperer v2 client. A job is submitted, its status is polled
+    with a backoff that grows from POLL_INITIAL to POLL_MAX seconds, and the
+    text is retrieved once processed. Waiting costs no thread, and all jobs
+    share one pooled HTTP client, so hundreds of jobs can be in flight at once.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None,
+                 max_connections: int = MAX_CONNECTIONS):
+        self.base_url = (base_url or os.getenv(BASE_URL_ENV, BASE_URL_V2)).rstrip("/")
+        self.http = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"unstract-key": api_key},
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            # 429s and rate limit headers steer the OCR concurrency limit
+            event_hooks={"response": [ocr_limiter.observe_response]},
+        )
+
+    async def close(self):
+        """Close the pooled connections"""
+        await self.http.aclose()
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a request and raise WhisperError on anything but 200 or 202"""
+        response = await self.http.request(method, path, **kwargs)
+        if response.status_code not in (200, 202):
+            try:
+                message = response.json().get("message", response.text)
+            except ValueError:
+                message = response.text
+            raise WhisperError(f"{method} {path} failed: {message}", response.status_code)
+        return response
+
+    async def submit(self, file_content: Union[bytes, BinaryIO], params: Dict[str, Any]) -> Dict:
+        """
+        Submit a document for extraction
+
+        Args:
+            file_content: Binary content of the PDF file, or a seekable file object
+            params: Whisper options such as mode and output_mode
+
+        Returns:
+            The response, holding whisper_hash for an accepted job or the extraction itself
+        """
+        content = file_content if isinstance(file_content, bytes) else read_chunks(file_content)
+        response = await self._request("POST", "/whisper", params=params, content=content)
+        return response.json()
+
+    async def status(self, whisper_hash: str) -> Dict:
+        """Get the status of a submitted job"""
+        response = await self._request("GET", "/whisper-status", params={"whisper_hash": whisper_hash})
+        return response.json()
+
+    async def retrieve(self, whisper_hash: str) -> Dict:
+        """Get the extraction of a processed job"""
+        response = await self._request("GET", "/whisper-retrieve", params={"whisper_hash": whisper_hash})
+        return response.json()
+
+    async def whisper(self, file_content: Union[bytes, BinaryIO], params: Dict[str, Any],
+                      wait_timeout: float) -> str:
+        """
+        Extract the text of a document: submit it, poll until it is processed and retrieve the text
+
+        Args:
+            file_content: Binary content of the PDF file, or a seekable file object
+            params: Whisper options such as mode and output_mode
+            wait_timeout: Seconds to wait for the job before giving up
+
+        Returns:
+            The extracted text
+        """
+        submitted = await self.submit(file_content, params)
+        metrics.increment("whisper_submitted")
+        if "whisper_hash" not in submitted:
+            # Synchronous response, the extraction is already in the body
+            return result_text(submitted.get("extraction", submitted))
+
+        whisper_hash = submitted["whisper_hash"]
+        deadline = time.monotonic() + wait_timeout
+        delay = POLL_INITIAL
+        while True:
+            await asyncio.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+            try:
+                status = await self.status(whisper_hash)
+            except httpx.TransportError as e:
+                # A dropped poll is not a failed job, try again on the next tick
+                logger.warning(f"Whisper-hash:{whisper_hash} | status poll failed: {str(e)}")
+                status = {"status": "processing"}
+            metrics.increment("whisper_polls")
+
+            state = status.get("status", "")
+            if state == "processed":
+                return result_text(await self.retrieve(whisper_hash))
+            if "error" in state:
+                raise WhisperError(f"Whisper job {whisper_hash} failed: {status.get('message', state)}")
+            if time.monotonic() >= deadline:
+                raise WhisperError(f"Whisper job {whisper_hash} timed out after {wait_timeout}s")
+            delay = min(delay * POLL_FACTOR, POLL_MAX)
+
+async def read_chunks(file: BinaryIO) -> AsyncIterator[bytes]:
+    """Stream a file object as the request body, reading on the CPU executor"""
+    await cpu_executor.run(file.seek, 0)
+    while chunk := await cpu_executor.run(file.read, UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+def result_text(extraction: Dict) -> str:
+    """Get the text from an extraction, raising if the response has none"""
+    if not isinstance(extraction, dict) or "result_text" not in extraction:
+        raise RuntimeError("Invalid response from API")
+    return extraction["result_text"]
+
+# One client for the whole process, created on first use
+_client: Optional[AsyncWhisperClient] = None
+
+def get_whisper_client(api_key: str) -> AsyncWhisperClient:
+    """Get the shared client, creating it on first use"""
+    global _client
+    if _client is None:
+        _client = AsyncWhisperClient(api_key)
+        print(colored(f"✓ LLMWhisperer client ready: {_client.base_url}", "green"))
+    return _client
+
+async def close_whisper_client():
+    """Close the shared client, if it was created"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1,29 @@
+"""
+In-process metrics exposed on the /metrics endpoint
+"""
+
+from typing import Any, Callable, Dict
+
+class Metrics:
+    """Registry of counters and gauges, gauges are read from callbacks when a snapshot is taken"""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, Callable[[], Any]] = {}
+
+    def increment(self, name: str, value: int = 1):
+        """Increase a counter"""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def register_gauge(self, name: str, fn: Callable[[], Any]):
+        """Register a callback returning the current value of a gauge"""
+        self.gauges[name] = fn
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get the current value of all counters and gauges"""
+        snapshot = dict(self.counters)
+        for name, fn in self.gauges.items():
+            snapshot[name] = fn()
+        return snapshot
+
+metrics = Metrics()
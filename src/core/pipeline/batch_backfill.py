@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Backfill extractions through the OpenAI Batch API
+
+Stored text content without a JSON result (or all stored text with --reprocess)
+is turned into a JSONL file of chat completion requests with the same messages
+and InvoiceDetail tool schema as the real-time path. The file is submitted as a
+batch, polled until it finishes, and each response is validated through the
+Pydantic models and stored with InvoiceDB. Batches cost half the real-time
+price and do not count against the real-time rate limits.
+
+Point OPENAI_BASE_URL at tools/openai_batch_server.py to run it locally.
+
+Usage:
+    python -m src.core.pipeline.batch_backfill [--db invoice_data.db] [--limit 1000] [--reprocess]
+    python -m src.core.pipeline.batch_backfill --batch-id batch_abc123   # resume polling a submitted batch
+"""
+
+import io
+import os
+import json
+import time
+import asyncio
+import argparse
+from typing import Any, Dict, List, Optional, Tuple
+from termcolor import colored
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+from instructor import openai_schema
+from ...models.pydantic.invoice_detail import InvoiceDetail
+from ..db.database import DATABASE_FILE, InvoiceDB
+from ..extractors.invoice_extractor import LLM_MODEL, LLM_TEMPERATURE, LLM_TOP_P, prepare_messages
+from ..extractors.invoice_segments import SPLIT_INVOICES, InvoiceSegment, segment_invoices, combine_invoices
+
+# Constants
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+# The Batch API accepts up to 50,000 requests per batch
+BATCH_MAX_REQUESTS = 50000
+FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# The InvoiceDetail function definition instructor sends in TOOLS mode
+invoice_tool = openai_schema(InvoiceDetail)
+
+def document_segments(text_content: str) -> List[InvoiceSegment]:
+    """Split a document into invoices the same way the real-time pipeline does"""
+    segments = segment_invoices(text_content) if SPLIT_INVOICES else []
+    return segments if len(segments) > 1 else []
+
+def custom_id(file_hash: str, segment: int) -> str:
+    """Identify a request by file and invoice segment"""
+    return f"{file_hash}:{segment}"
+
+def batch_request(request_id: str, text: str) -> Dict[str, Any]:
+    """Build one line of the batch input file"""
+    return {
+        "custom_id": request_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": LLM_MODEL,
+            "temperature": LLM_TEMPERATURE,
+            "top_p": LLM_TOP_P,
+            "messages": prepare_messages(text),
+            "tools": [{"type": "function", "function": invoice_tool.openai_schema}],
+            "tool_choice": {"type": "function", "function": {"name": invoice_tool.openai_schema["name"]}},
+        },
+    }
+
+def build_batch_file(rows: List[Dict]) -> bytes:
+    """
+    Turn stored text content into a JSONL batch input file, one request per
+    invoice. Documents with several invoices get one request per segment
+    """
+    lines = []
+    for row in rows:
+        segments = document_segments(row['text_content'])
+        texts = [segment.text for segment in segments] or [row['text_content']]
+        for index, text in enumerate(texts):
+            lines.append(json.dumps(batch_request(custom_id(row['file_hash'], index), text)))
+    if len(lines) > BATCH_MAX_REQUESTS:
+        raise ValueError(f"{len(lines)} requests exceed the batch limit of {BATCH_MAX_REQUESTS}, use --limit")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+def parse_result(line: Dict) -> Tuple[str, Optional[Dict], Optional[str]]:
+    """
+    Validate one line of the batch output through the Pydantic models
+
+    Returns:
+        Tuple (custom_id, result dict or None, error message or None)
+    """
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code") != 200:
+        error = line.get("error") or response.get("body", {}).get("error")
+        return line["custom_id"], None, f"Request failed: {error}"
+    try:
+        completion = ChatCompletion.model_validate(response["body"])
+        invoice = invoice_tool.from_response(completion)
+        return line["custom_id"], invoice.model_dump(mode='json'), None
+    except Exception as e:
+        return line["custom_id"], None, f"Validation failed: {str(e)}"
+
+async def submit_batch(client: AsyncOpenAI, batch_file: bytes) -> str:
+    """Upload the input file and create the batch, returning the batch id"""
+    uploaded = await client.files.create(file=("invoices.jsonl", io.BytesIO(batch_file)), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+        metadata={"description": "invoice extraction backfill"},
+    )
+    print(colored(f"✓ Submitted batch {batch.id}", "green"))
+    return batch.id
+
+async def wait_for_batch(client: AsyncOpenAI, batch_id: str, poll_seconds: float = BATCH_POLL_SECONDS):
+    """Poll a batch until it reaches a final status"""
+    while True:
+        batch = await client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        progress = f"{counts.completed}/{counts.total} done, {counts.failed} failed" if counts else ""
+        print(colored(f"  Batch {batch_id}: {batch.status} {progress}", "cyan"))
+        if batch.status in FINAL_STATUSES:
+            return batch
+        await asyncio.sleep(poll_seconds)
+
+async def read_jsonl(client: AsyncOpenAI, file_id: Optional[str]) -> List[Dict]:
+    """Download a batch output or error file"""
+    if not file_id:
+        return []
+    content = await client.files.content(file_id)
+    return [json.loads(line) for line in content.text.splitlines() if line.strip()]
+
+def store_results(db: InvoiceDB, lines: List[Dict], reprocess: bool) -> Dict[str, int]:
+    """
+    Validate the batch output and store one result per file. Documents split
+    into several invoices are only stored once every segment is valid; failed
+    files keep their text and stay pending for the next run
+
+    Returns:
+        Counts of stored, skipped and failed files
+    """
+    results: Dict[str, Dict[int, Dict]] = {}
+    failed = set()
+    for line in lines:
+        request_id, result, error = parse_result(line)
+        file_hash, _, segment = request_id.rpartition(":")
+        if error:
+            print(colored(f"  {request_id}: {error}", "yellow"))
+            failed.add(file_hash)
+            continue
+        results.setdefault(file_hash, {})[int(segment)] = result
+
+    counts = {"stored": 0, "skipped": 0, "failed": len(failed)}
+    for file_hash, segment_results in results.items():
+        if file_hash in failed:
+            continue
+        text_content = db.get_text_content(file_hash)
+        segments = document_segments(text_content or "")
+        if segments:
+            if len(segment_results) != len(segments):
+                print(colored(f"  {file_hash}: got {len(segment_results)} of {len(segments)} invoices", "yellow"))
+                counts["failed"] += 1
+                continue
+            json_result = combine_invoices(segments, [segment_results[index] for index in range(len(segments))])
+        else:
+            json_result = segment_results[0]
+
+        if db.save_json_result(file_hash, json_result, replace=reprocess):
+            counts["stored"] += 1
+        else:
+            counts["skipped"] += 1
+    return counts
+
+async def backfill(db: InvoiceDB, client: AsyncOpenAI, limit: Optional[int] = None, reprocess: bool = False,
+                   batch_id: Optional[str] = None, poll_seconds: float = BATCH_POLL_SECONDS) -> Dict[str, int]:
+    """
+    Run a backfill end to end: build and submit the batch (unless resuming
+    batch_id), wait for it, and store the validated results
+
+    Returns:
+        Counts of stored, skipped and failed files
+    """
+    if not batch_id:
+        rows = db.get_texts_to_extract(limit, reprocess)
+        if not rows:
+            print(colored("No stored text to extract", "yellow"))
+            return {"stored": 0, "skipped": 0, "failed": 0}
+        print(colored(f"→ Building a batch for {len(rows)} files", "cyan"))
+        batch_id = await submit_batch(client, build_batch_file(rows))
+
+    start = time.perf_counter()
+    batch = await wait_for_batch(client, batch_id, poll_seconds)
+    print(colored(f"  Batch {batch_id} {batch.status} after {time.perf_counter() - start:.0f}s", "cyan"))
+
+    lines = await read_jsonl(client, batch.output_file_id) + await read_jsonl(client, batch.error_file_id)
+    return store_results(db, lines, reprocess)
+
+async def main():
+    parser = argparse.ArgumentParser(description="Backfill extractions through the OpenAI Batch API")
+    parser.add_argument("--db", default=DATABASE_FILE, help="Path to the SQLite database")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of files in the batch")
+    parser.add_argument("--reprocess", action="store_true", help="Also re-extract files that have a result, replacing it")
+    parser.add_argument("--batch-id", default=None, help="Resume a submitted batch instead of creating one")
+    parser.add_argument("--poll-seconds", type=float, default=BATCH_POLL_SECONDS, help="Seconds between status checks")
+    args = parser.parse_args()
+
+    db = InvoiceDB(args.db)
+    client = AsyncOpenAI()
+    try:
+        counts = await backfill(db, client, args.limit, args.reprocess, args.batch_id, args.poll_seconds)
+        print(colored(f"✓ Stored {counts['stored']} results, {counts['skipped']} skipped, "
+                      f"{counts['failed']} failed", "green"))
+    finally:
+        await client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
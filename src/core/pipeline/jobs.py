@@ -0,0 +1,83 @@
+"""
+Background workers that lease jobs from the queue and run the invoice pipeline
+"""
+
+import os
+import uuid
+import asyncio
+from typing import List
+from termcolor import colored
+from ..db.async_database import AsyncInvoiceDB
+from ..executors import ExecutorProxy
+from .processor import process_invoice
+from .uploads import SpooledUpload
+
+# Constants
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+POLL_INTERVAL = 1.0
+
+class JobWorker:
+    def __init__(self, db: AsyncInvoiceDB, queue: ExecutorProxy, workers: int = JOB_WORKERS):
+        """Create a pool of workers for the given database and job queue, the queue running on the database executor"""
+        self.db = db
+        self.queue = queue
+        self.workers = workers
+        self.worker_id = uuid.uuid4().hex
+        self.tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        """Start the worker tasks"""
+        print(colored(f"→ Starting {self.workers} job workers", "cyan"))
+        self.tasks = [
+            asyncio.create_task(self._run(f"{self.worker_id}-{i}"))
+            for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Stop the worker tasks, leased jobs are picked up again once their lease expires"""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def _run(self, worker_id: str):
+        """Lease and process jobs until cancelled"""
+        while True:
+            try:
+                job = await self.queue.lease(worker_id)
+            except Exception as e:
+                print(colored(f"Error leasing a job for worker {worker_id}: {str(e)}", "red"))
+                job = None
+            if not job:
+                await asyncio.sleep(POLL_INTERVAL)
+                continue
+            await self._process(job, worker_id)
+
+    async def _process(self, job: dict, worker_id: str):
+        """
+        Run a single job through the pipeline and store the outcome. Errors while
+        storing the outcome are logged rather than raised, so the worker keeps
+        running; the job is leased again once its lease expires.
+        """
+        try:
+            print(colored(f"Processing job {job['id']} ({job['filename']}), attempt {job['attempts']}", "yellow"))
+            stored = await self.db.get_file_by_hash(job['file_hash'])
+            if not stored:
+                raise ValueError(f"No stored file found for hash {job['file_hash']}")
+            upload = SpooledUpload.from_bytes(job['filename'], stored['file_content'], job['file_hash'])
+            result = await process_invoice(self.db, upload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(colored(f"Error processing job {job['id']}: {str(e)}", "red"))
+            try:
+                await self.queue.fail(job['id'], worker_id, str(e))
+            except Exception as fail_error:
+                print(colored(f"Error recording the failure of job {job['id']}: {str(fail_error)}", "red"))
+            return
+
+        try:
+            await self.queue.complete(job['id'], worker_id, result)
+            print(colored(f"✓ Job {job['id']} completed", "green"))
+        except Exception as e:
+            print(colored(f"Error completing job {job['id']}: {str(e)}", "red"))
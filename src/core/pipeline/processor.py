@@ -0,0 +1,176 @@
+"""
+Invoice processing pipeline shared by the single-file and batch endpoints
+"""
+
+import asyncio
+from typing import Dict, Any, Optional
+from termcolor import colored
+from ..extractors.invoice_extractor import extract_with_cascade
+from ..extractors.model_tiers import LLM_MODEL_TIERS, LLM_STAGE, supplier_keys, result_supplier_key
+from ..extractors.pdf_extractor import process_pdf
+from ..extractors.ocr_tiers import document_source
+from ..extractors.invoice_segments import SPLIT_INVOICES, segment_invoices, combine_invoices
+from ..executors import cpu_executor
+from ..metrics import metrics
+from ..tier_memory import choose_tiers, tier_outcomes
+from ..db.async_database import AsyncInvoiceDB
+from .uploads import SpooledUpload
+from .singleflight import SingleFlight
+
+# Coalesces concurrent extractions of the same file
+flight = SingleFlight()
+
+async def process_invoice(db: AsyncInvoiceDB, upload: SpooledUpload,
+                          ocr_backend: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Run a single file through the OCR → LLM → save pipeline, using the digest
+    computed while the upload was spooled for every database lookup.
+    Returns the stored result straight away if the file was processed before,
+    and joins the in-flight extraction if the same file is already being processed.
+    
+    Args:
+        db: Database used for caching and storing results
+        upload: The spooled file with its precomputed hash
+        ocr_backend: OCR policy or backend for PDFs without stored text, the configured policy if None
+        
+    Returns:
+        Dict containing structured invoice information
+        
+    Raises:
+        ValueError: If the file type is not supported
+    """
+    filename = upload.filename
+    file_hash = upload.file_hash
+    
+    # Check if file was processed before
+    existing_result = await db.get_json_result(file_hash)
+    if existing_result:
+        print(colored(f"✓ Found existing results in database for {filename}", "green"))
+        return existing_result
+    
+    return await flight.run(db, file_hash, lambda: _extract(db, upload, ocr_backend))
+
+async def _extract(db: AsyncInvoiceDB, upload: SpooledUpload, ocr_backend: Optional[str]) -> Dict[str, Any]:
+    """Extract and store a file that has no stored result yet"""
+    filename = upload.filename
+    file_hash = upload.file_hash
+    
+    # Another request may have finished this file while we were waiting
+    existing_result = await db.get_json_result(file_hash)
+    if existing_result:
+        return existing_result
+    
+    # Process based on file type
+    is_pdf = filename.lower().endswith('.pdf')
+    source = None
+    if is_pdf:
+        # Process PDF file, OCR text of an earlier attempt with the same settings comes from the OCR cache.
+        # The document source keys the OCR tier memory here and the model tier memory below
+        source = await _document_source(upload)
+        text_content = await process_pdf(upload.file, filename, ocr_cache=db,
+                                         ocr_backend=ocr_backend, tier_store=db, source=source)
+    elif filename.lower().endswith('.txt'):
+        # Process text file
+        text_content = upload.read_bytes().decode('utf-8')
+    else:
+        raise ValueError("Unsupported file type. Please upload a PDF or text file.")
+    
+    try:
+        # Extract invoice details with the model cascade, once per invoice in the file
+        result = await extract_invoices(db, text_content, filename, source)
+    except Exception:
+        # Keep the file and its text content, a retry gets the OCR text from the OCR cache
+        await db.persist_extraction(filename, file_hash, upload.file, text_content=text_content)
+        raise
+    
+    # Save the file, text and results in one transaction
+    await db.persist_extraction(
+        filename,
+        file_hash,
+        upload.file,
+        text_content=text_content,
+        json_result=result
+    )
+    
+    if source:
+        for invoice in result.get('invoices') or [result]:
+            await _label_source(db, source, invoice.get('primary_supplier'))
+    
+    return result
+
+async def extract_invoices(db: AsyncInvoiceDB, text_content: str, filename: str,
+                           source: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extract the invoices in a document. A document with several invoices, such
+    as a weekly batch, is split at the invoice boundaries and the invoices are
+    extracted concurrently, then combined with combine_invoices.
+    
+    Args:
+        db: Database with the tier memory
+        text_content: Text of the document, pages separated by PAGE_SEPARATOR
+        filename: Name of the uploaded file
+        source: Document source key of the PDF, see document_source
+        
+    Returns:
+        Dict containing structured invoice information
+    """
+    segments = segment_invoices(text_content) if SPLIT_INVOICES else []
+    if len(segments) < 2:
+        return await extract_invoice(db, text_content, filename, source)
+    
+    print(colored(f"  Found {len(segments)} invoices in {filename}, extracting them separately", "cyan"))
+    metrics.increment("split_documents")
+    metrics.increment("split_invoices", len(segments))
+    results = await asyncio.gather(*(
+        extract_invoice(db, segment.text, f"{filename} (invoice {index + 1}/{len(segments)})", source)
+        for index, segment in enumerate(segments)
+    ))
+    return combine_invoices(segments, list(results))
+
+async def extract_invoice(db: AsyncInvoiceDB, text: str, filename: str, source: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Extract one invoice with the model cascade. The cascade skips the cheaper
+    models that keep falling short for the supplier, recognized by a VAT id
+    or KvK number on the invoice, or else for the document source. The
+    outcome of every model tried is recorded under the extracted supplier.
+    """
+    keys = supplier_keys(text) + ([source] if source else [])
+    try:
+        stats = await db.get_tier_stats(LLM_STAGE, keys)
+    except Exception as e:
+        print(colored(f"  Could not look up the model tiers: {str(e)}", "yellow"))
+        stats = {}
+    known = next((stats[key] for key in keys if key in stats), {})
+    tiers = choose_tiers(LLM_MODEL_TIERS, known)
+    if tiers[0] != LLM_MODEL_TIERS[0]:
+        print(colored(f"  Starting at {tiers[0]}, cheaper models keep falling short for this supplier", "cyan"))
+    
+    result, model = await extract_with_cascade(text, filename, tiers=tiers)
+    
+    # Suppliers found by id are named here, document sources by process_invoice
+    supplier_key = result_supplier_key(result)
+    key = supplier_key or source
+    if key:
+        try:
+            supplier = result.get('primary_supplier') if supplier_key else None
+            await db.record_tier_outcomes(LLM_STAGE, key, tier_outcomes(tiers, model), supplier)
+        except Exception as e:
+            print(colored(f"  Could not record the model tiers: {str(e)}", "yellow"))
+    return result
+
+async def _document_source(upload: SpooledUpload) -> Optional[str]:
+    """Identify the software that produced a PDF, None if it cannot be read"""
+    try:
+        return await cpu_executor.run(document_source, upload.file)
+    except Exception as e:
+        print(colored(f"  Could not identify the document source: {str(e)}", "yellow"))
+        return None
+
+async def _label_source(db: AsyncInvoiceDB, source: str, supplier: Optional[str]):
+    """Add the supplier of an invoice to the suppliers seen from its document source"""
+    if not supplier:
+        return
+    try:
+        await db.label_tier_key(source, supplier)
+    except Exception as e:
+        print(colored(f"  Could not label the document source: {str(e)}", "yellow"))
@@ -0,0 +1,74 @@
+"""
+Single-flight coalescing of concurrent extractions of the same file
+"""
+
+import uuid
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+from termcolor import colored
+from ..db.async_database import AsyncInvoiceDB
+
+# Constants
+LEASE_SECONDS = 900
+POLL_INTERVAL = 1.0
+
+class SingleFlight:
+    """
+    Make sure a file is extracted only once at a time, keyed by content hash.
+
+    Within the process, the first caller starts the extraction as a task and
+    later callers await that same task. Across processes sharing the database,
+    the task first takes an extraction lease; if another process holds it,
+    the task polls for the stored result until it appears or the lease expires.
+    """
+
+    def __init__(self, lease_seconds: float = LEASE_SECONDS, poll_interval: float = POLL_INTERVAL):
+        self.owner = uuid.uuid4().hex
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.in_flight: Dict[str, asyncio.Task] = {}
+
+    async def run(self, db: AsyncInvoiceDB, file_hash: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Run fn for file_hash unless an extraction for it is already in flight.
+        
+        Args:
+            db: Database holding the extraction leases and results
+            file_hash: SHA-256 hash of the file content
+            fn: Coroutine function performing the extraction
+            
+        Returns:
+            Dict containing structured invoice information
+        """
+        task = self.in_flight.get(file_hash)
+        if task:
+            print(colored(f"→ Waiting for in-flight extraction of {file_hash[:12]}", "cyan"))
+        else:
+            # Run detached so a cancelled leader request does not cancel the followers
+            task = asyncio.create_task(self._lead(db, file_hash, fn))
+            self.in_flight[file_hash] = task
+            task.add_done_callback(lambda t: self._done(file_hash, t))
+        return await asyncio.shield(task)
+
+    def _done(self, file_hash: str, task: asyncio.Task):
+        """Forget a finished extraction"""
+        self.in_flight.pop(file_hash, None)
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every caller went away
+            task.exception()
+
+    async def _lead(self, db: AsyncInvoiceDB, file_hash: str, fn: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """Extract under the database lease, or wait for the process holding it"""
+        while True:
+            if await db.acquire_extraction_lease(file_hash, self.owner, self.lease_seconds):
+                try:
+                    return await fn()
+                finally:
+                    await db.release_extraction_lease(file_hash, self.owner)
+
+            # Another process is extracting this file
+            result = await db.get_json_result(file_hash)
+            if result:
+                print(colored(f"✓ Received result of {file_hash[:12]} from another worker", "green"))
+                return result
+            await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,104 @@
+"""
+Chunked ingestion of uploaded files with incremental hashing
+"""
+
+import io
+import os
+import hashlib
+from typing import BinaryIO, Iterator, Optional, Tuple
+from fastapi import UploadFile
+from ..extractors.pdf_extractor import MAX_FILE_SIZE_MB
+from ..executors import cpu_executor
+
+# Constants
+CHUNK_SIZE = 1024 * 1024
+# Uploads up to this size stay in memory, larger ones spill to an anonymous file in TMPDIR.
+# Applied by the upload routes' multipart parser, see UploadRoute
+SPOOL_MAX_SIZE = int(float(os.getenv("UPLOAD_SPOOL_MAX_MB", "8")) * 1024 * 1024)
+
+class FileTooLargeError(ValueError):
+    """Raised when an upload exceeds the maximum allowed size"""
+
+class SpooledUpload:
+    """
+    An uploaded file held in a spooled temporary file together with its
+    SHA-256 digest and size, so the content is hashed exactly once and
+    never has to be held in memory as a whole. The file is anonymous, so
+    uploads with the same filename never share a path on disk, and it is
+    passed to the OCR backends as a stream.
+    """
+
+    def __init__(self, filename: str, file: BinaryIO, file_hash: str, size: int):
+        self.filename = filename
+        self.file = file
+        self.file_hash = file_hash
+        self.size = size
+
+    @classmethod
+    def from_bytes(cls, filename: str, data: bytes, file_hash: Optional[str] = None) -> 'SpooledUpload':
+        """Wrap content that is already in memory, e.g. a file loaded from the database"""
+        return cls(
+            filename,
+            io.BytesIO(data),
+            file_hash or hashlib.sha256(data).hexdigest(),
+            len(data)
+        )
+
+    def chunks(self) -> Iterator[bytes]:
+        """Iterate over the content from the start in chunks of CHUNK_SIZE"""
+        self.file.seek(0)
+        while chunk := self.file.read(CHUNK_SIZE):
+            yield chunk
+
+    def read_bytes(self) -> bytes:
+        """Read the whole content, only use this for small files"""
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self):
+        """Release the temporary file"""
+        self.file.close()
+
+def _hash_file(file: BinaryIO, max_size: int) -> Tuple[Optional[str], int]:
+    """
+    Hash a file from the start in chunks, stopping as soon as it exceeds max_size
+
+    Returns:
+        Tuple (hex digest or None if the file is too large, size read)
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    while chunk := file.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            return None, size
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest(), size
+
+async def spool_upload(upload: UploadFile, max_size_mb: float = MAX_FILE_SIZE_MB) -> SpooledUpload:
+    """
+    Take over the spooled file the multipart parser wrote the upload to and
+    compute its SHA-256 digest in one pass on the CPU executor, rejecting it as
+    soon as it exceeds the size limit. The content is not copied again: it
+    stays in memory up to SPOOL_MAX_SIZE and in an anonymous file beyond that.
+    
+    Args:
+        upload: The uploaded file
+        max_size_mb: Maximum allowed size in MB
+        
+    Returns:
+        SpooledUpload positioned at the start of the content
+        
+    Raises:
+        FileTooLargeError: If the file exceeds the maximum allowed size
+    """
+    max_size = int(max_size_mb * 1024 * 1024)
+    too_large = FileTooLargeError(f"File size exceeds maximum allowed size ({max_size_mb}MB)")
+    if upload.size is not None and upload.size > max_size:
+        raise too_large
+    file_hash, size = await cpu_executor.run(_hash_file, upload.file, max_size)
+    if file_hash is None:
+        raise too_large
+    return SpooledUpload(upload.filename, upload.file, file_hash, size)
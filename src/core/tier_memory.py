@@ -0,0 +1,66 @@
+"""
+Memory of how the cheap tiers of a cascade fared per supplier or document source
+"""
+
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+# Constants
+# Outcomes lose half their weight every TIER_HALF_LIFE_DAYS, so a tier that failed is tried again later
+TIER_HALF_LIFE_DAYS = float(os.getenv("TIER_HALF_LIFE_DAYS", "30"))
+# A cheaper tier is skipped once its recency weighted failures reach this, and they are at
+# least this share of its tries. The default takes two recent failures, one weak answer never pins a supplier
+TIER_SKIP_MIN_FAILURES = float(os.getenv("TIER_SKIP_MIN_FAILURES", "1.5"))
+TIER_SKIP_FAILURE_RATE = float(os.getenv("TIER_SKIP_FAILURE_RATE", "0.5"))
+# Share of documents that start at the cheapest tier anyway, to notice when it has become good enough
+TIER_EXPLORE_RATE = float(os.getenv("TIER_EXPLORE_RATE", "0.1"))
+SECONDS_PER_DAY = 24 * 60 * 60
+
+@dataclass
+class TierStats:
+    """Recency weighted tries of one tier for one key"""
+    successes: float = 0.0
+    failures: float = 0.0
+
+    @property
+    def skip(self) -> bool:
+        """Failed often enough, and in a large enough share of its tries, to be skipped"""
+        tries = self.successes + self.failures
+        return self.failures >= TIER_SKIP_MIN_FAILURES and self.failures >= TIER_SKIP_FAILURE_RATE * tries
+
+def decay(value: float, updated_at: float, now: Optional[float] = None) -> float:
+    """Weigh a count down by the time since it was last updated"""
+    elapsed = max((now or time.time()) - updated_at, 0.0)
+    return value * 0.5 ** (elapsed / (TIER_HALF_LIFE_DAYS * SECONDS_PER_DAY))
+
+def choose_tiers(tiers: List[str], stats: Dict[str, TierStats], explore: Optional[float] = None) -> List[str]:
+    """
+    Get the tiers to try, skipping the cheaper tiers that keep failing for a key.
+    The strongest tier is never skipped, and a share of the documents starts at
+    the cheapest tier whatever the stats say, so a skipped tier gets new tries.
+
+    Args:
+        tiers: Tiers from cheapest to strongest
+        stats: Stats per tier for the key, see AsyncInvoiceDB.get_tier_stats
+        explore: Share of documents that start at the cheapest tier, TIER_EXPLORE_RATE if None
+
+    Returns:
+        The tiers to try in order
+    """
+    explore = TIER_EXPLORE_RATE if explore is None else explore
+    if random.random() < explore:
+        return tiers
+    for index, tier in enumerate(tiers[:-1]):
+        if tier not in stats or not stats[tier].skip:
+            return tiers[index:]
+    return tiers[-1:]
+
+def tier_outcomes(tiers: List[str], answered: str) -> List[Tuple[str, bool]]:
+    """Get the outcome of every tier tried: the tiers before the one that answered fell short"""
+    if answered not in tiers:
+        return [(answered, True)]
+    index = tiers.index(answered)
+    return [(tier, False) for tier in tiers[:index]] + [(answered, True)]
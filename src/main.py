@@ -1,12 +1,45 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import JSONResponse
 from termcolor import colored
-from .api.routes import invoice
+from .api.routes import invoice, jobs, metrics
+from .api.middleware import UploadSizeLimitMiddleware
+from .core.extractors.pdf_extractor import MAX_FILE_SIZE_MB
+from .core.extractors.whisper_client import close_whisper_client
+from .core.pipeline.jobs import JobWorker
+
+# Allowance for multipart boundaries and headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+# Batches carry many files, each still limited to MAX_FILE_SIZE_MB when it is spooled
+MAX_BATCH_SIZE_MB = float(os.getenv("MAX_BATCH_SIZE_MB", "500"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the database and run the background job workers for the lifetime of the application"""
+    await invoice.db.open()
+    app.state.job_queue = await jobs.open_job_queue()
+    app.state.job_worker = JobWorker(invoice.db, app.state.job_queue)
+    await app.state.job_worker.start()
+    yield
+    await app.state.job_worker.stop()
+    await close_whisper_client()
+    await invoice.db.close()
 
 # Initialize the FastAPI application
-app = FastAPI(title="Invoice Processor")
+app = FastAPI(title="Invoice Processor", lifespan=lifespan)
+
+# Reject oversized uploads while they are being received
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    limits={
+        "/extract": int(MAX_FILE_SIZE_MB * 1024 * 1024) + MULTIPART_OVERHEAD,
+        "/extract/batch": int(MAX_BATCH_SIZE_MB * 1024 * 1024) + MULTIPART_OVERHEAD,
+        "/jobs": int(MAX_FILE_SIZE_MB * 1024 * 1024) + MULTIPART_OVERHEAD,
+    }
+)
 
 # Mount static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -14,6 +47,8 @@ templates = Jinja2Templates(directory="templates")
 
 # Include routers
 app.include_router(invoice.router)
+app.include_router(jobs.router)
+app.include_router(metrics.router)
 
 @app.get("/")
 async def home(request: Request):
@@ -1,4 +1,5 @@
 from typing import List, Literal, Optional, Union, Annotated, Self, Set
+import decimal
 from decimal import Decimal
 from pydantic import BaseModel, Field, EmailStr, ValidationInfo, field_validator, model_validator
 from datetime import datetime
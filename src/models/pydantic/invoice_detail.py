@@ -1,4 +1,5 @@
 from typing import List, Optional, Literal
+import decimal
 from decimal import Decimal
 from pydantic import BaseModel, Field, model_validator, field_validator
 from datetime import datetime
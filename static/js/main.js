@@ -143,29 +143,59 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    // Compute the SHA-256 hash of a file as a hex string
+    function hashFile(file) {
+        return file.arrayBuffer()
+            .then(buffer => crypto.subtle.digest('SHA-256', buffer))
+            .then(digest => Array.from(new Uint8Array(digest))
+                .map(byte => byte.toString(16).padStart(2, '0'))
+                .join(''));
+    }
+
+    // Look up a previously processed file by hash, resolves to null if unknown
+    function lookupByHash(file) {
+        // SubtleCrypto is only available in secure contexts
+        if (!window.crypto || !crypto.subtle) {
+            return Promise.resolve(null);
+        }
+        return hashFile(file)
+            .then(hash => fetch(`/invoices/by-hash/${hash}`))
+            .then(response => response.ok ? response.json() : null)
+            .catch(error => {
+                console.warn('Hash lookup failed, uploading file instead:', error);
+                return null;
+            });
+    }
+
+    function uploadFile(file) {
+        // Create FormData and send to server
+        const formData = new FormData();
+        formData.append('file', file);
+
+        return fetch('/extract', {
+            method: 'POST',
+            body: formData
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Network response was not ok');
+            }
+            return response.json();
+        });
+    }
+
     function handleFileUpload(file) {
         if (file.type === 'application/pdf') {
             // Load PDF preview
             loadPDF(file);
-            
-            // Create FormData and send to server
-            const formData = new FormData();
-            formData.append('file', file);
 
             // Show processing indicator
             document.querySelector('.processing-indicator').classList.remove('hidden');
             document.querySelector('.upload-content').classList.add('hidden');
 
-            fetch('/extract', {
-                method: 'POST',
-                body: formData
-            })
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error('Network response was not ok');
-                }
-                return response.json();
-            })
+            // Only upload the file if the server has not processed it before
+            lookupByHash(file)
+            .then(data => data || uploadFile(file))
             .then(data => {
                 // Hide processing indicator
                 document.querySelector('.processing-indicator').classList.add('hidden');
@@ -174,8 +204,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 // Show results
                 document.querySelector('.results').classList.remove('hidden');
                 
-                // Convert and display markdown with tables
-                const markdown = convertToMarkdown(data);
+                // Convert and display markdown with tables, one section per invoice in the file
+                const invoices = data.invoices || [data];
+                const markdown = invoices.map(invoice => convertToMarkdown(invoice, invoices.length)).join('\n---\n\n');
                 document.querySelector('.markdown-content').innerHTML = marked.parse(markdown, {
                     gfm: true,
                     breaks: true,
@@ -210,8 +241,11 @@ document.addEventListener('DOMContentLoaded', function() {
         return `${currency} ${num.toLocaleString('nl-NL', { minimumFractionDigits: 2, maximumFractionDigits: 2 })}`;
     }
 
-    function convertToMarkdown(data) {
+    function convertToMarkdown(data, invoiceCount = 1) {
         let markdown = `# Invoice Details\n\n`;
+        if (invoiceCount > 1 && data.pages) {
+            markdown = `# Invoice ${data.invoice_number} (pages ${data.pages[0]}-${data.pages[1]})\n\n`;
+        }
         markdown += '<div class="details-grid">\n\n';
 
         // Left Column: General and Supplier Information
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import socket
+import subprocess
+from contextlib import contextmanager
+from typing import Dict, Iterator
+import httpx
+import pytest
+
+# The OpenAI and LLMWhisperer clients are created at import, the tests never reach the real services
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("LLMWHISPERER_API_KEY", "test")
+
+STUB_START_SECONDS = 20
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+@contextmanager
+def stub_server(module: str, port_env: str, env: Dict[str, str]) -> Iterator[str]:
+    """
+    Run one of the stand-in servers in tools/ on a free port until it answers
+
+    Args:
+        module: Module of the server, e.g. tools.openai_batch_server
+        port_env: Environment variable the server reads its port from
+        env: Further environment variables for the server
+
+    Returns:
+        The root URL of the server
+    """
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", module], env=dict(os.environ, **env, **{port_env: str(port)}),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + STUB_START_SECONDS
+        while True:
+            try:
+                httpx.get(f"{url}/docs", timeout=1)
+                break
+            except httpx.TransportError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    pytest.fail(f"{module} did not start")
+                time.sleep(0.2)
+        yield url
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,76 @@
+import io
+import asyncio
+import pytest
+from src.core.db.async_database import AsyncInvoiceDB
+from src.core.db.blob_store import BlobStore
+from src.core.db.database import LOOKUP_BATCH_SIZE, get_file_hash
+
+CONTENT = b"%PDF async invoice"
+FILE_HASH = get_file_hash(CONTENT)
+RESULT = {"invoice_number": "A-1"}
+
+@pytest.fixture
+def open_db(tmp_path):
+    """Run a coroutine function against a fresh database, closed afterwards"""
+    def run(fn):
+        async def main():
+            db = AsyncInvoiceDB(str(tmp_path / "invoices.db"), readers=2, blob_store=BlobStore(str(tmp_path / "blobs")))
+            try:
+                return await fn(db)
+            finally:
+                await db.close()
+        return asyncio.run(main())
+    return run
+
+def test_a_persisted_extraction_reads_back(open_db):
+    async def run(db):
+        # Connections are opened on first use
+        stored = await db.persist_extraction("async.pdf", FILE_HASH, io.BytesIO(CONTENT), "text", RESULT)
+        return (stored, await db.check_file_exists(CONTENT), await db.get_text_content(FILE_HASH),
+                await db.get_json_result(FILE_HASH), await db.get_file_by_hash(FILE_HASH))
+
+    stored, existing, text, result, file = open_db(run)
+    assert stored == (FILE_HASH, True)
+    assert (existing["filename"], existing["json_result"]) == ("async.pdf", RESULT)
+    assert (text, result) == ("text", RESULT)
+    assert file == {"filename": "async.pdf", "file_content": CONTENT, "json_result": RESULT}
+
+def test_concurrent_writers_of_one_file_store_it_once(open_db):
+    async def run(db):
+        stored = await asyncio.gather(*(
+            db.persist_extraction(f"{index}.pdf", FILE_HASH, io.BytesIO(CONTENT), "text", RESULT)
+            for index in range(5)
+        ))
+        async with db._reader() as conn:
+            async with conn.execute("SELECT COUNT(*) FROM processed_files") as cursor:
+                files = (await cursor.fetchone())[0]
+            async with conn.execute("SELECT COUNT(*) FROM invoice_data") as cursor:
+                invoices = (await cursor.fetchone())[0]
+        return stored, files, invoices
+
+    stored, files, invoices = open_db(run)
+    assert sorted(is_new for _, is_new in stored) == [False] * 4 + [True]
+    assert (files, invoices) == (1, 1)
+
+def test_readers_are_not_blocked_by_a_held_writer(open_db):
+    async def run(db):
+        await db.persist_extraction("async.pdf", FILE_HASH, io.BytesIO(CONTENT), "text", RESULT)
+        async with db._writer() as writer:
+            await writer.execute("UPDATE processed_files SET filename = 'renamed.pdf'")
+            # Uncommitted writes are not visible, and the read does not wait for them
+            existing = await asyncio.wait_for(db.check_file_exists(file_hash=FILE_HASH), timeout=1)
+        async with db._reader() as conn:
+            async with conn.execute("PRAGMA journal_mode") as cursor:
+                journal_mode = (await cursor.fetchone())[0]
+        return existing["filename"], journal_mode, (await db.check_file_exists(file_hash=FILE_HASH))["filename"]
+
+    assert open_db(run) == ("async.pdf", "wal", "renamed.pdf")
+
+def test_many_results_are_looked_up_in_batches(open_db):
+    async def run(db):
+        await db.persist_extraction("async.pdf", FILE_HASH, io.BytesIO(CONTENT), "text", RESULT)
+        await db.persist_extraction("pending.pdf", get_file_hash(b"%PDF pending"), io.BytesIO(b"%PDF pending"))
+        unknown = [f"{index:064x}" for index in range(LOOKUP_BATCH_SIZE + 10)]
+        return await db.get_json_results([*unknown, get_file_hash(b"%PDF pending"), FILE_HASH])
+
+    assert open_db(run) == {FILE_HASH: RESULT}
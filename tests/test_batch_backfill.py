@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+from openai import AsyncOpenAI
+from conftest import stub_server
+from src.core.db.blob_store import BlobStore
+from src.core.db.database import InvoiceDB
+from src.core.extractors.text_layer import join_pages
+from src.core.pipeline.batch_backfill import backfill
+
+@pytest.fixture(scope="module")
+def openai_stub():
+    """Run tools/openai_batch_server.py with batches that complete at once"""
+    with stub_server("tools.openai_batch_server", "OPENAI_STUB_PORT", {"OPENAI_STUB_DELAY": "0"}) as url:
+        yield f"{url}/v1"
+
+def run_backfill(db: InvoiceDB, base_url: str, **kwargs):
+    async def run():
+        client = AsyncOpenAI(base_url=base_url, api_key="test")
+        try:
+            return await backfill(db, client, poll_seconds=0.1, **kwargs)
+        finally:
+            await client.close()
+
+    return asyncio.run(run())
+
+def test_backfill_stores_a_result_per_file(openai_stub, tmp_path):
+    db = InvoiceDB(str(tmp_path / "invoices.db"), BlobStore(str(tmp_path / "blobs")))
+    try:
+        single = "Bakkerij de Korenschoof\nFactuurnummer: K-1001\nDatum: 12-03-2024\nTe betalen 42,35"
+        double = join_pages([
+            "Groothandel Noord\nFactuurnummer: N-2001\nDatum: 01-02-2024\nTotaal 100,00",
+            "Groothandel Noord\nFactuurnummer: N-2002\nDatum: 15-02-2024\nTotaal 250,50",
+        ])
+        single_hash, _ = db.save_file("single.pdf", b"%PDF single", single)
+        double_hash, _ = db.save_file("double.pdf", b"%PDF double", double)
+
+        assert run_backfill(db, openai_stub) == {"stored": 2, "skipped": 0, "failed": 0}
+
+        result = db.get_json_result(single_hash)
+        assert result["invoice_number"] == "K-1001"
+        assert result["amount_payable"] == "42.35"
+        assert "invoices" not in result
+
+        result = db.get_json_result(double_hash)
+        assert [invoice["invoice_number"] for invoice in result["invoices"]] == ["N-2001", "N-2002"]
+        assert [invoice["pages"] for invoice in result["invoices"]] == [[1, 1], [2, 2]]
+        rows = db.conn.execute("SELECT invoice_number, segment FROM invoice_data ORDER BY invoice_number").fetchall()
+        assert [tuple(row) for row in rows] == [("K-1001", 0), ("N-2001", 0), ("N-2002", 1)]
+
+        # Nothing is left to extract, a reprocess replaces the results without duplicating invoice rows
+        assert run_backfill(db, openai_stub) == {"stored": 0, "skipped": 0, "failed": 0}
+        assert run_backfill(db, openai_stub, reprocess=True) == {"stored": 2, "skipped": 0, "failed": 0}
+        assert db.conn.execute("SELECT COUNT(*) FROM invoice_data").fetchone()[0] == 3
+    finally:
+        db.conn.close()
@@ -0,0 +1,105 @@
+import asyncio
+import httpx
+from src.core.concurrency import AdaptiveLimiter
+
+def response(status_code: int = 200, **headers) -> httpx.Response:
+    return httpx.Response(status_code, headers={name.replace("_", "-"): value for name, value in headers.items()})
+
+def test_limit_grows_by_one_per_limit_of_saturated_calls():
+    async def run():
+        limiter = AdaptiveLimiter("test_grow", start=2, max_limit=10)
+
+        async def call():
+            async with limiter.slot():
+                await asyncio.sleep(0.001)
+
+        await asyncio.gather(*(call() for _ in range(20)))
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert 3 <= int(limiter.limit) <= 10
+    assert limiter.in_flight == 0
+
+def test_limit_never_exceeds_its_ceiling():
+    async def run():
+        limiter = AdaptiveLimiter("test_ceiling", start=2, max_limit=3)
+
+        async def call():
+            async with limiter.slot():
+                await asyncio.sleep(0.001)
+
+        await asyncio.gather(*(call() for _ in range(200)))
+        return limiter
+
+    assert asyncio.run(run()).limit == 3
+
+def test_calls_in_flight_stay_under_the_limit():
+    async def run():
+        limiter = AdaptiveLimiter("test_bound", start=4, max_limit=4)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            async with limiter.slot():
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0.001)
+
+        await asyncio.gather(*(call() for _ in range(50)))
+        return peak
+
+    assert asyncio.run(run()) == 4
+
+def test_overload_halves_the_limit_once_per_burst():
+    async def run():
+        limiter = AdaptiveLimiter("test_overload", start=40, max_limit=100)
+        await limiter.observe_response(response(429))
+        first = int(limiter.limit)
+        # 429s of calls started together count once
+        await limiter.observe_response(response(429))
+        await limiter.observe_response(response(503))
+        return first, int(limiter.limit)
+
+    assert asyncio.run(run()) == (20, 20)
+
+def test_overload_never_cuts_below_the_minimum():
+    async def run():
+        limiter = AdaptiveLimiter("test_minimum", start=1, max_limit=10)
+        await limiter.observe_response(response(429))
+        return limiter.limit
+
+    assert asyncio.run(run()) == 1
+
+def test_nearly_spent_rate_limit_headers_slow_down():
+    async def run():
+        limiter = AdaptiveLimiter("test_headroom", start=50, max_limit=100)
+        await limiter.observe_response(response(
+            x_ratelimit_limit_requests="1000", x_ratelimit_remaining_requests="10"
+        ))
+        return int(limiter.limit)
+
+    assert asyncio.run(run()) == 45
+
+def test_rate_limit_headers_with_headroom_leave_the_limit_alone():
+    async def run():
+        limiter = AdaptiveLimiter("test_plenty", start=50, max_limit=100)
+        await limiter.observe_response(response(
+            x_ratelimit_limit_tokens="100000", x_ratelimit_remaining_tokens="90000"
+        ))
+        await limiter.observe_response(response(x_ratelimit_remaining_requests="not a number"))
+        return int(limiter.limit)
+
+    assert asyncio.run(run()) == 50
+
+def test_cancelled_waiter_passes_its_slot_on():
+    async def run():
+        limiter = AdaptiveLimiter("test_cancel", start=1, max_limit=1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        other = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        limiter.release()
+        await asyncio.wait_for(other, 1)
+        return limiter.in_flight
+
+    assert asyncio.run(run()) == 1
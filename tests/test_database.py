@@ -0,0 +1,26 @@
+import pytest
+from src.core.db.blob_store import BlobStore
+from src.core.db.database import InvoiceDB, get_file_hash
+
+@pytest.fixture
+def db(tmp_path):
+    db = InvoiceDB(str(tmp_path / "invoices.db"), BlobStore(str(tmp_path / "blobs")))
+    yield db
+    db.conn.close()
+
+def test_save_file_upserts_and_fills_in_missing_results(db):
+    content = b"%PDF invoice"
+    file_hash, is_new = db.save_file("invoice.pdf", content, "text")
+    assert (file_hash, is_new) == (get_file_hash(content), True)
+
+    assert db.save_file("invoice.pdf", content, json_result={"invoice_number": "F-1"}) == (file_hash, False)
+    assert db.get_json_result(file_hash) == {"invoice_number": "F-1"}
+    # A stored result is not overwritten, and its invoice rows are not duplicated
+    db.save_file("invoice.pdf", None, json_result={"invoice_number": "F-2"}, file_hash=file_hash)
+    assert db.get_json_result(file_hash) == {"invoice_number": "F-1"}
+    assert db.conn.execute("SELECT COUNT(*) FROM invoice_data").fetchone()[0] == 1
+
+def test_save_file_needs_content_for_a_new_file(db):
+    with pytest.raises(ValueError):
+        db.save_file("missing.pdf", None, "text", file_hash="0" * 64)
+    assert db.conn.execute("SELECT COUNT(*) FROM processed_files").fetchone()[0] == 0
@@ -0,0 +1,87 @@
+import os
+import time
+import asyncio
+import threading
+from src.core.executors import ExecutorProxy, InstrumentedExecutor, InstrumentedProcessExecutor
+
+def test_blocking_work_runs_off_the_event_loop():
+    executor = InstrumentedExecutor("test_offload", 1)
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        thread = await executor.run(lambda: time.sleep(0.2) or threading.current_thread().name)
+        ticker.cancel()
+        return thread, ticks
+
+    try:
+        thread, ticks = asyncio.run(run())
+        assert thread.startswith("test_offload")
+        assert ticks > 5
+    finally:
+        executor.executor.shutdown()
+
+def test_the_pool_counts_queued_active_and_completed_work():
+    executor = InstrumentedExecutor("test_stats", 1)
+    release = threading.Event()
+
+    async def run():
+        tasks = [asyncio.create_task(executor.run(release.wait)) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        busy = executor.stats()
+        release.set()
+        await asyncio.gather(*tasks)
+        return busy, executor.stats()
+
+    try:
+        busy, done = asyncio.run(run())
+        assert busy == {"max_workers": 1, "queued": 2, "active": 1, "completed": 0}
+        assert done == {"max_workers": 1, "queued": 0, "active": 0, "completed": 3}
+    finally:
+        executor.executor.shutdown()
+
+def test_errors_reach_the_awaiting_caller():
+    executor = InstrumentedExecutor("test_errors", 1)
+
+    async def run():
+        try:
+            await executor.run(int, "not a number")
+        except ValueError as e:
+            return str(e)
+
+    try:
+        assert "not a number" in asyncio.run(run())
+        assert executor.stats()["active"] == 0
+    finally:
+        executor.executor.shutdown()
+
+def test_the_proxy_runs_methods_on_the_executor():
+    class Store:
+        name = "store"
+
+        def thread(self, suffix: str) -> str:
+            return threading.current_thread().name + suffix
+
+    executor = InstrumentedExecutor("test_proxy", 1)
+    proxy = ExecutorProxy(Store(), executor)
+    try:
+        assert proxy.name == "store"
+        assert asyncio.run(proxy.thread("!")).startswith("test_proxy")
+        assert asyncio.run(proxy.thread("!")).endswith("!")
+    finally:
+        executor.executor.shutdown()
+
+def test_process_work_runs_in_another_process():
+    executor = InstrumentedProcessExecutor("test_process", 1)
+    try:
+        assert asyncio.run(executor.run(os.getpid)) != os.getpid()
+        assert executor.stats() == {"max_workers": 1, "queued": 0, "active": 0, "completed": 1}
+    finally:
+        executor.executor.shutdown()
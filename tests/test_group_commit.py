@@ -0,0 +1,82 @@
+import asyncio
+import sqlite3
+import pytest
+from src.core.db.database import SCHEMA, apply_migrations, persist_batch
+from src.core.db.group_commit import GroupCommit
+
+def test_every_operation_gets_its_own_result():
+    batches = []
+
+    async def apply_batch(ops):
+        batches.append(len(ops))
+        return [a + b for a, b in ops]
+
+    async def run():
+        group = GroupCommit(apply_batch, window_ms=20, max_ops=4)
+        group.start()
+        results = await asyncio.gather(*(group.submit(i, 100) for i in range(10)))
+        await group.stop()
+        return results
+
+    assert asyncio.run(run()) == [i + 100 for i in range(10)]
+    assert sum(batches) == 10
+    assert max(batches) == 4
+    assert len(batches) < 10
+
+def test_a_failing_operation_fails_only_its_caller():
+    async def apply_batch(ops):
+        return [ValueError(op) if op == "bad" else op for (op,) in ops]
+
+    async def run():
+        group = GroupCommit(apply_batch, window_ms=20)
+        group.start()
+        results = await asyncio.gather(*(group.submit(op) for op in ["a", "bad", "b"]), return_exceptions=True)
+        await group.stop()
+        return results
+
+    first, failed, last = asyncio.run(run())
+    assert (first, last) == ("a", "b")
+    assert isinstance(failed, ValueError)
+
+def test_a_failing_batch_fails_every_caller():
+    async def apply_batch(ops):
+        raise sqlite3.OperationalError("database is locked")
+
+    async def run():
+        group = GroupCommit(apply_batch, window_ms=20)
+        group.start()
+        results = await asyncio.gather(*(group.submit(i) for i in range(3)), return_exceptions=True)
+        await group.stop()
+        return results
+
+    assert all(isinstance(result, sqlite3.OperationalError) for result in asyncio.run(run()))
+
+def test_submit_needs_a_running_group():
+    async def run():
+        await GroupCommit(None).submit(1)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
+
+def test_persist_batch_rolls_back_only_the_failing_operation(tmp_path):
+    conn = sqlite3.connect(tmp_path / "invoices.db")
+    try:
+        conn.executescript(SCHEMA)
+        apply_migrations(conn)
+        invoice = {"invoice_number": "F-1", "amount_payable": "12.10"}
+        results = persist_batch(conn, [
+            ("a.pdf", "hash-a", "blobs/a", "text a", invoice),
+            # invoices must be a list, saving its invoice rows fails after the file row is inserted
+            ("bad.pdf", "hash-bad", "blobs/bad", "text bad", {"invoices": 5}),
+            ("b.pdf", "hash-b", "blobs/b", "text b", None),
+        ])
+        conn.commit()
+
+        assert results[0] == ("hash-a", True)
+        assert isinstance(results[1], TypeError)
+        assert results[2] == ("hash-b", True)
+        hashes = [row[0] for row in conn.execute("SELECT file_hash FROM processed_files ORDER BY id")]
+        assert hashes == ["hash-a", "hash-b"]
+        assert conn.execute("SELECT invoice_number FROM invoice_data").fetchall() == [("F-1",)]
+    finally:
+        conn.close()
@@ -0,0 +1,128 @@
+import json
+import asyncio
+from contextlib import asynccontextmanager
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from src.api.routes import invoice
+from src.core.db.async_database import AsyncInvoiceDB
+from src.core.db.blob_store import BlobStore
+from src.core.db.database import InvoiceDB
+
+STORED = {b"%PDF stored one": {"invoice_number": "F-1"}, b"%PDF stored two": {"invoice_number": "F-2"}}
+
+@pytest.fixture
+def stored_hashes(tmp_path):
+    """Store two processed files in a fresh database"""
+    db = InvoiceDB(str(tmp_path / "invoices.db"), BlobStore(str(tmp_path / "blobs")))
+    try:
+        return [db.save_file(f"{index}.pdf", content, "text", result)[0]
+                for index, (content, result) in enumerate(STORED.items())]
+    finally:
+        db.conn.close()
+
+@pytest.fixture
+def client(tmp_path, stored_hashes, monkeypatch):
+    """Serve the invoice routes on the database of stored_hashes"""
+    db = AsyncInvoiceDB(str(tmp_path / "invoices.db"), blob_store=BlobStore(str(tmp_path / "blobs")))
+    monkeypatch.setattr(invoice, "db", db)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await db.open()
+        yield
+        await db.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(invoice.router)
+    with TestClient(app) as client:
+        yield client
+
+def test_lookup_by_hash(client, stored_hashes):
+    response = client.get(f"/invoices/by-hash/{stored_hashes[0].upper()}")
+    assert response.status_code == 200
+    assert response.json() == {"invoice_number": "F-1"}
+
+def test_lookup_by_hash_rejects_an_invalid_hash(client):
+    assert client.get("/invoices/by-hash/not-a-hash").status_code == 400
+    assert client.get(f"/invoices/by-hash/{'g' * 64}").status_code == 400
+
+def test_lookup_by_hash_of_an_unknown_file(client):
+    assert client.get(f"/invoices/by-hash/{'0' * 64}").status_code == 404
+
+def test_lookup_of_many_hashes(client, stored_hashes):
+    response = client.post("/invoices/lookup", json={"hashes": [*stored_hashes, "0" * 64]})
+    assert response.status_code == 200
+    assert response.json() == {
+        "results": {stored_hashes[0]: {"invoice_number": "F-1"}, stored_hashes[1]: {"invoice_number": "F-2"}},
+        "missing": ["0" * 64],
+    }
+
+def test_lookup_of_many_hashes_rejects_invalid_hashes(client, stored_hashes):
+    response = client.post("/invoices/lookup", json={"hashes": [stored_hashes[0], "xyz"]})
+    assert response.status_code == 400
+    assert "xyz" in response.json()["detail"]
+
+def test_lookup_of_many_hashes_is_capped(client):
+    hashes = [f"{index:064x}" for index in range(invoice.MAX_LOOKUP_HASHES + 1)]
+    assert client.post("/invoices/lookup", json={"hashes": hashes}).status_code == 400
+    response = client.post("/invoices/lookup", json={"hashes": hashes[:invoice.MAX_LOOKUP_HASHES]})
+    assert response.status_code == 200
+    assert len(response.json()["missing"]) == invoice.MAX_LOOKUP_HASHES
+
+@pytest.fixture
+def fake_pipeline(monkeypatch):
+    """Replace the OCR → LLM pipeline: slow files finish last, bad files fail"""
+    async def process_invoice(db, upload, ocr_backend=None):
+        content = upload.read_bytes()
+        if b"slow" in content:
+            await asyncio.sleep(0.3)
+        if b"bad" in content:
+            raise ValueError("Unreadable invoice")
+        return {"invoice_number": upload.filename, "ocr_backend": ocr_backend}
+
+    monkeypatch.setattr(invoice, "process_invoice", process_invoice)
+
+def batch_lines(response) -> list:
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+def test_batch_streams_a_line_per_file_as_each_finishes(client, stored_hashes, fake_pipeline):
+    files = [
+        ("files", ("slow.pdf", b"%PDF slow")),
+        ("files", ("fast.pdf", b"%PDF fast")),
+        ("files", ("bad.pdf", b"%PDF bad")),
+    ]
+    response = client.post("/extract/batch", files=files,
+                           data={"hashes": [stored_hashes[0], "0" * 64], "ocr_backend": "text_layer"})
+    lines = batch_lines(response)
+
+    assert sorted(line["index"] for line in lines) == [0, 1, 2, 3, 4]
+    assert lines[-1]["source"] == "slow.pdf"
+    by_source = {line["source"]: line for line in lines}
+    assert by_source["fast.pdf"]["status"] == "ok"
+    assert by_source["fast.pdf"]["result"] == {"invoice_number": "fast.pdf", "ocr_backend": "text_layer"}
+    assert by_source["bad.pdf"]["status"] == "error"
+    assert by_source["bad.pdf"]["error"] == "Unreadable invoice"
+    assert by_source[stored_hashes[0]]["filename"] == "0.pdf"
+    assert by_source[stored_hashes[0]]["status"] == "ok"
+    assert by_source["0" * 64]["status"] == "error"
+    assert "No stored file found" in by_source["0" * 64]["error"]
+
+def test_batch_keeps_to_its_concurrency(client, fake_pipeline):
+    files = [("files", ("slow.pdf", b"%PDF slow"))] + [("files", (f"{index}.pdf", b"%PDF fast")) for index in range(3)]
+    lines = batch_lines(client.post("/extract/batch", files=files, data={"concurrency": "1"}))
+    # One at a time, the fast files wait for the slow one sent before them
+    assert [line["index"] for line in lines] == [0, 1, 2, 3]
+
+def test_batch_rejects_invalid_requests(client, fake_pipeline):
+    assert client.post("/extract/batch").status_code == 400
+    files = [("files", ("fast.pdf", b"%PDF fast"))]
+    assert client.post("/extract/batch", files=files, data={"concurrency": "0"}).status_code == 400
+    assert client.post("/extract/batch", files=files, data={"ocr_backend": "paper"}).status_code == 400
+
+def test_extract_rejects_unusable_pdfs_before_any_ocr(client):
+    response = client.post("/extract", files={"file": ("invoice.pdf", b"%PDF-1.7 cut off here")})
+    assert response.status_code == 422
+    assert "truncated" in response.json()["detail"]
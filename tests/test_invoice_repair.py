@@ -0,0 +1,74 @@
+import pytest
+from src.core.extractors.invoice_repair import parse_dutch_date, parse_dutch_decimal, repair_arguments, repair_taxes
+
+@pytest.mark.parametrize("value, expected", [
+    ("1.234,56", "1234.56"),
+    ("1,234.56", "1234.56"),
+    ("€ 27,-", "27"),
+    ("12.50 EUR", "12.50"),
+    ("-15,00", "-15.00"),
+    ("1.234", "1234"),
+    ("12,345", "12345"),
+    ("1.234.567", "1234567"),
+    ("1.234,567", "1234.567"),
+    ("0,005", "0.005"),
+    (",005", "0.005"),
+    ("1,2345", "1.2345"),
+    ("1500", "1500"),
+])
+def test_parse_dutch_decimal(value, expected):
+    assert parse_dutch_decimal(value) == expected
+
+def test_parse_dutch_decimal_rejects_text():
+    assert parse_dutch_decimal("n.v.t.") is None
+
+@pytest.mark.parametrize("value, expected", [
+    ("31-12-2024", "2024-12-31"),
+    ("31/12/24", "2024-12-31"),
+    ("31.12.2024", "2024-12-31"),
+    ("31 december 2024", "2024-12-31"),
+    ("3 okt. 2023", "2023-10-03"),
+    ("2024-12-31T10:00:00", "2024-12-31"),
+])
+def test_parse_dutch_date(value, expected):
+    assert parse_dutch_date(value) == expected
+
+@pytest.mark.parametrize("value", ["31-02-2024", "morgen", "2024"])
+def test_parse_dutch_date_rejects_invalid_dates(value):
+    assert parse_dutch_date(value) is None
+
+def test_repair_taxes_leaves_misreads_to_the_model():
+    supplier = {"high_tax_base": "100.00", "high_tax": "21.30", "low_tax_base": "100.00", "low_tax": "9.01"}
+    repairs = []
+    repair_taxes(supplier, repairs)
+    assert supplier["high_tax"] == "21.30"
+    assert supplier["low_tax"] == "9.01"
+    assert repairs == []
+
+def test_repair_taxes_recomputes_rounding_differences_within_the_tolerance():
+    supplier = {"high_tax_base": "100.00", "high_tax": "21.04", "low_tax_base": "100.00", "low_tax": "9.50"}
+    repairs = []
+    repair_taxes(supplier, repairs, "suppliers[0].")
+    assert supplier["high_tax"] == "21.00"
+    assert supplier["low_tax"] == "9.50"
+    assert repairs == [{"repair": "tax", "field": "suppliers[0].high_tax", "original": "21.04", "value": "21.00"}]
+
+def test_repair_arguments_records_every_repair():
+    arguments = {
+        "invoice_date": "31-12-2024",
+        "due_date": "2025-01-14",
+        "amount_payable": "1.210,00",
+        "suppliers": [{"high_tax_base": "1.000,00", "high_tax": "210.00"}],
+        "details_supplier": {"vat_id": "BTW nr. 8123.45.678.B01"},
+    }
+    arguments, repairs = repair_arguments(arguments)
+    assert arguments["invoice_date"] == "2024-12-31"
+    assert arguments["amount_payable"] == "1210.00"
+    assert arguments["suppliers"][0]["high_tax_base"] == "1000.00"
+    assert arguments["details_supplier"]["vat_id"] == "NL812345678B01"
+    assert [(repair["repair"], repair["field"], repair["original"]) for repair in repairs] == [
+        ("date", "invoice_date", "31-12-2024"),
+        ("decimal", "amount_payable", "1.210,00"),
+        ("decimal", "suppliers[0].high_tax_base", "1.000,00"),
+        ("vat_id", "details_supplier.vat_id", "BTW nr. 8123.45.678.B01"),
+    ]
@@ -0,0 +1,67 @@
+import io
+import asyncio
+from pypdf import PdfReader, PdfWriter
+import src.core.extractors.pdf_extractor as pdf_extractor
+from src.core.extractors.invoice_segments import MAX_INVOICE_SEGMENTS, segment_invoices, combine_invoices
+from src.core.extractors.text_layer import join_pages, split_pages
+
+def test_pages_with_another_invoice_number_start_a_new_invoice():
+    text = join_pages([
+        "Factuurnummer: 2024-001\nTotaal 10,00",
+        "Vervolg van de factuur",
+        "Factuurnummer: 2024-002\nTotaal 20,00",
+    ])
+    segments = segment_invoices(text)
+    assert [(s.first_page, s.last_page, s.invoice_number) for s in segments] == [
+        (0, 1, "2024-001"),
+        (2, 2, "2024-002"),
+    ]
+
+def test_first_page_marker_starts_a_new_invoice():
+    text = join_pages(["Pagina 1 van 2\nKlant A", "Pagina 2 van 2", "Pagina 1 van 1\nKlant B"])
+    assert [(s.first_page, s.last_page) for s in segment_invoices(text)] == [(0, 1), (2, 2)]
+
+def test_repeated_invoice_number_stays_one_invoice():
+    text = join_pages(["Invoice number: INV-77\npage one", "Invoice no. INV-77\npage two"])
+    assert len(segment_invoices(text)) == 1
+
+def test_too_many_segments_keep_the_document_whole():
+    pages = [f"Factuurnummer: F{index:04d}" for index in range(MAX_INVOICE_SEGMENTS + 1)]
+    segments = segment_invoices(join_pages(pages))
+    assert [(s.first_page, s.last_page) for s in segments] == [(0, len(pages) - 1)]
+
+def test_blank_pages_keep_their_index():
+    pages = ["Factuurnummer: A-100", "", "Factuurnummer: B-200", ""]
+    assert split_pages(join_pages(pages)) == pages
+    segments = segment_invoices(join_pages(pages))
+    assert [(s.first_page, s.last_page) for s in segments] == [(0, 1), (2, 3)]
+
+def test_combine_invoices_adds_one_based_page_ranges():
+    segments = segment_invoices(join_pages(["Factuurnummer: A-100", "Factuurnummer: B-200"]))
+    combined = combine_invoices(segments, [{"invoice_number": "A-100"}, {"invoice_number": "B-200"}])
+    assert combined["invoice_number"] == "A-100"
+    assert [invoice["pages"] for invoice in combined["invoices"]] == [[1, 1], [2, 2]]
+
+def test_page_ranges_of_a_pdf_with_a_blank_page(monkeypatch):
+    # Two invoices with a blank page after each, the blank pages score low and go to "OCR"
+    writer = PdfWriter()
+    page_counts = []
+    for name in ["10001217105.pdf", "10001217106.pdf"]:
+        reader = PdfReader(f"data/pdfs/{name}")
+        page_counts.append(len(reader.pages))
+        for page in reader.pages:
+            writer.add_page(page)
+        writer.add_blank_page()
+    content = io.BytesIO()
+    writer.write(content)
+    monkeypatch.setattr(pdf_extractor, "OCR_ENGINE", "text_layer")
+
+    text = asyncio.run(pdf_extractor.process_pdf(content.getvalue(), "batch.pdf", ocr_backend="auto"))
+
+    first, second = page_counts
+    assert len(split_pages(text)) == first + second + 2
+    segments = segment_invoices(text)
+    assert [(s.first_page, s.last_page, s.invoice_number) for s in segments] == [
+        (0, first, "10001217105"),
+        (first + 1, first + second + 1, "10001217106"),
+    ]
@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+import src.core.pipeline.jobs as jobs
+from src.core.db.async_database import AsyncInvoiceDB
+from src.core.db.blob_store import BlobStore
+from src.core.db.database import InvoiceDB
+from src.core.db.job_queue import MAX_ATTEMPTS, JobQueue
+from src.core.executors import ExecutorProxy, db_executor
+from src.core.pipeline.jobs import JobWorker
+
+CONTENT = b"%PDF queued invoice"
+
+@pytest.fixture
+def queue(tmp_path):
+    db = InvoiceDB(str(tmp_path / "invoices.db"), BlobStore(str(tmp_path / "blobs")))
+    queue = JobQueue(db)
+    yield queue
+    db.conn.close()
+
+@pytest.fixture
+def file_hash(queue):
+    return queue.db.save_file("queued.pdf", CONTENT, None, None)[0]
+
+def test_jobs_are_leased_oldest_first_and_only_once(queue, file_hash):
+    first = queue.enqueue(file_hash, "first.pdf")
+    second = queue.enqueue(file_hash, "second.pdf")
+
+    assert queue.lease("worker-a")["id"] == first
+    job = queue.lease("worker-b")
+    assert job == {"id": second, "file_hash": file_hash, "filename": "second.pdf", "attempts": 1}
+    assert queue.lease("worker-c") is None
+
+def test_a_completed_job_holds_its_result(queue, file_hash):
+    job_id = queue.enqueue(file_hash, "queued.pdf")
+    assert queue.get_job(job_id)["status"] == "queued"
+    queue.lease("worker")
+    queue.complete(job_id, "worker", {"invoice_number": "Q-1"})
+
+    job = queue.get_job(job_id)
+    assert (job["status"], job["result"], job["error"]) == ("done", {"invoice_number": "Q-1"}, None)
+    assert queue.get_job("unknown") is None
+
+def test_only_the_lease_owner_can_complete_a_job(queue, file_hash):
+    job_id = queue.enqueue(file_hash, "queued.pdf")
+    queue.lease("worker")
+    queue.complete(job_id, "someone else", {"invoice_number": "Q-1"})
+    assert queue.get_job(job_id)["status"] == "running"
+
+def test_failed_jobs_are_retried_until_they_run_out_of_attempts(queue, file_hash):
+    job_id = queue.enqueue(file_hash, "queued.pdf")
+    for attempt in range(1, 3):
+        assert queue.lease("worker")["attempts"] == attempt
+        queue.fail(job_id, "worker", "OCR timed out", max_attempts=2)
+
+    job = queue.get_job(job_id)
+    assert (job["status"], job["attempts"], job["error"]) == ("failed", 2, "OCR timed out")
+    assert queue.lease("worker") is None
+
+def test_the_job_of_a_dead_worker_is_leased_again_once_its_lease_expires(queue, file_hash):
+    job_id = queue.enqueue(file_hash, "queued.pdf")
+    queue.lease("dead worker", lease_seconds=-1)
+    job = queue.lease("worker")
+    assert (job["id"], job["attempts"]) == (job_id, 2)
+
+def test_the_worker_stores_the_outcome_of_each_job(tmp_path, queue, file_hash, monkeypatch):
+    async def process_invoice(db, upload):
+        if upload.filename == "bad.pdf":
+            raise ValueError("Unreadable invoice")
+        return {"invoice_number": upload.filename, "content": upload.read_bytes().decode()}
+
+    monkeypatch.setattr(jobs, "process_invoice", process_invoice)
+
+    async def run():
+        db = AsyncInvoiceDB(str(tmp_path / "invoices.db"), blob_store=queue.db.blob_store)
+        await db.open()
+        try:
+            worker = JobWorker(db, ExecutorProxy(queue, db_executor))
+            job_ids = [await worker.queue.enqueue(job_hash, filename)
+                       for job_hash, filename in [(file_hash, "good.pdf"), (file_hash, "bad.pdf"), ("0" * 64, "missing.pdf")]]
+            while job := await worker.queue.lease("worker"):
+                await worker._process(job, "worker")
+            return job_ids
+        finally:
+            await db.close()
+
+    ok_id, bad_id, missing_id = asyncio.run(run())
+    assert queue.get_job(ok_id)["result"] == {"invoice_number": "good.pdf", "content": CONTENT.decode()}
+    bad, missing = queue.get_job(bad_id), queue.get_job(missing_id)
+    assert (bad["status"], bad["attempts"], bad["error"]) == ("failed", MAX_ATTEMPTS, "Unreadable invoice")
+    assert missing["status"] == "failed"
+    assert "No stored file found" in missing["error"]
@@ -0,0 +1,130 @@
+import json
+import asyncio
+import sqlite3
+import pytest
+from src.core.db.async_database import AsyncInvoiceDB
+from src.core.db.blob_store import BlobStore
+from src.core.db.database import SCHEMA_VERSION, InvoiceDB, get_file_hash
+
+# The schema as it was before the migrations, without blob_path or invoice segments
+BASELINE_SCHEMA = """
+    CREATE TABLE processed_files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_hash TEXT UNIQUE NOT NULL,
+        filename TEXT NOT NULL,
+        pdf_content BLOB,
+        text_content TEXT,
+        json_result TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_file_hash ON processed_files(file_hash);
+
+    CREATE TABLE invoice_data (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_id INTEGER NOT NULL,
+        invoice_number TEXT,
+        invoice_date DATE,
+        due_date DATE,
+        amount_payable DECIMAL(10,2),
+        currency TEXT,
+        recipient TEXT,
+        method_of_payment TEXT,
+        primary_supplier TEXT,
+        supplier_email TEXT,
+        supplier_address TEXT,
+        supplier_iban TEXT,
+        supplier_vat_id TEXT,
+        supplier_kvk TEXT,
+        high_tax_base DECIMAL(10,2),
+        high_tax DECIMAL(10,2),
+        low_tax_base DECIMAL(10,2),
+        low_tax DECIMAL(10,2),
+        null_tax_base DECIMAL(10,2),
+        amount_excl_tax DECIMAL(10,2),
+        total_emballage DECIMAL(10,2),
+        has_errors BOOLEAN DEFAULT FALSE,
+        error_messages TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (file_id) REFERENCES processed_files(id)
+    );
+    CREATE INDEX idx_invoice_number ON invoice_data(invoice_number);
+"""
+
+CONTENT = b"%PDF baseline invoice"
+RESULT = {"invoice_number": "B-1"}
+
+def columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """A database written by the baseline schema, holding one processed invoice"""
+    path = tmp_path / "invoices.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    cursor = conn.execute(
+        "INSERT INTO processed_files (file_hash, filename, pdf_content, text_content, json_result) VALUES (?, ?, ?, ?, ?)",
+        (get_file_hash(CONTENT), "baseline.pdf", CONTENT, "text", json.dumps(RESULT))
+    )
+    conn.execute("INSERT INTO invoice_data (file_id, invoice_number) VALUES (?, ?)", (cursor.lastrowid, "B-1"))
+    conn.commit()
+    conn.close()
+    return path
+
+def test_a_baseline_database_is_migrated_in_place(baseline_db, tmp_path):
+    db = InvoiceDB(str(baseline_db), BlobStore(str(tmp_path / "blobs")))
+    db.conn.close()
+
+    conn = sqlite3.connect(baseline_db)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        assert "blob_path" in columns(conn, "processed_files")
+        assert {"segment", "first_page", "last_page"} <= columns(conn, "invoice_data")
+        assert conn.execute("SELECT invoice_number, segment FROM invoice_data").fetchall() == [("B-1", 0)]
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list(invoice_data)")}
+        assert "idx_invoice_file_id" in indexes
+    finally:
+        conn.close()
+
+def test_migrating_twice_changes_nothing(baseline_db, tmp_path):
+    for _ in range(2):
+        InvoiceDB(str(baseline_db), BlobStore(str(tmp_path / "blobs"))).conn.close()
+
+    async def reopen():
+        db = AsyncInvoiceDB(str(baseline_db), blob_store=BlobStore(str(tmp_path / "blobs")))
+        await db.open()
+        await db.close()
+
+    asyncio.run(reopen())
+    conn = sqlite3.connect(baseline_db)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        assert conn.execute("SELECT COUNT(*) FROM invoice_data").fetchone()[0] == 1
+    finally:
+        conn.close()
+
+def test_unmigrated_rows_are_read_from_the_database_then_moved_to_the_blob_store(baseline_db, tmp_path):
+    store = BlobStore(str(tmp_path / "blobs"))
+
+    async def lookup():
+        db = AsyncInvoiceDB(str(baseline_db), blob_store=store)
+        await db.open()
+        try:
+            return await db.get_file_by_hash(get_file_hash(CONTENT))
+        finally:
+            await db.close()
+
+    assert asyncio.run(lookup()) == {"filename": "baseline.pdf", "file_content": CONTENT, "json_result": RESULT}
+
+    db = InvoiceDB(str(baseline_db), store)
+    try:
+        assert db.move_blobs_to_store() == 1
+        assert db.move_blobs_to_store() == 0
+        row = db.conn.execute("SELECT blob_path, pdf_content FROM processed_files").fetchone()
+        assert row["pdf_content"] is None
+        assert store.read(row["blob_path"]) == CONTENT
+    finally:
+        db.conn.close()
+
+    assert asyncio.run(lookup())["file_content"] == CONTENT
@@ -0,0 +1,56 @@
+import io
+import asyncio
+import pytest
+import src.core.extractors.pdf_extractor as pdf_extractor
+from src.core.extractors.ocr_backends import (
+    API_KEY_ENV,
+    OCR_BACKENDS,
+    TextLayerBackend,
+    WhisperBackend,
+    get_backend,
+    whisper_params
+)
+from src.core.extractors.tesseract_ocr import tesseract_available, tesseract_pdf
+from src.core.extractors.text_layer import extract_text_layer, join_pages
+
+PDF_PATH = "data/pdfs/10001217106.pdf"
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def test_backends_are_looked_up_by_name():
+    assert set(OCR_BACKENDS) == {"llmwhisperer", "text_layer", "tesseract"}
+    assert all(get_backend(name).name == name for name in OCR_BACKENDS)
+    with pytest.raises(ValueError, match="Unknown OCR backend 'paper'"):
+        get_backend("paper")
+
+def test_an_unknown_policy_is_rejected_before_any_work():
+    with pytest.raises(ValueError, match="Unknown OCR backend"):
+        asyncio.run(pdf_extractor.process_pdf(read(PDF_PATH), "invoice.pdf", ocr_backend="paper"))
+
+def test_the_text_layer_backend_returns_the_requested_pages():
+    pages = extract_text_layer(read(PDF_PATH))
+    backend = TextLayerBackend()
+    assert asyncio.run(backend.ocr(read(PDF_PATH))) == join_pages(pages)
+    assert asyncio.run(backend.ocr(io.BytesIO(read(PDF_PATH)), [0])) == join_pages(pages[:1])
+
+def test_whisper_pages_are_one_based_and_modes_are_kept():
+    assert whisper_params([0, 2])["pages_to_extract"] == "1,3"
+    assert whisper_params()["pages_to_extract"] == ""
+    backend = WhisperBackend().with_mode("native_text")
+    assert (backend.name, backend.mode) == ("llmwhisperer", "native_text")
+
+def test_llmwhisperer_is_only_available_with_an_api_key(monkeypatch):
+    monkeypatch.delenv(API_KEY_ENV, raising=False)
+    assert not WhisperBackend().available()
+    with pytest.raises(ValueError):
+        asyncio.run(WhisperBackend().ocr(b"%PDF"))
+    monkeypatch.setenv(API_KEY_ENV, "test")
+    assert WhisperBackend().available()
+
+@pytest.mark.skipif(tesseract_available(), reason="Tesseract is installed")
+def test_tesseract_explains_what_is_missing():
+    assert not get_backend("tesseract").available()
+    with pytest.raises(RuntimeError, match="tesseract"):
+        tesseract_pdf(read(PDF_PATH))
@@ -0,0 +1,99 @@
+import asyncio
+import sqlite3
+import pytest
+from src.core.db.async_database import AsyncInvoiceDB
+from src.core.db.blob_store import BlobStore
+from src.core.db.database import SCHEMA, evict_ocr_cache, save_ocr_cache_rows
+from src.core.extractors.ocr_backends import TesseractBackend, WhisperBackend
+from src.core.extractors.page_split import params_fingerprint
+from src.core.extractors.pdf_extractor import cached_ocr
+from src.core.extractors.text_layer import join_pages
+
+def cache_row(content_hash: str, size: int, last_used_at: float):
+    return (content_hash, "llmwhisperer", "form", "params", "x" * size, size, last_used_at)
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA)
+    yield conn
+    conn.close()
+
+def test_eviction_drops_the_least_recently_used_entries(conn):
+    save_ocr_cache_rows(conn, [cache_row("old", 100, 1.0), cache_row("recent", 100, 3.0), cache_row("older", 100, 0.5)])
+    assert evict_ocr_cache(conn, max_bytes=150) == 2
+    assert conn.execute("SELECT content_hash FROM ocr_cache").fetchall() == [("recent",)]
+
+def test_eviction_leaves_a_cache_within_its_size_alone(conn):
+    save_ocr_cache_rows(conn, [cache_row("a", 100, 1.0), cache_row("b", 100, 2.0)])
+    assert evict_ocr_cache(conn, max_bytes=200) == 0
+    assert conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0] == 2
+
+def test_fingerprints_depend_on_the_settings_not_their_order():
+    assert params_fingerprint({"a": 1, "b": 2}) == params_fingerprint({"b": 2, "a": 1})
+    assert params_fingerprint({"a": 1}) != params_fingerprint({"a": 2})
+    assert WhisperBackend("form").fingerprint() != WhisperBackend("native_text").fingerprint()
+    assert WhisperBackend().fingerprint() != TesseractBackend().fingerprint()
+
+class CountingBackend:
+    name = "counting"
+    mode = ""
+
+    def __init__(self):
+        self.runs = []
+
+    def fingerprint(self) -> str:
+        return params_fingerprint({"backend": self.name})
+
+    async def ocr(self, file_content, pages=None) -> str:
+        self.runs.append(pages)
+        return join_pages([f"page {page}" for page in pages or [0]])
+
+def test_cache_entries_are_keyed_by_content_backend_mode_settings_and_pages(tmp_path):
+    async def run():
+        db = AsyncInvoiceDB(str(tmp_path / "invoices.db"), blob_store=BlobStore(str(tmp_path / "blobs")))
+        await db.open()
+        try:
+            backend = CountingBackend()
+            texts = [
+                await cached_ocr(backend, b"%PDF one", None, db),
+                await cached_ocr(backend, b"%PDF one", None, db),
+                await cached_ocr(backend, b"%PDF one", [1], db),
+                await cached_ocr(backend, b"%PDF one", [1], db),
+                await cached_ocr(backend, b"%PDF two", None, db),
+            ]
+            await db.save_ocr_cache({"hash": "form text"}, "llmwhisperer", "form", "params")
+            lookups = [
+                await db.get_ocr_cache(["hash", "other"], "llmwhisperer", "form", "params"),
+                await db.get_ocr_cache(["hash"], "llmwhisperer", "native_text", "params"),
+                await db.get_ocr_cache(["hash"], "llmwhisperer", "form", "other params"),
+                await db.get_ocr_cache(["hash"], "tesseract", "form", "params"),
+            ]
+            return backend.runs, texts, lookups
+        finally:
+            await db.close()
+
+    runs, texts, lookups = asyncio.run(run())
+    assert runs == [None, [1], None]
+    assert texts[0] == texts[1] == texts[4]
+    assert texts[2] == texts[3] == join_pages(["page 1"])
+    assert lookups == [{"hash": "form text"}, {}, {}, {}]
+
+def test_a_cache_hit_counts_as_a_recent_use(tmp_path):
+    async def run():
+        db = AsyncInvoiceDB(str(tmp_path / "invoices.db"), blob_store=BlobStore(str(tmp_path / "blobs")))
+        await db.open()
+        try:
+            await db.save_ocr_cache({"first": "a"}, "llmwhisperer", "form", "params")
+            await db.save_ocr_cache({"second": "b"}, "llmwhisperer", "form", "params")
+            await db.get_ocr_cache(["first"], "llmwhisperer", "form", "params")
+        finally:
+            await db.close()
+
+    asyncio.run(run())
+    conn = sqlite3.connect(tmp_path / "invoices.db")
+    try:
+        assert evict_ocr_cache(conn, max_bytes=1) == 1
+        assert conn.execute("SELECT content_hash FROM ocr_cache").fetchall() == [("first",)]
+    finally:
+        conn.close()
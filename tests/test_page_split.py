@@ -0,0 +1,99 @@
+import io
+import asyncio
+from pypdf import PdfReader, PdfWriter
+import src.core.extractors.pdf_extractor as pdf_extractor
+from src.core.extractors.page_split import merge_pdfs, page_groups, page_hash, split_pdf
+from src.core.extractors.pdf_extractor import merge_ocr_pages, ocr_document, ocr_page_pdfs
+from src.core.extractors.text_layer import join_pages, split_pages
+
+PDF_PATHS = ["data/pdfs/10001217105.pdf", "data/pdfs/10001217106.pdf"]
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def combined_pdf(paths) -> bytes:
+    writer = PdfWriter()
+    for path in paths:
+        for page in PdfReader(path).pages:
+            writer.add_page(page)
+    content = io.BytesIO()
+    writer.write(content)
+    return content.getvalue()
+
+class PageBackend:
+    """Backend that answers with the page count of each job and records the jobs"""
+
+    name = "pages"
+    mode = ""
+
+    def __init__(self):
+        self.jobs = []
+
+    def fingerprint(self) -> str:
+        return "pages"
+
+    async def ocr(self, file_content, pages=None) -> str:
+        count = len(PdfReader(io.BytesIO(file_content)).pages)
+        self.jobs.append(count)
+        return join_pages([f"ocr {len(self.jobs)}.{index}" for index in range(count)])
+
+class MemoryCache:
+    def __init__(self):
+        self.entries = {}
+
+    async def get_ocr_cache(self, hashes, backend, mode, fingerprint):
+        return {h: self.entries[h] for h in hashes if h in self.entries}
+
+    async def save_ocr_cache(self, texts, backend, mode, fingerprint):
+        self.entries.update(texts)
+
+def test_split_pages_keep_their_hash_in_another_document():
+    first = split_pdf(read(PDF_PATHS[0]))
+    combined = split_pdf(combined_pdf(PDF_PATHS))
+    assert len(combined) == len(PdfReader(PDF_PATHS[0]).pages) + len(PdfReader(PDF_PATHS[1]).pages)
+    assert all(len(PdfReader(io.BytesIO(pdf)).pages) == 1 for pdf in combined.values())
+    assert [page_hash(pdf) for pdf in first.values()] == [page_hash(combined[index]) for index in first]
+
+def test_split_only_the_requested_pages_and_merge_them_back():
+    pages = split_pdf(combined_pdf(PDF_PATHS), [0, 2])
+    assert list(pages) == [0, 2]
+    assert len(PdfReader(io.BytesIO(merge_pdfs(list(pages.values())))).pages) == 2
+
+def test_page_groups_hold_consecutive_pages():
+    assert page_groups([0, 1, 2, 4, 5, 7], 2) == [[0, 1], [2], [4, 5], [7]]
+    assert page_groups([0, 1, 2], 1) == [[0], [1], [2]]
+    assert page_groups([], 3) == []
+
+def test_ocr_text_replaces_the_low_quality_pages_in_page_order():
+    merged = merge_ocr_pages(["text 0", "", "text 2", ""], [1, 3], join_pages(["ocr 1", "ocr 3"]))
+    assert split_pages(merged) == ["text 0", "ocr 1", "text 2", "ocr 3"]
+
+def test_ocr_text_without_page_boundaries_stays_at_the_first_ocr_page():
+    merged = merge_ocr_pages(["text 0", "", ""], [1, 2], "ocr without separators")
+    assert split_pages(merged) == ["text 0", "ocr without separators", ""]
+
+def test_pages_are_ocrd_in_jobs_and_stitched_back_in_order(monkeypatch):
+    monkeypatch.setattr(pdf_extractor, "OCR_PAGES_PER_JOB", 2)
+    content = combined_pdf(PDF_PATHS)
+    page_count = len(PdfReader(io.BytesIO(content)).pages)
+    text_layer = [f"text {index}" for index in range(page_count)]
+    backend = PageBackend()
+
+    text = asyncio.run(ocr_document(backend, content, "scan.pdf", text_layer, [0, 1, 3], split=True))
+    pages = split_pages(text)
+    assert sorted(backend.jobs) == [1, 2]
+    assert pages[2] == "text 2"
+    assert [pages[index].startswith("ocr") for index in (0, 1, 3)] == [True, True, True]
+    assert pages[0].split(".")[0] == pages[1].split(".")[0]
+
+def test_a_re_sent_document_only_ocrs_its_new_pages():
+    first = split_pdf(read(PDF_PATHS[0]))
+    combined = split_pdf(combined_pdf(PDF_PATHS))
+    backend = PageBackend()
+    cache = MemoryCache()
+
+    asyncio.run(ocr_page_pdfs(backend, first, cache))
+    texts = asyncio.run(ocr_page_pdfs(backend, combined, cache))
+    assert len(backend.jobs) == len(combined)
+    assert sorted(texts) == sorted(combined)
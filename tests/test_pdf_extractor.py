@@ -0,0 +1,125 @@
+import io
+import asyncio
+from typing import List, Optional
+from pypdf import PdfReader, PdfWriter
+import src.core.extractors.ocr_backends as ocr_backends
+import src.core.extractors.pdf_extractor as pdf_extractor
+from src.core.concurrency import ocr_limiter
+from src.core.extractors.ocr_backends import WhisperBackend
+from src.core.extractors.text_layer import join_pages
+from src.core.extractors.whisper_client import WhisperError
+
+PDF_PATH = "data/pdfs/10001217105.pdf"
+
+INVOICE_PAGE = "Factuur 2024-001\nBTW NL812345678B01\nSubtotaal 100,00\nBTW 21% 21,00\nTotaal 121,00\n" + "x" * 100
+
+class FakeWhisper(WhisperBackend):
+    """LLMWhisperer stand-in that records the calls and answers with fixed text"""
+
+    def __init__(self, mode: str = "native_text", calls: Optional[List[str]] = None):
+        super().__init__(mode)
+        self.calls = [] if calls is None else calls
+
+    def with_mode(self, mode: str) -> 'FakeWhisper':
+        return FakeWhisper(mode, self.calls)
+
+    async def ocr(self, file_content, pages=None) -> str:
+        self.calls.append(self.mode)
+        return join_pages([INVOICE_PAGE])
+
+class BrokenTierStore:
+    async def get_tier_stats(self, stage, keys):
+        raise RuntimeError("database is locked")
+
+    async def record_tier_outcomes(self, stage, key, outcomes, supplier=None):
+        raise RuntimeError("database is locked")
+
+def test_ocr_text_survives_a_failing_tier_memory():
+    backend = FakeWhisper()
+    text = asyncio.run(pdf_extractor.ocr_tiered(backend, b"%PDF", "scan.pdf", None, None,
+                                                tier_store=BrokenTierStore(), source="source:test"))
+    assert text == join_pages([INVOICE_PAGE])
+    assert backend.calls == ["native_text"]
+
+def test_only_llmwhisperer_jobs_take_an_ocr_slot(monkeypatch):
+    in_flight = []
+
+    class FakeClient:
+        async def whisper(self, file_content, params, wait_timeout):
+            in_flight.append(ocr_limiter.in_flight)
+            return join_pages([INVOICE_PAGE])
+
+    monkeypatch.setattr(ocr_backends, "get_whisper_client", lambda api_key: FakeClient())
+    monkeypatch.setenv("LLMWHISPERER_API_KEY", "test")
+    asyncio.run(ocr_backends.WhisperBackend().ocr(b"%PDF"))
+    assert in_flight == [1]
+    assert ocr_limiter.in_flight == 0
+
+class MemoryCache:
+    """OCR cache with the get_ocr_cache and save_ocr_cache of AsyncInvoiceDB"""
+
+    def __init__(self):
+        self.entries = {}
+
+    async def get_ocr_cache(self, hashes, backend, mode, fingerprint):
+        return {h: self.entries[h, backend, mode, fingerprint] for h in hashes if (h, backend, mode, fingerprint) in self.entries}
+
+    async def save_ocr_cache(self, texts, backend, mode, fingerprint):
+        self.entries.update({(h, backend, mode, fingerprint): text for h, text in texts.items()})
+
+class CountingBackend:
+    """Local backend that counts its runs"""
+
+    name = "counting"
+    mode = ""
+
+    def __init__(self):
+        self.runs = 0
+
+    def available(self) -> bool:
+        return True
+
+    def fingerprint(self) -> str:
+        return "counting"
+
+    async def ocr(self, file_content, pages=None) -> str:
+        self.runs += 1
+        return join_pages([INVOICE_PAGE] * (len(pages) if pages is not None else 1))
+
+def pdf_with_blank_page() -> bytes:
+    writer = PdfWriter()
+    for page in PdfReader(PDF_PATH).pages:
+        writer.add_page(page)
+    writer.add_blank_page()
+    content = io.BytesIO()
+    writer.write(content)
+    return content.getvalue()
+
+def test_the_text_layer_policy_goes_through_the_ocr_cache():
+    cache = MemoryCache()
+    content = open(PDF_PATH, "rb").read()
+    first = asyncio.run(pdf_extractor.process_pdf(content, "invoice.pdf", ocr_cache=cache, ocr_backend="text_layer"))
+    assert [key[1] for key in cache.entries] == ["text_layer"]
+    second = asyncio.run(pdf_extractor.process_pdf(content, "invoice.pdf", ocr_cache=cache, ocr_backend="text_layer"))
+    assert first == second
+
+def test_the_fallback_backend_is_not_run_twice_for_a_document(monkeypatch):
+    class FailingWhisper(FakeWhisper):
+        def with_mode(self, mode: str) -> 'FailingWhisper':
+            return FailingWhisper(mode, self.calls)
+
+        async def ocr(self, file_content, pages=None) -> str:
+            raise WhisperError("POST /whisper failed", 503)
+
+    fallback = CountingBackend()
+    backends = {"llmwhisperer": FailingWhisper(), "counting": fallback}
+    monkeypatch.setattr(pdf_extractor, "get_backend", backends.__getitem__)
+    monkeypatch.setattr(pdf_extractor, "OCR_ENGINE", "llmwhisperer")
+    monkeypatch.setattr(pdf_extractor, "OCR_FALLBACK", "counting")
+    cache = MemoryCache()
+    content = pdf_with_blank_page()
+
+    texts = [asyncio.run(pdf_extractor.process_pdf(content, "scan.pdf", ocr_cache=cache, ocr_backend="auto"))
+             for _ in range(2)]
+    assert texts[0] == texts[1]
+    assert fallback.runs == 1
@@ -0,0 +1,50 @@
+import io
+from pypdf import PdfReader, PdfWriter
+import src.core.extractors.preflight as preflight
+from src.core.extractors.preflight import ROUTE_REJECT, ROUTE_TEXT_LAYER, inspect_pdf
+
+PDF_PATH = "data/pdfs/10001217105.pdf"
+
+def pdf_bytes(writer: PdfWriter) -> bytes:
+    content = io.BytesIO()
+    writer.write(content)
+    return content.getvalue()
+
+def invoice_pdf(password: str = "") -> bytes:
+    writer = PdfWriter(clone_from=PdfReader(PDF_PATH))
+    if password:
+        writer.encrypt(password)
+    return pdf_bytes(writer)
+
+def test_a_born_digital_invoice_goes_to_the_text_layer():
+    report = inspect_pdf(invoice_pdf())
+    assert report.route == ROUTE_TEXT_LAYER
+    assert report.text_pages == list(range(report.page_count))
+    assert report.ocr_cost == 0
+
+def test_a_file_object_is_inspected_and_rewound():
+    file = io.BytesIO(invoice_pdf())
+    assert inspect_pdf(file).route == ROUTE_TEXT_LAYER
+    assert file.tell() == 0
+
+def test_files_that_are_not_pdfs_are_rejected():
+    report = inspect_pdf(b"Factuur 2024-001, totaal 121,00")
+    assert (report.route, report.reason) == (ROUTE_REJECT, "Not a PDF file (missing %PDF- header)")
+
+def test_truncated_pdfs_are_rejected():
+    content = invoice_pdf()
+    assert "truncated" in inspect_pdf(content[:len(content) // 2]).reason
+
+def test_password_protected_pdfs_are_rejected():
+    report = inspect_pdf(invoice_pdf(password="secret"))
+    assert report.route == ROUTE_REJECT
+    assert report.encrypted
+
+def test_pdfs_with_too_many_pages_are_rejected(monkeypatch):
+    monkeypatch.setattr(preflight, "PREFLIGHT_MAX_PAGES", 1)
+    writer = PdfWriter()
+    writer.add_blank_page(200, 200)
+    writer.add_blank_page(200, 200)
+    report = inspect_pdf(pdf_bytes(writer))
+    assert report.route == ROUTE_REJECT
+    assert report.page_count == 2
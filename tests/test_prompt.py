@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+from src.core.metrics import metrics
+from src.core.extractors.invoice_extractor import (
+    SYSTEM_PROMPT,
+    emballage_info,
+    prepare_messages,
+    record_usage,
+    user_info
+)
+
+INVOICE = "Bakkerij de Korenschoof\nFactuur K-1001\nTotaal 42,35"
+EMBALLAGE_INVOICE = "Drankenhandel Noord\nFactuur N-2001\nStatiegeld kratten 3,90\nTotaal 103,90"
+
+def test_every_invoice_starts_with_the_same_static_prefix():
+    plain = prepare_messages(INVOICE, compact=False)
+    emballage = prepare_messages(EMBALLAGE_INVOICE, compact=False)
+    assert plain[0] == emballage[0] == {"role": "system", "content": SYSTEM_PROMPT}
+    assert user_info in SYSTEM_PROMPT
+    assert emballage_info not in SYSTEM_PROMPT
+
+def test_per_invoice_content_follows_the_prefix():
+    plain = prepare_messages(INVOICE, compact=False)
+    emballage = prepare_messages(EMBALLAGE_INVOICE, compact=False)
+    assert plain[1] == {"role": "user", "content": f"Here is the invoice:\n{INVOICE}"}
+    assert emballage[1]["content"].startswith(f"###\n{emballage_info}")
+    assert emballage[1]["content"].endswith(f"Here is the invoice:\n{EMBALLAGE_INVOICE}")
+
+def test_compaction_only_changes_the_invoice_text():
+    layout = "Factuur K-1001" + " " * 40 + "Datum 12-03-2024\n\n\n\nTotaal" + " " * 30 + "42,35"
+    messages = prepare_messages(layout, compact=True)
+    assert messages[0]["content"] == SYSTEM_PROMPT
+    assert len(messages[1]["content"]) < len(f"Here is the invoice:\n{layout}")
+
+def test_cached_prompt_tokens_are_counted():
+    before = metrics.snapshot()
+    usage = SimpleNamespace(prompt_tokens=1500, completion_tokens=200,
+                            prompt_tokens_details=SimpleNamespace(cached_tokens=1280))
+    record_usage(SimpleNamespace(usage=usage), "invoice.pdf")
+    record_usage(SimpleNamespace(usage=None), "invoice.pdf")
+    after = metrics.snapshot()
+    assert after["llm_prompt_tokens"] - before.get("llm_prompt_tokens", 0) == 1500
+    assert after["llm_cached_prompt_tokens"] - before.get("llm_cached_prompt_tokens", 0) == 1280
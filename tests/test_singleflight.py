@@ -0,0 +1,104 @@
+import io
+import asyncio
+import pytest
+from src.core.db.async_database import AsyncInvoiceDB
+from src.core.db.blob_store import BlobStore
+from src.core.db.database import get_file_hash
+from src.core.pipeline.singleflight import SingleFlight
+
+CONTENT = b"%PDF coalesced invoice"
+FILE_HASH = get_file_hash(CONTENT)
+
+@pytest.fixture
+def open_db(tmp_path):
+    """Run a coroutine function against a freshly opened database"""
+    def run(fn):
+        async def main():
+            db = AsyncInvoiceDB(str(tmp_path / "invoices.db"), blob_store=BlobStore(str(tmp_path / "blobs")))
+            await db.open()
+            try:
+                return await fn(db)
+            finally:
+                await db.close()
+        return asyncio.run(main())
+    return run
+
+def test_concurrent_requests_for_a_file_share_one_extraction(open_db):
+    calls = []
+
+    async def extract():
+        calls.append(FILE_HASH)
+        await asyncio.sleep(0.1)
+        return {"invoice_number": "S-1"}
+
+    async def run(db):
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.run(db, FILE_HASH, extract) for _ in range(5)))
+        return results, flight.in_flight
+
+    results, in_flight = open_db(run)
+    assert calls == [FILE_HASH]
+    assert results == [{"invoice_number": "S-1"}] * 5
+    assert in_flight == {}
+
+def test_different_files_are_extracted_separately(open_db):
+    async def run(db):
+        flight = SingleFlight()
+        return await asyncio.gather(
+            flight.run(db, "a" * 64, lambda: asyncio.sleep(0, {"file": "a"})),
+            flight.run(db, "b" * 64, lambda: asyncio.sleep(0, {"file": "b"})),
+        )
+
+    assert open_db(run) == [{"file": "a"}, {"file": "b"}]
+
+def test_a_failed_extraction_fails_every_waiting_request_and_can_be_retried(open_db):
+    async def fail():
+        await asyncio.sleep(0.05)
+        raise ValueError("Unreadable invoice")
+
+    async def run(db):
+        flight = SingleFlight()
+        outcomes = await asyncio.gather(*(flight.run(db, FILE_HASH, fail) for _ in range(3)), return_exceptions=True)
+        retry = await flight.run(db, FILE_HASH, lambda: asyncio.sleep(0, {"invoice_number": "S-1"}))
+        return outcomes, retry
+
+    outcomes, retry = open_db(run)
+    assert [str(outcome) for outcome in outcomes] == ["Unreadable invoice"] * 3
+    assert retry == {"invoice_number": "S-1"}
+
+def test_a_cancelled_request_does_not_cancel_the_others(open_db):
+    async def extract():
+        await asyncio.sleep(0.1)
+        return {"invoice_number": "S-1"}
+
+    async def run(db):
+        flight = SingleFlight()
+        leader = asyncio.create_task(flight.run(db, FILE_HASH, extract))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.run(db, FILE_HASH, extract))
+        leader.cancel()
+        return await follower
+
+    assert open_db(run) == {"invoice_number": "S-1"}
+
+def test_a_file_leased_by_another_worker_waits_for_its_stored_result(open_db):
+    async def extract():
+        raise AssertionError("The file is extracted by the other worker")
+
+    async def run(db):
+        assert await db.acquire_extraction_lease(FILE_HASH, "other worker", 60)
+        flight = SingleFlight(poll_interval=0.05)
+        waiting = asyncio.create_task(flight.run(db, FILE_HASH, extract))
+        await asyncio.sleep(0.1)
+        assert not waiting.done()
+        await db.persist_extraction("coalesced.pdf", FILE_HASH, io.BytesIO(CONTENT), "text", {"invoice_number": "S-1"})
+        return await waiting
+
+    assert open_db(run) == {"invoice_number": "S-1"}
+
+def test_the_lease_is_released_after_the_extraction(open_db):
+    async def run(db):
+        await SingleFlight().run(db, FILE_HASH, lambda: asyncio.sleep(0, {"invoice_number": "S-1"}))
+        return await db.acquire_extraction_lease(FILE_HASH, "other worker", 60)
+
+    assert open_db(run)
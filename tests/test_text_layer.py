@@ -0,0 +1,87 @@
+import io
+import asyncio
+import pytest
+from pypdf import PdfReader, PdfWriter
+import src.core.extractors.pdf_extractor as pdf_extractor
+from src.core.extractors.text_layer import (
+    MIN_PAGE_CHARS,
+    TEXT_LAYER_MIN_SCORE,
+    extract_text_layer,
+    join_pages,
+    low_quality_pages,
+    score_page_text,
+    split_pages
+)
+
+BORN_DIGITAL = "data/pdfs/10001217105.pdf"
+SCANNED = "data/pdfs/22216605.pdf"
+
+CLEAN_PAGE = "Factuur 2024-001 Datum 12-03-2024\nOmschrijving Aantal Prijs Bedrag\nKoffiebonen 2 12,50 25,00\nTotaal excl. BTW 25,00\n"
+
+class RecordingBackend:
+    """OCR backend that records the pages it is asked for"""
+
+    name = "recording"
+    mode = ""
+
+    def __init__(self):
+        self.calls = []
+
+    def available(self) -> bool:
+        return True
+
+    def fingerprint(self) -> str:
+        return "recording"
+
+    async def ocr(self, file_content, pages=None) -> str:
+        self.calls.append(pages)
+        return join_pages([f"ocr page {page}" for page in pages or [0]])
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = RecordingBackend()
+    monkeypatch.setattr(pdf_extractor, "get_backend", lambda name: backend)
+    return backend
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+def with_blank_page(path: str) -> bytes:
+    writer = PdfWriter()
+    for page in PdfReader(path).pages:
+        writer.add_page(page)
+    writer.add_blank_page()
+    content = io.BytesIO()
+    writer.write(content)
+    return content.getvalue()
+
+def test_clean_text_scores_high_and_garbage_scores_zero():
+    assert score_page_text(CLEAN_PAGE) >= TEXT_LAYER_MIN_SCORE
+    assert score_page_text("Factuur") == 0.0
+    assert score_page_text("(cid:12)(cid:34) " * MIN_PAGE_CHARS) == 0.0
+    assert score_page_text("■□▪ " * MIN_PAGE_CHARS) < TEXT_LAYER_MIN_SCORE
+    assert low_quality_pages([CLEAN_PAGE, "", CLEAN_PAGE]) == [1]
+
+def test_pages_without_content_read_as_empty():
+    pages = extract_text_layer(with_blank_page(BORN_DIGITAL))
+    assert pages[-1] == ""
+    assert "".join(pages[:-1]).strip()
+
+def test_a_born_digital_pdf_skips_ocr(backend):
+    text = asyncio.run(pdf_extractor.process_pdf(read(BORN_DIGITAL), "invoice.pdf", ocr_backend="auto"))
+    assert backend.calls == []
+    assert split_pages(text) == extract_text_layer(read(BORN_DIGITAL))
+
+def test_only_the_pages_without_usable_text_go_to_ocr(backend):
+    content = with_blank_page(BORN_DIGITAL)
+    blank = len(PdfReader(io.BytesIO(content)).pages) - 1
+    text = asyncio.run(pdf_extractor.process_pdf(content, "invoice.pdf", ocr_backend="auto"))
+    assert backend.calls == [[blank]]
+    pages = split_pages(text)
+    assert pages[:blank] == extract_text_layer(read(BORN_DIGITAL))
+    assert pages[blank] == f"ocr page {blank}"
+
+def test_a_scanned_pdf_goes_to_ocr(backend):
+    asyncio.run(pdf_extractor.process_pdf(read(SCANNED), "scan.pdf", ocr_backend="auto"))
+    assert len(backend.calls) == 1
@@ -0,0 +1,36 @@
+import src.core.tier_memory as tier_memory
+from src.core.tier_memory import TierStats, choose_tiers, decay, tier_outcomes
+
+TIERS = ["gpt-4o-mini", "gpt-4o"]
+
+def test_decay_halves_a_count_every_half_life():
+    half_life = tier_memory.TIER_HALF_LIFE_DAYS * tier_memory.SECONDS_PER_DAY
+    assert decay(4.0, 0.0, now=half_life) == 2.0
+    assert decay(4.0, 0.0, now=2 * half_life) == 1.0
+    assert decay(4.0, 100.0, now=50.0) == 4.0
+
+def test_one_failure_does_not_skip_the_cheap_tier():
+    assert choose_tiers(TIERS, {"gpt-4o-mini": TierStats(0, 1)}, explore=0) == TIERS
+
+def test_repeated_failures_skip_the_cheap_tier():
+    assert choose_tiers(TIERS, {"gpt-4o-mini": TierStats(0, 2)}, explore=0) == ["gpt-4o"]
+
+def test_a_tier_that_mostly_succeeds_is_not_skipped():
+    assert choose_tiers(TIERS, {"gpt-4o-mini": TierStats(8, 3)}, explore=0) == TIERS
+
+def test_decayed_failures_let_the_cheap_tier_back_in():
+    half_life = tier_memory.TIER_HALF_LIFE_DAYS * tier_memory.SECONDS_PER_DAY
+    failures = decay(2.0, 0.0, now=half_life)
+    assert choose_tiers(TIERS, {"gpt-4o-mini": TierStats(0, failures)}, explore=0) == TIERS
+
+def test_exploration_starts_at_the_cheapest_tier():
+    assert choose_tiers(TIERS, {"gpt-4o-mini": TierStats(0, 5)}, explore=1) == TIERS
+
+def test_the_strongest_tier_is_never_skipped():
+    stats = {"gpt-4o-mini": TierStats(0, 5), "gpt-4o": TierStats(0, 5)}
+    assert choose_tiers(TIERS, stats, explore=0) == ["gpt-4o"]
+
+def test_tier_outcomes():
+    assert tier_outcomes(TIERS, "gpt-4o") == [("gpt-4o-mini", False), ("gpt-4o", True)]
+    assert tier_outcomes(TIERS, "gpt-4o-mini") == [("gpt-4o-mini", True)]
+    assert tier_outcomes(["gpt-4o"], "gpt-4o") == [("gpt-4o", True)]
@@ -0,0 +1,118 @@
+import io
+import asyncio
+import hashlib
+import pytest
+from httpx import ASGITransport, AsyncClient
+from fastapi import APIRouter, FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from starlette.formparsers import MultiPartParser
+from src.api.middleware import UploadParser, UploadRoute, UploadSizeLimitMiddleware
+from src.core.pipeline.uploads import SPOOL_MAX_SIZE, FileTooLargeError, SpooledUpload, spool_upload
+
+LIMIT = 1000
+
+def upload_app() -> FastAPI:
+    app = FastAPI()
+    uploads = APIRouter(route_class=UploadRoute)
+    plain = APIRouter()
+
+    @uploads.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        spooled = await spool_upload(file)
+        return {"spool_max_size": file.file._max_size, "hash": spooled.file_hash, "size": spooled.size}
+
+    @uploads.post("/upload/spooled")
+    async def upload_spooled(file: UploadFile = File(...)):
+        spooled = await spool_upload(file)
+        return {"rolled": file.file._rolled, "named": isinstance(file.file.name, str),
+                "content": spooled.read_bytes().decode()}
+
+    @uploads.post("/upload/batch")
+    async def upload_batch(files: list[UploadFile] = File(...)):
+        return {"files": len(files)}
+
+    @plain.post("/other")
+    async def other(file: UploadFile = File(...)):
+        return {"spool_max_size": file.file._max_size}
+
+    app.include_router(uploads)
+    app.include_router(plain)
+    app.add_middleware(UploadSizeLimitMiddleware, limits={"/upload": LIMIT, "/upload/batch": 10 * LIMIT})
+    return app
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(upload_app()) as client:
+        yield client
+
+def test_upload_routes_spool_with_their_own_threshold(client):
+    content = b"%PDF" + b"x" * 100
+    response = client.post("/upload", files={"file": ("invoice.pdf", content)})
+    assert response.json() == {
+        "spool_max_size": SPOOL_MAX_SIZE,
+        "hash": hashlib.sha256(content).hexdigest(),
+        "size": len(content),
+    }
+
+def test_other_routes_keep_the_framework_threshold(client):
+    response = client.post("/other", files={"file": ("invoice.pdf", b"%PDF")})
+    assert response.json() == {"spool_max_size": MultiPartParser.spool_max_size}
+    assert MultiPartParser.spool_max_size != SPOOL_MAX_SIZE
+
+def test_a_body_over_the_limit_is_rejected(client):
+    response = client.post("/upload", files={"file": ("invoice.pdf", b"x" * 2 * LIMIT)})
+    assert response.status_code == 413
+
+def test_a_streamed_body_over_the_limit_is_rejected_while_it_is_received(client):
+    def chunks():
+        for _ in range(10):
+            yield b"x" * LIMIT
+
+    response = client.post("/upload", content=chunks(),
+                           headers={"Content-Type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+
+def test_the_longest_matching_path_sets_the_limit(client):
+    files = [("files", (f"{index}.pdf", b"x" * (LIMIT // 2))) for index in range(4)]
+    assert client.post("/upload/batch", files=files).json() == {"files": 4}
+    assert client.post("/upload", files={"file": files[0][1]}).status_code == 200
+    assert client.post("/upload", files=files).status_code == 413
+    assert UploadSizeLimitMiddleware(None, {"/upload": 1, "/upload/batch": 2}).limit_for("/uploads") is None
+
+def test_spool_upload_rejects_files_over_the_size_limit():
+    class Upload:
+        filename = "big.pdf"
+        size = None
+
+        def __init__(self, content: bytes):
+            self.file = io.BytesIO(content)
+
+    with pytest.raises(FileTooLargeError):
+        asyncio.run(spool_upload(Upload(b"x" * 2048), max_size_mb=1 / 1024))
+    assert asyncio.run(spool_upload(Upload(b"x" * 1024), max_size_mb=1 / 1024)).size == 1024
+
+def test_uploads_with_the_same_filename_stay_separate(client):
+    async def upload(content: bytes):
+        async with AsyncClient(transport=ASGITransport(client.app), base_url="http://test") as http:
+            return (await http.post("/upload", files={"file": ("invoice.pdf", content)})).json()
+
+    async def run():
+        return await asyncio.gather(upload(b"%PDF first"), upload(b"%PDF second"))
+
+    first, second = asyncio.run(run())
+    assert first["hash"] == hashlib.sha256(b"%PDF first").hexdigest()
+    assert second["hash"] == hashlib.sha256(b"%PDF second").hexdigest()
+
+def test_large_uploads_spill_to_an_anonymous_file(client, monkeypatch):
+    monkeypatch.setattr(UploadParser, "spool_max_size", 100)
+    response = client.post("/upload/spooled", files={"file": ("invoice.pdf", b"x" * 500)})
+    assert response.json() == {"rolled": True, "named": False, "content": "x" * 500}
+    small = client.post("/upload/spooled", files={"file": ("invoice.pdf", b"x" * 50)})
+    assert small.json()["rolled"] is False
+
+def test_content_from_the_database_is_wrapped_without_spooling():
+    content = b"%PDF stored" * 100
+    upload = SpooledUpload.from_bytes("stored.pdf", content)
+    assert (upload.file_hash, upload.size) == (hashlib.sha256(content).hexdigest(), len(content))
+    assert b"".join(upload.chunks()) == upload.read_bytes() == content
+    assert SpooledUpload.from_bytes("stored.pdf", content, "known hash").file_hash == "known hash"
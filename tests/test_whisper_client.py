@@ -0,0 +1,50 @@
+import asyncio
+import io
+import pytest
+from pypdf import PdfReader
+from conftest import stub_server
+from src.core.extractors.text_layer import split_pages
+from src.core.extractors.whisper_client import AsyncWhisperClient, WhisperError
+
+PDF_PATH = "data/pdfs/10001217105.pdf"
+
+@pytest.fixture(scope="module")
+def whisper_stub():
+    """Run tools/whisper_server.py with jobs processed after a few polls"""
+    with stub_server("tools.whisper_server", "WHISPER_STUB_PORT", {"WHISPER_STUB_DELAY": "0.5"}) as url:
+        yield f"{url}/api/v2"
+
+def whisper(base_url: str, content, params, api_key: str = "test", wait_timeout: float = 10):
+    async def run():
+        client = AsyncWhisperClient(api_key, base_url)
+        try:
+            return await client.whisper(content, params, wait_timeout)
+        finally:
+            await client.close()
+
+    return asyncio.run(run())
+
+def test_whisper_polls_until_the_text_is_processed(whisper_stub):
+    with open(PDF_PATH, "rb") as f:
+        content = f.read()
+    text = whisper(whisper_stub, content, {"mode": "form", "page_seperator": "<<<"})
+    pages = split_pages(text)
+    assert len(pages) == len(PdfReader(PDF_PATH).pages)
+    assert any(page.strip() for page in pages)
+
+def test_whisper_streams_a_file_object_and_honours_the_page_selection(whisper_stub):
+    with open(PDF_PATH, "rb") as f:
+        content = f.read()
+    text = whisper(whisper_stub, io.BytesIO(content), {"pages_to_extract": "1", "page_seperator": "<<<"})
+    assert len(split_pages(text)) == 1
+
+def test_whisper_raises_on_a_rejected_request(whisper_stub):
+    with pytest.raises(WhisperError) as error:
+        whisper(whisper_stub, b"not a pdf", {})
+    assert error.value.status_code == 400
+
+def test_whisper_gives_up_after_the_wait_timeout(whisper_stub):
+    with open(PDF_PATH, "rb") as f:
+        content = f.read()
+    with pytest.raises(WhisperError, match="timed out"):
+        whisper(whisper_stub, content, {}, wait_timeout=0.1)
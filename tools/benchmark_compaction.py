@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Measure prompt token savings of OCR text compaction on the text stored in the
+database, and optionally compare extraction validity with and without it
+(needs OPENAI_API_KEY).
+
+Usage:
+    python -m tools.benchmark_compaction [--db invoice_data.db] [--limit 50] [--extract]
+"""
+
+import asyncio
+import sqlite3
+import argparse
+from typing import Dict, List, Optional
+from termcolor import colored
+from src.core.db.database import DATABASE_FILE
+from src.core.extractors.text_compaction import compact_text, count_tokens, tiktoken
+from src.core.extractors.invoice_extractor import extract_invoice_details
+
+# Fields compared between the raw and compacted extractions
+KEY_FIELDS = ['invoice_number', 'invoice_date', 'amount_payable']
+
+def load_texts(db_path: str, limit: int) -> List[Dict]:
+    """Load stored text content, newest first"""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute(
+        "SELECT filename, text_content FROM processed_files "
+        "WHERE COALESCE(text_content, '') != '' ORDER BY id DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
+async def extract(text: str, filename: str, compact: bool) -> Optional[Dict]:
+    """Run the extraction, None if it failed"""
+    try:
+        return await extract_invoice_details(text, filename, compact=compact)
+    except Exception as e:
+        print(colored(f"  Extraction failed for {filename}: {str(e)}", "yellow"))
+        return None
+
+def is_valid(result: Optional[Dict]) -> bool:
+    """Check that an extraction exists and passed validation"""
+    return bool(result) and not result.get('error_handling', {}).get('has_errors', False)
+
+def key_fields(result: Optional[Dict]) -> Dict:
+    """Pick the fields compared between runs"""
+    return {field: (result or {}).get(field) for field in KEY_FIELDS}
+
+async def main():
+    parser = argparse.ArgumentParser(description="Measure token savings of OCR text compaction")
+    parser.add_argument("--db", default=DATABASE_FILE, help="Path to the SQLite database")
+    parser.add_argument("--limit", type=int, default=50, help="Number of stored texts to use")
+    parser.add_argument("--extract", action="store_true", help="Also compare LLM extraction validity")
+    args = parser.parse_args()
+
+    rows = load_texts(args.db, args.limit)
+    if not rows:
+        raise SystemExit(f"No stored text content in {args.db}")
+    if tiktoken is None:
+        print(colored("tiktoken is not installed, token counts are estimated from characters", "yellow"))
+
+    total_before = total_after = 0
+    for row in rows:
+        before = count_tokens(row['text_content'])
+        if before == 0:
+            # Too short to count, the estimate without tiktoken rounds it down to nothing
+            print(colored(f"{row['filename']:<40} skipped, no tokens", "yellow"))
+            continue
+        after = count_tokens(compact_text(row['text_content']))
+        total_before += before
+        total_after += after
+        print(f"{row['filename']:<40} {before:>7} → {after:>7} tokens ({1 - after / before:.0%} saved)")
+    if total_before:
+        print(colored(f"Total: {total_before} → {total_after} tokens ({1 - total_after / total_before:.0%} saved)", "green"))
+
+    if args.extract:
+        raw = await asyncio.gather(*(extract(row['text_content'], row['filename'], False) for row in rows))
+        compacted = await asyncio.gather(*(extract(row['text_content'], row['filename'], True) for row in rows))
+        same = sum(key_fields(a) == key_fields(b) for a, b in zip(raw, compacted))
+        print(colored(f"Valid extractions: raw {sum(map(is_valid, raw))}/{len(rows)}, "
+                      f"compacted {sum(map(is_valid, compacted))}/{len(rows)}", "green"))
+        print(colored(f"Same {', '.join(KEY_FIELDS)}: {same}/{len(rows)}", "green"))
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Compare OCR backends on a folder of PDFs: latency per file, throughput with
+concurrent files, and optionally whether the extracted text leads to a valid
+invoice extraction downstream (needs OPENAI_API_KEY).
+
+Usage:
+    python -m tools.benchmark_ocr [--pdfs data/pdfs] [--backends auto,text_layer,llmwhisperer,tesseract]
+                                  [--repeat 3] [--concurrency 8] [--extract]
+"""
+
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from typing import Dict, List
+from termcolor import colored
+from src.core.extractors.pdf_extractor import AUTO_POLICY, OCR_POLICIES, process_pdf
+from src.core.extractors.ocr_backends import get_backend
+from src.core.extractors.whisper_client import close_whisper_client
+from src.core.extractors.invoice_extractor import extract_invoice_details
+
+async def timed_ocr(data: bytes, filename: str, backend: str) -> Dict:
+    """OCR one file, recording its latency and outcome"""
+    start = time.perf_counter()
+    try:
+        text = await process_pdf(data, filename, ocr_backend=backend)
+        return {'filename': filename, 'seconds': time.perf_counter() - start, 'text': text, 'error': None}
+    except Exception as e:
+        return {'filename': filename, 'seconds': time.perf_counter() - start, 'text': None, 'error': str(e)}
+
+async def check_extraction(text: str, filename: str) -> bool:
+    """Run the LLM extraction on OCR output and report if it passed validation"""
+    try:
+        result = await extract_invoice_details(text, filename)
+        return not result.get('error_handling', {}).get('has_errors', False)
+    except Exception as e:
+        print(colored(f"  Extraction failed for {filename}: {str(e)}", "yellow"))
+        return False
+
+async def benchmark(backend: str, files: List[Path], repeat: int, concurrency: int, extract: bool) -> Dict:
+    """Measure one backend on all files"""
+    documents = [(path.name, path.read_bytes()) for path in files]
+
+    # Latency: one file at a time
+    latency_runs = [await timed_ocr(data, name, backend) for name, data in documents]
+
+    # Throughput: all files, repeated, with bounded concurrency
+    sem = asyncio.Semaphore(concurrency)
+
+    async def bounded(name: str, data: bytes) -> Dict:
+        async with sem:
+            return await timed_ocr(data, name, backend)
+
+    start = time.perf_counter()
+    throughput_runs = await asyncio.gather(*(bounded(name, data) for _ in range(repeat) for name, data in documents))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(run['seconds'] for run in latency_runs if not run['error'])
+    ok = [run for run in latency_runs if not run['error']]
+    row = {
+        'backend': backend,
+        'ok': f"{len(ok)}/{len(latency_runs)}",
+        'p50_s': statistics.median(latencies) if latencies else None,
+        'max_s': latencies[-1] if latencies else None,
+        'files_per_s': sum(1 for run in throughput_runs if not run['error']) / elapsed,
+        'chars': sum(len(run['text']) for run in ok),
+        'valid': None,
+    }
+    for run in latency_runs:
+        if run['error']:
+            print(colored(f"  {backend} failed on {run['filename']}: {run['error']}", "yellow"))
+
+    if extract and ok:
+        checks = await asyncio.gather(*(check_extraction(run['text'], run['filename']) for run in ok))
+        row['valid'] = f"{sum(checks)}/{len(checks)}"
+    return row
+
+def print_table(rows: List[Dict]):
+    """Print the results as an aligned table"""
+    columns = ['backend', 'ok', 'p50_s', 'max_s', 'files_per_s', 'chars', 'valid']
+    cells = [[
+        f"{row[column]:.2f}" if isinstance(row[column], float) else str(row[column] if row[column] is not None else "-")
+        for column in columns
+    ] for row in rows]
+    widths = [max(len(column), *(len(line[i]) for line in cells)) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)))
+
+async def main():
+    parser = argparse.ArgumentParser(description="Compare OCR backends on a folder of PDFs")
+    parser.add_argument("--pdfs", default="data/pdfs", help="Folder with PDF files")
+    parser.add_argument("--backends", default=",".join(OCR_POLICIES), help="Comma separated policies or backends")
+    parser.add_argument("--repeat", type=int, default=3, help="Times each file is processed in the throughput run")
+    parser.add_argument("--concurrency", type=int, default=8, help="Files processed at the same time in the throughput run")
+    parser.add_argument("--extract", action="store_true", help="Also run the LLM extraction and count valid results")
+    args = parser.parse_args()
+
+    files = sorted(Path(args.pdfs).glob("*.pdf"))
+    if not files:
+        raise SystemExit(f"No PDF files found in {args.pdfs}")
+
+    rows = []
+    for backend in args.backends.split(","):
+        if backend != AUTO_POLICY and not get_backend(backend).available():
+            print(colored(f"Skipping {backend}: not available in this environment", "yellow"))
+            continue
+        print(colored(f"→ Benchmarking {backend} on {len(files)} files", "cyan"))
+        rows.append(await benchmark(backend, files, args.repeat, args.concurrency, args.extract))
+
+    await close_whisper_client()
+    print_table(rows)
+
+if __name__ == "__main__":
+    asyncio.run(main())
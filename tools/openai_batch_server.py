@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI Files, Batches and Chat Completions APIs, for
+running the batch backfill (and the real-time extraction) without the real service
+
+Serves /v1/files, /v1/batches and /v1/chat/completions. Batches complete
+OPENAI_STUB_DELAY seconds after they are created. Every chat completion request
+is answered with an InvoiceDetail tool call filled in from the invoice text with
+simple patterns: good enough to exercise parsing, validation and storage, not
+to judge extraction quality. Usage reports the system prompt as cached from the
+second request on, like OpenAI's automatic prompt caching.
+
+Models listed in OPENAI_STUB_INVALID_MODELS answer with a method of payment
+InvoiceDetail rejects. OPENAI_STUB_LATENCY and OPENAI_STUB_MAX_IN_FLIGHT make
+chat completions slow and rate limited, with x-ratelimit headers, to watch the
+concurrency limiter adapt.
+
+Usage:
+    python -m tools.openai_batch_server
+    export OPENAI_BASE_URL=http://127.0.0.1:8082/v1
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import uuid
+import hashlib
+from datetime import date
+from decimal import Decimal
+from typing import Dict
+import uvicorn
+from fastapi import FastAPI, File, Form, Request, UploadFile, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from src.core.extractors.invoice_segments import page_invoice_number
+
+# Constants
+PORT = int(os.getenv("OPENAI_STUB_PORT", "8082"))
+PROCESSING_DELAY = float(os.getenv("OPENAI_STUB_DELAY", "2"))
+# Seconds each chat completion takes, and the completions served at once before answering 429
+CHAT_LATENCY = float(os.getenv("OPENAI_STUB_LATENCY", "0"))
+MAX_IN_FLIGHT = int(os.getenv("OPENAI_STUB_MAX_IN_FLIGHT", "0"))
+# Models that answer with a tool call InvoiceDetail rejects, to exercise the model cascade
+INVALID_MODELS = [model for model in os.getenv("OPENAI_STUB_INVALID_MODELS", "").split(",") if model]
+CHARS_PER_TOKEN = 4
+# OpenAI caches prompt prefixes of at least 1024 tokens, in steps of 128
+CACHE_MIN_TOKENS = 1024
+CACHE_STEP_TOKENS = 128
+DUTCH_MONTHS = {
+    "januari": 1, "februari": 2, "maart": 3, "april": 4, "mei": 5, "juni": 6,
+    "juli": 7, "augustus": 8, "september": 9, "oktober": 10, "november": 11, "december": 12,
+}
+AMOUNT_PATTERN = re.compile(r"(?<![\d.,])(\d{1,3}(?:\.\d{3})+,\d{2}|\d+,\d{2}|\d+\.\d{2})(?![\d.,]*\d)")
+NUMERIC_DATE_PATTERN = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b")
+WRITTEN_DATE_PATTERN = re.compile(r"\b(\d{1,2})\s+(" + "|".join(DUTCH_MONTHS) + r")\s+(\d{4})\b", re.IGNORECASE)
+
+app = FastAPI(title="OpenAI stand-in")
+
+# file id -> {"filename", "purpose", "content", "created_at"}
+files: Dict[str, Dict] = {}
+# batch id -> batch object, plus "ready_at"
+batches: Dict[str, Dict] = {}
+# Hashes of system prompts seen before, to report them as cached
+seen_prefixes = set()
+in_flight = 0
+
+def parse_amount(text: str) -> Decimal:
+    """Parse 1.234,56 or 1234.56"""
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    return Decimal(text)
+
+def find_date(text: str) -> str:
+    """Find the first date in the text as YYYY-MM-DD"""
+    match = NUMERIC_DATE_PATTERN.search(text)
+    if match:
+        day, month, year = map(int, match.groups())
+        return date(year, month, day).isoformat()
+    match = WRITTEN_DATE_PATTERN.search(text)
+    if match:
+        day, month, year = match.groups()
+        return date(int(year), DUTCH_MONTHS[month.lower()], int(day)).isoformat()
+    return date.today().isoformat()
+
+def fake_invoice(text: str) -> Dict:
+    """Fill in the InvoiceDetail fields from the invoice text with simple patterns"""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    amounts = [(parse_amount(match.group(1)), line) for line in lines for match in AMOUNT_PATTERN.finditer(line)]
+    amount, citation = max(amounts, default=(Decimal("0.00"), "0,00"))
+    return {
+        "invoice_date": find_date(text),
+        "due_date": None,
+        "invoice_number": page_invoice_number(text) or "UNKNOWN",
+        "currency": "EUR",
+        "suppliers": [{}],
+        "recipient": "Louisiana Lobstershack BV",
+        "method_of_payment": "Incasso" if "incasso" in text.lower() else "Diversen",
+        "primary_supplier": lines[0][:80] if lines else "Unknown",
+        "details_supplier": {},
+        "amount_payable_citation": citation,
+        "amount_payable": str(amount),
+    }
+
+def chat_completion(body: Dict) -> Dict:
+    """Answer a chat completion request with a tool call"""
+    messages = body.get("messages", [])
+    invoice_text = messages[-1]["content"].split("Here is the invoice:\n", 1)[-1] if messages else ""
+    tool_name = (body.get("tool_choice") or {}).get("function", {}).get("name", "InvoiceDetail")
+
+    prompt_tokens = sum(len(message.get("content") or "") for message in messages) // CHARS_PER_TOKEN
+    system = messages[0].get("content", "") if messages and messages[0].get("role") == "system" else ""
+    prefix_tokens = (len(system) + len(json.dumps(body.get("tools", [])))) // CHARS_PER_TOKEN
+    prefix_hash = hashlib.sha256((system + json.dumps(body.get("tools", []))).encode()).hexdigest()
+    cached_tokens = 0
+    if prefix_hash in seen_prefixes and prefix_tokens >= CACHE_MIN_TOKENS:
+        cached_tokens = prefix_tokens // CACHE_STEP_TOKENS * CACHE_STEP_TOKENS
+    seen_prefixes.add(prefix_hash)
+
+    invoice = fake_invoice(invoice_text)
+    if body.get("model") in INVALID_MODELS:
+        invoice["method_of_payment"] = "Contant"
+    arguments = json.dumps(invoice)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": tool_name, "arguments": arguments},
+                }],
+            },
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens + prefix_tokens,
+            "completion_tokens": len(arguments) // CHARS_PER_TOKEN,
+            "total_tokens": prompt_tokens + prefix_tokens + len(arguments) // CHARS_PER_TOKEN,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        },
+    }
+
+def file_object(file_id: str) -> Dict:
+    stored = files[file_id]
+    return {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(stored["content"]),
+        "created_at": stored["created_at"],
+        "filename": stored["filename"],
+        "purpose": stored["purpose"],
+        "status": "processed",
+    }
+
+def add_file(filename: str, purpose: str, content: bytes) -> str:
+    file_id = f"file-{uuid.uuid4().hex}"
+    files[file_id] = {"filename": filename, "purpose": purpose, "content": content, "created_at": int(time.time())}
+    return file_id
+
+def run_batch(batch: Dict):
+    """Answer every request of a batch and write the output file"""
+    output, errors = [], []
+    for line in files[batch["input_file_id"]]["content"].decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        if request.get("url") != batch["endpoint"]:
+            errors.append({"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request.get("custom_id"),
+                           "response": None, "error": {"code": "invalid_url", "message": "URL does not match the batch endpoint"}})
+            continue
+        output.append({
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": chat_completion(request["body"])},
+            "error": None,
+        })
+    batch["output_file_id"] = add_file("batch_output.jsonl", "batch_output",
+                                       "".join(json.dumps(line) + "\n" for line in output).encode())
+    if errors:
+        batch["error_file_id"] = add_file("batch_errors.jsonl", "batch_output",
+                                          "".join(json.dumps(line) + "\n" for line in errors).encode())
+    batch["request_counts"] = {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)}
+    batch["status"] = "completed"
+    batch["completed_at"] = int(time.time())
+
+def batch_object(batch_id: str) -> Dict:
+    batch = batches.get(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="No such batch")
+    if batch["status"] == "in_progress" and time.monotonic() >= batch["ready_at"]:
+        run_batch(batch)
+    return {key: value for key, value in batch.items() if key != "ready_at"}
+
+@app.post("/v1/files")
+async def create_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    file_id = add_file(file.filename, purpose, await file.read())
+    return file_object(file_id)
+
+@app.get("/v1/files/{file_id}")
+async def retrieve_file(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="No such file")
+    return file_object(file_id)
+
+@app.get("/v1/files/{file_id}/content")
+async def file_content(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="No such file")
+    return PlainTextResponse(files[file_id]["content"].decode("utf-8"))
+
+@app.post("/v1/batches")
+async def create_batch(request: Request):
+    body = await request.json()
+    if body.get("input_file_id") not in files:
+        raise HTTPException(status_code=400, detail="No such input file")
+    batch_id = f"batch_{uuid.uuid4().hex}"
+    batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": body["endpoint"],
+        "input_file_id": body["input_file_id"],
+        "completion_window": body["completion_window"],
+        "status": "in_progress",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": int(time.time()),
+        "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        "metadata": body.get("metadata"),
+        "ready_at": time.monotonic() + PROCESSING_DELAY,
+    }
+    return batch_object(batch_id)
+
+@app.get("/v1/batches/{batch_id}")
+async def retrieve_batch(batch_id: str):
+    return batch_object(batch_id)
+
+@app.post("/v1/chat/completions")
+async def create_chat_completion(request: Request):
+    global in_flight
+    body = await request.json()
+    remaining = max(MAX_IN_FLIGHT - in_flight - 1, 0) if MAX_IN_FLIGHT else 1
+    headers = {"x-ratelimit-limit-requests": str(MAX_IN_FLIGHT), "x-ratelimit-remaining-requests": str(remaining)} if MAX_IN_FLIGHT else {}
+    if MAX_IN_FLIGHT and in_flight >= MAX_IN_FLIGHT:
+        return JSONResponse(status_code=429, headers={**headers, "retry-after": "0.1"},
+                            content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}})
+    in_flight += 1
+    try:
+        await asyncio.sleep(CHAT_LATENCY)
+        return JSONResponse(chat_completion(body), headers=headers)
+    finally:
+        in_flight -= 1
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=PORT)
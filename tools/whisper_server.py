@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the LLMWhisperer v2 API, for testing OCR without the real service
+
+Serves /whisper, /whisper-status and /whisper-retrieve under /api/v2. Jobs are
+"processed" after WHISPER_STUB_DELAY seconds and return the embedded text layer
+of the uploaded PDF, honouring pages_to_extract and page_seperator.
+
+Usage:
+    python -m tools.whisper_server
+    export LLMWHISPERER_BASE_URL_V2=http://127.0.0.1:8081/api/v2
+"""
+
+import os
+import time
+import uuid
+import hashlib
+from functools import lru_cache
+from typing import Dict, List
+import uvicorn
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse
+from src.core.extractors.text_layer import extract_text_layer
+
+# Constants
+PORT = int(os.getenv("WHISPER_STUB_PORT", "8081"))
+PROCESSING_DELAY = float(os.getenv("WHISPER_STUB_DELAY", "2"))
+
+app = FastAPI(title="LLMWhisperer stand-in")
+
+# whisper_hash -> job
+jobs: Dict[str, Dict] = {}
+
+def parse_pages(pages_to_extract: str, page_count: int) -> List[int]:
+    """Turn a 1-based page list such as "1,3-5" into zero-based indexes"""
+    if not pages_to_extract:
+        return list(range(page_count))
+    pages = []
+    for part in pages_to_extract.split(","):
+        start, _, end = part.partition("-")
+        pages.extend(range(int(start) - 1, int(end or start)))
+    return [page for page in pages if page < page_count]
+
+@lru_cache(maxsize=64)
+def read_pages(body_hash: str, body: bytes) -> List[str]:
+    """Extract the text layer once per distinct upload"""
+    return extract_text_layer(body)
+
+def check_key(request: Request):
+    """Reject requests without an API key header, like the real service"""
+    if not request.headers.get("unstract-key"):
+        raise HTTPException(status_code=401, detail="Missing unstract-key header")
+
+@app.post("/api/v2/whisper")
+async def whisper(request: Request):
+    check_key(request)
+    body = await request.body()
+    try:
+        pages = read_pages(hashlib.sha256(body).hexdigest(), body)
+    except Exception as e:
+        return JSONResponse(status_code=400, content={"message": f"Unable to read PDF: {str(e)}"})
+
+    params = request.query_params
+    selected = parse_pages(params.get("pages_to_extract", ""), len(pages))
+    separator = params.get("page_seperator", "<<<")
+    text = "".join(f"{pages[page]}\n{separator}\n" for page in selected)
+
+    whisper_hash = uuid.uuid4().hex
+    jobs[whisper_hash] = {"ready_at": time.monotonic() + PROCESSING_DELAY, "result_text": text}
+    return JSONResponse(status_code=202, content={
+        "message": "Whisper Job Accepted",
+        "status": "processing",
+        "whisper_hash": whisper_hash,
+    })
+
+@app.get("/api/v2/whisper-status")
+async def whisper_status(request: Request, whisper_hash: str):
+    check_key(request)
+    job = jobs.get(whisper_hash)
+    if not job:
+        return JSONResponse(status_code=400, content={"message": "Record not found"})
+    status = "processed" if time.monotonic() >= job["ready_at"] else "processing"
+    return {"status": status, "message": "Whisper status"}
+
+@app.get("/api/v2/whisper-retrieve")
+async def whisper_retrieve(request: Request, whisper_hash: str):
+    check_key(request)
+    job = jobs.get(whisper_hash)
+    if not job or time.monotonic() < job["ready_at"]:
+        return JSONResponse(status_code=400, content={"message": "Result not available"})
+    return {
+        "result_text": job["result_text"],
+        "confidence_metadata": [],
+        "metadata": {},
+        "webhook_metadata": "",
+    }
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=PORT)